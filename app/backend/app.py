@@ -36,16 +36,35 @@ def create_app(config_name=None):
     register_error_handlers(app)
     register_teardown_handlers(app)
 
-    # Warm-load intent routing model at startup to reduce first-request latency.
-    try:
-        from app.backend.services.intent_classifier import warm_load_intent_classifier
-        ok = warm_load_intent_classifier()
-        if ok:
-            logger.info("[Startup] Intent classifier warm-loaded successfully")
-        else:
-            logger.warning("[Startup] Intent classifier warm-load failed; using toggles-only fallback until available")
-    except Exception as e:
-        logger.warning(f"[Startup] Intent classifier warm-load error: {e}")
+    # Query tracing: pipeline histograms on /metrics from the start, slow-query log file
+    from app.backend.services.tracing import setup_tracing
+    setup_tracing()
+
+    # Warm every model (embedder, classification index, reranker, intent classifier)
+    # in parallel so the first request does not pay for lazy loading; see /api/ready.
+    # Under gunicorn --preload this runs in the master, blocking, before the fork.
+    preload = app.config.get('PRELOAD_MODELS', False)
+    if app.config.get('WARMUP_ENABLED', True) or preload:
+        try:
+            from app.backend.services.warmup import start_warmup
+            if preload:
+                from app.backend.services.prefork import prepare_master
+                prepare_master()
+            start_warmup(
+                block=preload or app.config.get('WARMUP_BLOCKING', False),
+                timeout=app.config.get('WARMUP_TIMEOUT_S'),
+            )
+        except Exception as e:
+            logger.warning(f"[Startup] Model warm-up failed to start; models will load on first use: {e}")
+
+    # Background ingestion workers (job state lives in Postgres, see ingestion_jobs table).
+    # With preloading they are started in each forked worker instead (prefork.init_worker).
+    if app.config.get('INGESTION_WORKERS_ENABLED', True) and not preload:
+        try:
+            from app.backend.services.ingestion_jobs import start_ingestion_workers
+            start_ingestion_workers()
+        except Exception as e:
+            logger.warning(f"[Startup] Ingestion workers failed to start; uploads will queue until restart: {e}")
 
     # ── Frontend ──────────────────────────────────────────────────
     @app.route('/')
@@ -85,6 +104,45 @@ def create_app(config_name=None):
     def health():
         return jsonify({'status': 'healthy', 'service': 'rag-backend'}), 200
 
+    # ── Readiness (models warm) ───────────────────────────────────
+    @app.route('/api/ready')
+    def ready():
+        from app.backend.services.warmup import readiness
+        body = readiness()
+        return jsonify(body), 200 if body['ready'] else 503
+
+    # ── Cache Stats ───────────────────────────────────────────────
+    @app.route('/api/cache/stats')
+    def cache_stats():
+        from app.backend.services.answer_cache import get_answer_cache_stats
+        from app.backend.services.embedding_cache import get_embedding_cache_stats
+        from app.backend.services.intent_classifier import get_intent_cache_stats
+        from app.backend.services.reranking import get_rerank_cache_stats
+        return jsonify({
+            'embedding_cache': get_embedding_cache_stats(),
+            'intent_cache': get_intent_cache_stats(),
+            'rerank_cache': get_rerank_cache_stats(),
+            'answer_cache': get_answer_cache_stats(),
+        }), 200
+
+    # ── Inference Stats ───────────────────────────────────────────
+    @app.route('/api/inference/stats')
+    def inference_stats():
+        from app.backend.services.intent_classifier import get_intent_batcher_stats
+        from app.backend.services.llm_client import get_llm_client_stats
+        from app.backend.services.reranking import get_rerank_batcher_stats
+        return jsonify({
+            'intent_batcher': get_intent_batcher_stats(),
+            'rerank_batcher': get_rerank_batcher_stats(),
+            'llm_client': get_llm_client_stats(),
+        }), 200
+
+    # ── Prometheus Metrics ────────────────────────────────────────
+    @app.route('/metrics')
+    def prometheus_metrics():
+        from app.backend.services.metrics import render_prometheus
+        return app.response_class(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
     # ── Client Config ─────────────────────────────────────────────
     @app.route('/api/config/client')
     def client_config():
@@ -18,6 +18,13 @@ class Config:
     # Thresholds from model config.json
     INTENT_THRESHOLD_WEB = 0.35
     INTENT_THRESHOLD_DIAGRAM = 0.6
+    # Label scores cached by normalized question text (thresholds are applied on read)
+    INTENT_CACHE_SIZE = int(os.getenv('INTENT_CACHE_SIZE', '2048'))
+    # Micro-batching: concurrent cache misses share one forward pass
+    INTENT_BATCHING_ENABLED  = os.getenv('INTENT_BATCHING_ENABLED', '1') not in {'0', 'false', 'False'}
+    INTENT_BATCH_MAX_SIZE    = int(os.getenv('INTENT_BATCH_MAX_SIZE', '16'))
+    INTENT_BATCH_MAX_WAIT_MS = float(os.getenv('INTENT_BATCH_MAX_WAIT_MS', '5'))
+    INTENT_BATCH_TIMEOUT_S   = 10.0
 
     #allowlist for web search
     #Reject non-HTTPS URLs (if WEB_REQUIRE_HTTPS).
@@ -104,20 +111,112 @@ class Config:
     UPLOAD_FOLDER       = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'uploads')
     MAX_CONTENT_LENGTH  = 100 * 1024 * 1024  # 100 MB max file size
     ALLOWED_EXTENSIONS  = {'pdf', 'docx', 'pptx', 'txt'}
+
+    # Chunk storage: 'copy' (PostgreSQL COPY), 'insert' (batched multi-row INSERT) or 'orm'
+    CHUNK_INSERT_METHOD     = os.getenv('CHUNK_INSERT_METHOD', 'copy')
+    CHUNK_INSERT_BATCH_SIZE = 1000
+
+    # Background Ingestion Jobs
+    # Uploads are queued in the ingestion_jobs table and processed by a worker pool,
+    # so job state survives a process restart.
+    INGESTION_WORKERS_ENABLED       = os.getenv('INGESTION_WORKERS_ENABLED', '1') not in {'0', 'false', 'False'}
+    INGESTION_WORKERS               = int(os.getenv('INGESTION_WORKERS', '2'))
+    INGESTION_JOB_POLL_INTERVAL_S   = 2.0    # How often idle workers check for queued jobs
+    INGESTION_JOB_STALE_AFTER_S     = 300    # Running jobs without a heartbeat this long are requeued
+    INGESTION_JOB_MAX_ATTEMPTS      = 3      # Give up (status=failed) after this many attempts
+
+    # Batch upload: files are loaded/cleaned in a process pool (0 = one process per CPU)
+    INGESTION_LOADER_PROCESSES = int(os.getenv('INGESTION_LOADER_PROCESSES', '0'))
+    MAX_BATCH_UPLOAD_FILES     = int(os.getenv('MAX_BATCH_UPLOAD_FILES', '20'))
+
+    # Streaming ingestion: large PDFs are chunked/embedded/stored in page batches
+    # 'auto' (PDFs with >= INGESTION_STREAMING_MIN_PAGES pages), 'always' (all PDFs) or 'never'
+    INGESTION_STREAMING_MODE      = os.getenv('INGESTION_STREAMING_MODE', 'auto')
+    INGESTION_STREAMING_MIN_PAGES = int(os.getenv('INGESTION_STREAMING_MIN_PAGES', '150'))
+    INGESTION_STREAM_PAGE_BATCH   = int(os.getenv('INGESTION_STREAM_PAGE_BATCH', '24'))
     
     # Embedding Configuration - MULTILINGUAL MODEL
     # Changed from all-MiniLM-L6-v2 (English-only) to support Chinese/English cross-lingual retrieval
     EMBEDDING_MODEL     = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
     EMBEDDING_DIMENSION = 384
+    EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '0'))  # 0 = scale with CPU count
+    # Embed multi-unit chunks as the length-weighted mean of their unit vectors instead of
+    # re-encoding the chunk text (faster ingestion, approximate vectors)
+    INGESTION_POOLED_CHUNK_EMBEDDINGS = os.getenv('INGESTION_POOLED_CHUNK_EMBEDDINGS', '0') in {'1', 'true', 'True'}
+
+    # Adaptive chunking: exact semantic chunking while its predicted embedding time fits
+    # the budget, sampled semantic chunking above that, recursive splitting as last resort
+    SEMANTIC_CHUNKING_BUDGET_S   = float(os.getenv('SEMANTIC_CHUNKING_BUDGET_S', '60'))
+    CHUNKING_DEFAULT_UNITS_PER_S = 150.0  # encoder throughput assumed until one is measured
+    CHUNKING_REFINE_FRACTION     = 0.4    # share of the budget spent refining topic-shift gaps
+    CHUNKING_MAX_SAMPLE_STRIDE   = 8
+
+    # Embedding cache: in-process LRU backed by the embedding_cache table,
+    # keyed by (EMBEDDING_MODEL, sha256 of whitespace-normalized text)
+    EMBEDDING_CACHE_ENABLED  = os.getenv('EMBEDDING_CACHE_ENABLED', '1') not in {'0', 'false', 'False'}
+    EMBEDDING_CACHE_LRU_SIZE = int(os.getenv('EMBEDDING_CACHE_LRU_SIZE', '4096'))
+    EMBEDDING_CACHE_PERSIST  = os.getenv('EMBEDDING_CACHE_PERSIST', '1') not in {'0', 'false', 'False'}
+    # Postgres tier retention: rows unused for TTL_DAYS go, then the least recently used
+    # beyond MAX_ROWS; pruned by the background writer every PRUNE_INTERVAL_S
+    EMBEDDING_CACHE_TTL_DAYS         = float(os.getenv('EMBEDDING_CACHE_TTL_DAYS', '30'))
+    EMBEDDING_CACHE_MAX_ROWS         = int(os.getenv('EMBEDDING_CACHE_MAX_ROWS', '500000'))
+    EMBEDDING_CACHE_PRUNE_INTERVAL_S = float(os.getenv('EMBEDDING_CACHE_PRUNE_INTERVAL_S', '3600'))
+    EMBEDDING_CACHE_WRITE_QUEUE      = int(os.getenv('EMBEDDING_CACHE_WRITE_QUEUE', '256'))  # pending write batches
+
+    # Inference backends: 'torch' (FP32 PyTorch) or 'onnx' (dynamic INT8 ONNX Runtime, CPU).
+    # ONNX models are exported on first use into ONNX_MODEL_DIR and checked against FP32;
+    # a model that fails the check stays on PyTorch (ONNX_FALLBACK_ON_ACCURACY_FAIL)
+    INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'torch')
+    EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', INFERENCE_BACKEND)
+    RERANK_BACKEND    = os.getenv('RERANK_BACKEND', INFERENCE_BACKEND)
+    INTENT_BACKEND    = os.getenv('INTENT_BACKEND', INFERENCE_BACKEND)
+    ONNX_MODEL_DIR    = os.getenv('ONNX_MODEL_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'cache', 'onnx'))
+    ONNX_INTRA_OP_THREADS     = int(os.getenv('ONNX_INTRA_OP_THREADS', '0'))  # 0 = onnxruntime default
+    ONNX_EMBEDDING_MAX_LENGTH = 128     # sentence-transformers max_seq_length of EMBEDDING_MODEL
+    ONNX_MIN_EMBEDDING_COSINE = 0.99    # min cosine(FP32, INT8) over the check sentences
+    ONNX_MIN_RANK_CORRELATION = 0.95    # min Spearman of reranker scores
+    ONNX_MAX_PROB_DRIFT       = 0.05    # max |FP32 - INT8| intent probability
+    ONNX_FALLBACK_ON_ACCURACY_FAIL = os.getenv('ONNX_FALLBACK_ON_ACCURACY_FAIL', '1') not in {'0', 'false', 'False'}
+
+    # Startup warm-up: load every model in parallel and run one dummy inference each;
+    # /api/ready answers 503 until it is done. WARMUP_BLOCKING makes create_app wait for it
+    WARMUP_ENABLED   = os.getenv('WARMUP_ENABLED', '1') not in {'0', 'false', 'False'}
+    WARMUP_BLOCKING  = os.getenv('WARMUP_BLOCKING', '0') in {'1', 'true', 'True'}
+    WARMUP_TIMEOUT_S = float(os.getenv('WARMUP_TIMEOUT_S', '600'))
+
+    # gunicorn --preload (gunicorn.conf.py sets PRELOAD_MODELS=1): the master loads every
+    # model before forking so workers share the weights copy-on-write
+    PRELOAD_MODELS           = os.getenv('PRELOAD_MODELS', '0') in {'1', 'true', 'True'}
+    TORCH_THREADS_PER_WORKER = int(os.getenv('TORCH_THREADS_PER_WORKER', '0'))  # 0 = CPUs / workers
     
     # LLM Configuration
     LLM_MODEL       = 'gemini-2.5-flash'  # Updated to available model (was gemini-1.5-pro)
     LLM_TEMPERATURE = 0.7
     MAX_TOKENS      = 2048
+    # LLM client backend: 'gemini', or 'fake' (deterministic local answers, no network)
+    LLM_BACKEND            = os.getenv('LLM_BACKEND', 'gemini')
+    LLM_MODEL_CACHE_SIZE   = int(os.getenv('LLM_MODEL_CACHE_SIZE', '32'))     # GenerativeModel handles per (model, config)
+    # Scheduler for outbound LLM calls (services/llm_scheduler.py), limits per model
+    LLM_SCHEDULER_ENABLED        = os.getenv('LLM_SCHEDULER_ENABLED', '1') not in {'0', 'false', 'False'}
+    LLM_RATE_LIMIT_RPM           = float(os.getenv('LLM_RATE_LIMIT_RPM', '600'))   # 0 = no rate limit
+    LLM_RATE_LIMIT_BURST         = int(os.getenv('LLM_RATE_LIMIT_BURST', '20'))
+    LLM_MAX_CONCURRENT           = int(os.getenv('LLM_MAX_CONCURRENT', '16'))      # in flight per process
+    LLM_QUEUE_TIMEOUT_S          = float(os.getenv('LLM_QUEUE_TIMEOUT_S', '30'))   # answers, quizzes, classification
+    LLM_OPTIONAL_QUEUE_TIMEOUT_S = float(os.getenv('LLM_OPTIONAL_QUEUE_TIMEOUT_S', '2'))  # rewrite.*, tool.*
+    LLM_FAKE_LATENCY_MS    = float(os.getenv('LLM_FAKE_LATENCY_MS', '300'))   # time to first token
+    LLM_FAKE_TOKENS_PER_S  = float(os.getenv('LLM_FAKE_TOKENS_PER_S', '50'))
+    LLM_FAKE_ANSWER_TOKENS = int(os.getenv('LLM_FAKE_ANSWER_TOKENS', '120'))
     
     # Cross-Encoder Configuration (for reranking) - MULTILINGUAL MODEL
     # Changed from ms-marco-MiniLM (English-only) to support multilingual reranking
     RERANK_MODEL = 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1'
+    # Dynamic batching: pairs from concurrent requests share cross-encoder calls
+    RERANK_BATCHING_ENABLED       = os.getenv('RERANK_BATCHING_ENABLED', '1') not in {'0', 'false', 'False'}
+    RERANK_BATCH_MAX_PAIRS        = int(os.getenv('RERANK_BATCH_MAX_PAIRS', '64'))
+    RERANK_BATCH_MAX_WAIT_MS      = float(os.getenv('RERANK_BATCH_MAX_WAIT_MS', '10'))
+    RERANK_MAX_CONCURRENT_BATCHES = int(os.getenv('RERANK_MAX_CONCURRENT_BATCHES', '2'))  # model calls in flight
+    RERANK_BATCH_TIMEOUT_S        = 30.0
+    RERANK_SCORE_CACHE_SIZE       = int(os.getenv('RERANK_SCORE_CACHE_SIZE', '20000'))  # 0 disables cross-request cache
     
     # RAG Configuration
     TOP_K_RETRIEVAL = 10  # Number of chunks to retrieve initially
@@ -127,6 +226,34 @@ class Config:
     MAX_CONVERSATION_HISTORY = 10  # Last N messages to include in context
     WORKING_MEMORY_USER_TURNS = 3  # Last N user turns in normal prompt mode
     ENABLE_RAW_CONVERSATION_DEBUG = False  # Debug-only raw conversation/artifact injection
+
+    # Semantic answer cache: a question whose embedding is within ANSWER_CACHE_MIN_SIMILARITY
+    # (cosine) of one already answered over the same documents (ids and versions) gets the
+    # stored answer. Follow-ups with conversation history and web answers are never cached
+    ANSWER_CACHE_ENABLED        = os.getenv('ANSWER_CACHE_ENABLED', '1') not in {'0', 'false', 'False'}
+    ANSWER_CACHE_SIZE           = int(os.getenv('ANSWER_CACHE_SIZE', '1000'))
+    ANSWER_CACHE_TTL_S          = float(os.getenv('ANSWER_CACHE_TTL_S', '21600'))
+    ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv('ANSWER_CACHE_MIN_SIMILARITY', '0.95'))
+
+    # Query pipeline: routing, language detection, question embedding, vector retrieval
+    # and web retrieval run concurrently on a shared thread pool; timeouts in seconds
+    QUERY_PIPELINE_WORKERS        = int(os.getenv('QUERY_PIPELINE_WORKERS', '16'))
+    QUERY_STAGE_DEFAULT_TIMEOUT_S = 15.0
+    # Each stage outlasts the timeouts of the services it calls, so their own fallbacks
+    # (toggles-only routing, no web chunks) apply first. Required stages (embed,
+    # retrieval) are only timed once warm-up is done: a 504 rather than a cold model load.
+    QUERY_STAGE_TIMEOUTS = {
+        'routing': INTENT_BATCH_TIMEOUT_S + 5.0,
+        'language': 2.0,
+        'embed': 10.0,
+        'retrieval': 10.0,
+        'web': WEB_TIMEOUT_S + 4.0,
+        'rewrite_speculative': 10.0,
+    }
+    # Tracing: per-stage spans feed the /metrics histograms; requests slower than
+    # SLOW_QUERY_MS (0 disables) log their span tree on the 'slow_query' logger
+    SLOW_QUERY_MS       = float(os.getenv('SLOW_QUERY_MS', '3000'))
+    SLOW_QUERY_LOG_FILE = os.getenv('SLOW_QUERY_LOG_FILE', '')  # optional extra file handler
     
     # System Prompt Template
     SYSTEM_PROMPT = """You are an AI learning assistant helping students understand course materials.
@@ -252,6 +379,11 @@ ACADEMIC INTEGRITY:
     # Classification thresholds
     SUBJECT_SIMILARITY_THRESHOLD = 0.35  # Minimum similarity for subject classification
     TOPIC_SIMILARITY_THRESHOLD = 0.30    # Minimum similarity for topic classification
+
+    # Subject/topic embedding matrices are saved here (one .npy per model + subject tree hash)
+    # and memory-mapped on later starts
+    CLASSIFICATION_INDEX_DIR     = os.getenv('CLASSIFICATION_INDEX_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'cache', 'classification'))
+    CLASSIFICATION_INDEX_PERSIST = os.getenv('CLASSIFICATION_INDEX_PERSIST', '1') not in {'0', 'false', 'False'}
     
     # ════════════════════════════════════════════════════════════════
     # QUERY REWRITING CONFIGURATION
@@ -275,6 +407,9 @@ ACADEMIC INTEGRITY:
     # Query rewriting performance settings
     QUERY_REWRITE_RETRY_ON_IMPROVEMENT = True  # Only use rewritten if score improves
     QUERY_REWRITE_MIN_IMPROVEMENT = 0.3        # Minimum score improvement to accept rewrite
+    # Speculative rewriting: when the question alone predicts context fusion or decomposition,
+    # start that LLM call beside the first retrieval; it is wasted if the rerank gate passes
+    QUERY_REWRITE_SPECULATIVE = os.getenv('QUERY_REWRITE_SPECULATIVE', '0') in {'1', 'true', 'True'}
 
 
 class DevelopmentConfig(Config):
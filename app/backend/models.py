@@ -82,6 +82,7 @@ class Document(Base):
     subject     = Column(ARRAY(String))  # e.g., ['Math', 'Physics'] - multi-subject support
     upload_date = Column(TIMESTAMP, default=datetime.utcnow)
     chunk_count = Column(Integer, default=0)
+    version     = Column(Integer, nullable=False, default=1)  # bumped on every change; scopes the answer cache
     
     # Relationships
     user = relationship("User", back_populates="documents")
@@ -100,7 +101,8 @@ class Document(Base):
             'title': self.title,
             'subject': self.subject,
             'upload_date': self.upload_date.isoformat() if self.upload_date else None,
-            'chunk_count': self.chunk_count
+            'chunk_count': self.chunk_count,
+            'version': self.version
         }
     
     def __repr__(self):
@@ -213,3 +215,62 @@ class DocumentChunk(Base):
     
     def __repr__(self):
         return f"<DocumentChunk(id={self.id}, document_id={self.document_id}, chunk_order={self.chunk_order})>"
+
+
+class IngestionJob(Base):
+    """Background ingestion job; state is persisted so jobs survive a process restart"""
+    __tablename__ = 'ingestion_jobs'
+
+    id          = Column(Integer, primary_key=True)
+    user_id     = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
+    folder_id   = Column(Integer, ForeignKey('folders.id', ondelete='SET NULL'), nullable=True)
+    document_id = Column(Integer, ForeignKey('documents.id', ondelete='SET NULL'), nullable=True)
+    filename    = Column(String(255), nullable=False)
+    file_path   = Column(String(500), nullable=False)
+    subject     = Column(String(255))
+    status      = Column(String(20), nullable=False, default='queued')  # 'queued' | 'running' | 'completed' | 'failed'
+    stage       = Column(String(20))                                    # 'load' | 'chunk' | 'embed' | 'store'
+    progress    = Column(JSONB, nullable=False, default=dict)           # per-stage status and counters
+    error       = Column(Text)
+    attempts    = Column(Integer, nullable=False, default=0)
+    created_at  = Column(TIMESTAMP, default=datetime.utcnow)
+    started_at  = Column(TIMESTAMP)
+    finished_at = Column(TIMESTAMP)
+    updated_at  = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)  # doubles as worker heartbeat
+
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'folder_id': self.folder_id,
+            'document_id': self.document_id,
+            'filename': self.filename,
+            'subject': self.subject,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress or {},
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self):
+        return f"<IngestionJob(id={self.id}, filename='{self.filename}', status='{self.status}')>"
+
+
+class EmbeddingCacheEntry(Base):
+    """Content-addressed embedding cache shared by ingestion, query and quiz"""
+    __tablename__ = 'embedding_cache'
+
+    model_name = Column(String(255), primary_key=True)
+    text_hash  = Column(String(64), primary_key=True)   # sha256 of the normalized text
+    embedding  = Column(Vector(384), nullable=False)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    last_used_at = Column(TIMESTAMP, default=datetime.utcnow)  # refreshed on hits; drives pruning
+
+    def __repr__(self):
+        return f"<EmbeddingCacheEntry(model_name='{self.model_name}', text_hash='{self.text_hash[:12]}')>"
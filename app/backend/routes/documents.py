@@ -1,11 +1,14 @@
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 import os
+import uuid
 
-from app.backend.models import Document, DocumentChunk, Folder
+from app.backend.models import Document, DocumentChunk, Folder, IngestionJob
 from app.backend.database import get_db_session
 from app.backend.config import Config
 from app.backend.services.injestion import run_ingestion_pipeline  # adjust path if needed
+from app.backend.services.ingestion_jobs import enqueue_ingestion_job, notify_ingestion_workers
+from app.backend.services.batch_ingestion import run_batch_ingestion_pipeline
 
 documents_bp = Blueprint("documents", __name__)
 
@@ -25,9 +28,13 @@ def get_documents():
 @documents_bp.route("/upload", methods=["POST"])
 def upload_document():
     """
-    Accept a file upload, save it to UPLOAD_FOLDER,
-    then run the LangChain ingestion pipeline:
+    Accept a file upload, save it to UPLOAD_FOLDER and queue an ingestion job:
     Load → Split → Embed → Store (Document + DocumentChunk).
+
+    Returns 202 with the job immediately; poll GET /api/documents/jobs/<job_id>
+    for per-stage progress and the resulting document_id.
+    Pass ?sync=1 (or when background workers are disabled) to ingest inline
+    and return 201 with the document, as before.
     """
     if "file" not in request.files:
         return jsonify({"error": "No file part in request"}), 400
@@ -45,6 +52,10 @@ def upload_document():
     subject = request.form.get("subject", "General")
     user_id = request.form.get("user_id", type=int)
     folder_id = request.form.get("folder_id", type=int)  # NEW: folder assignment
+    run_sync = (
+        request.args.get("sync", "").lower() in {"1", "true"}
+        or not Config.INGESTION_WORKERS_ENABLED
+    )
 
     # Save file to disk
     filename = secure_filename(file.filename)
@@ -54,6 +65,25 @@ def upload_document():
     file.save(file_path)
     current_app.logger.info(f"Saved upload to {file_path}")
 
+    if not run_sync:
+        with get_db_session() as session:
+            job = enqueue_ingestion_job(
+                session,
+                file_path=file_path,
+                filename=filename,
+                user_id=user_id,
+                subject=subject,
+                folder_id=folder_id,
+            )
+            session.commit()
+            job_data = job.to_dict()
+        notify_ingestion_workers()
+        current_app.logger.info(f"Queued ingestion job {job_data['id']} for {filename}")
+        return jsonify({
+            "message": "Document uploaded and queued for ingestion.",
+            "job": job_data,
+        }), 202
+
     try:
         with get_db_session() as session:
             doc = run_ingestion_pipeline(
@@ -75,6 +105,120 @@ def upload_document():
         current_app.logger.error(f"Ingestion error for {filename}: {e}")
         return jsonify({"error": "Ingestion failed. See server logs."}), 500
 
+
+# ── POST /api/documents/upload/batch ─────────────────────────────
+@documents_bp.route("/upload/batch", methods=["POST"])
+def upload_documents_batch():
+    """
+    Accept several files (multipart field "files") and ingest them together:
+    files are loaded/cleaned in parallel, all chunks share one batched
+    embedding pass, and each document is committed on its own.
+
+    Returns 200 with one result per file; a file that fails (or is rejected)
+    does not affect the others.
+    """
+    files = [f for f in request.files.getlist("files") if f and f.filename]
+    if not files:
+        return jsonify({"error": "No files in request (use the 'files' field)"}), 400
+    if len(files) > Config.MAX_BATCH_UPLOAD_FILES:
+        return jsonify({
+            "error": f"Too many files: {len(files)} (max {Config.MAX_BATCH_UPLOAD_FILES} per batch)"
+        }), 413
+
+    subject = request.form.get("subject", "General")
+    user_id = request.form.get("user_id", type=int)
+    folder_id = request.form.get("folder_id", type=int)
+
+    upload_dir = Config.UPLOAD_FOLDER
+    os.makedirs(upload_dir, exist_ok=True)
+
+    results = [None] * len(files)
+    accepted = []  # (result index, file_path, filename)
+    for i, file in enumerate(files):
+        filename = secure_filename(file.filename)
+        ext = file.filename.rsplit(".", 1)[-1].lower()
+        if not filename:
+            results[i] = {"filename": file.filename, "status": "rejected", "error": "Invalid file name"}
+            continue
+        if ext not in Config.ALLOWED_EXTENSIONS:
+            results[i] = {
+                "filename": filename,
+                "status": "rejected",
+                "error": f"File type not allowed. Supported types: {Config.ALLOWED_EXTENSIONS}",
+            }
+            continue
+        # Unique name on disk: files with the same name in one batch must not overwrite each other
+        file_path = os.path.join(upload_dir, f"{uuid.uuid4().hex}_{filename}")
+        try:
+            file.save(file_path)
+        except OSError as e:
+            current_app.logger.error(f"Saving batch upload {filename} failed: {e}")
+            results[i] = {"filename": filename, "status": "failed", "error": "Could not save file"}
+            continue
+        accepted.append((i, file_path, filename))
+    current_app.logger.info(f"Saved {len(accepted)} batch upload(s) to {upload_dir}")
+
+    try:
+        ingested = run_batch_ingestion_pipeline(
+            [(path, name) for _, path, name in accepted],
+            user_id=user_id,
+            subject=subject,
+            folder_id=folder_id,
+        )
+    except Exception as e:
+        current_app.logger.error(f"Batch ingestion error: {e}")
+        ingested = [
+            {"filename": name, "status": "failed", "error": "Ingestion failed. See server logs."}
+            for _, _, name in accepted
+        ]
+    for (i, _, _), result in zip(accepted, ingested):
+        results[i] = result
+
+    return jsonify({
+        "results": results,
+        "ingested": sum(1 for r in results if r["status"] == "ingested"),
+        "failed": sum(1 for r in results if r["status"] != "ingested"),
+    }), 200
+
+
+# ── GET /api/documents/jobs ─────────────────────────────
+@documents_bp.route("/jobs", methods=["GET"])
+def list_ingestion_jobs():
+    """
+    List recent ingestion jobs (newest first), optionally filtered by user_id/status.
+    """
+    user_id = request.args.get("user_id", type=int)
+    status = request.args.get("status")
+    limit = request.args.get("limit", type=int, default=50)
+
+    with get_db_session() as session:
+        query = session.query(IngestionJob)
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        if status:
+            query = query.filter_by(status=status)
+        jobs = query.order_by(IngestionJob.created_at.desc()).limit(limit).all()
+        return jsonify({"jobs": [j.to_dict() for j in jobs]}), 200
+
+
+# ── GET /api/documents/jobs/<id> ─────────────────────────────
+@documents_bp.route("/jobs/<int:job_id>", methods=["GET"])
+def get_ingestion_job(job_id: int):
+    """
+    Poll an ingestion job: status, current stage and per-stage progress
+    (load, chunk, embed, store). Includes the document once completed.
+    """
+    with get_db_session() as session:
+        job = session.query(IngestionJob).filter_by(id=job_id).first()
+        if not job:
+            return jsonify({"error": f"Ingestion job {job_id} not found"}), 404
+
+        data = job.to_dict()
+        if job.document_id is not None:
+            doc = session.query(Document).filter_by(id=job.document_id).first()
+            data["document"] = doc.to_dict() if doc else None
+        return jsonify({"job": data}), 200
+
 # ── DELETE /api/documents/<id> ─────────────────────────────
 @documents_bp.route("/<int:doc_id>", methods=["DELETE"])
 def delete_document(doc_id: int):
@@ -175,6 +319,10 @@ def update_document(doc_id: int):
         if 'folder_id' in data:
             doc.folder_id = data['folder_id']  # Can be None to unfile
             current_app.logger.info(f"Moved document {doc_id} to folder: {data['folder_id']}")
+
+        if 'subject' in data or 'folder_id' in data:
+            # Cached answers over this document are keyed by its version
+            doc.version = (doc.version or 1) + 1
         
         return jsonify({
             "message": "Document updated successfully",
@@ -2,19 +2,25 @@
 Query/RAG routes - Full RAG pipeline implementation
 Handles question answering with retrieval, reranking, and generation
 """
+import json
 import logging
-from flask import Blueprint, request, jsonify, current_app
+import time
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 from datetime import datetime
 
-from app.backend.database import get_db_session
+from app.backend.database import get_db_session, session_factory
 from app.backend.models import Session as ConvSession, Message, SessionMemory
-from app.backend.services.injestion import get_embeddings
+from app.backend.services.injestion import embeddings_loaded, get_embeddings
 from app.backend.services import retrieval, reranking, generation, classification,web_retrieval
+from app.backend.services import answer_cache
 from app.backend.services.query_rewriter import get_query_rewriter
 from app.backend.config import Config
 from app.backend.services.tool_detection import detect_and_generate_tool
-from app.backend.services.tool_router import decide_tool_routing
+from app.backend.services.tool_router import decide_tool_routing, toggles_only_routing
+from app.backend.services.pipeline_executor import StagePipeline, StageTimeout
+from app.backend.services.warmup import is_ready as models_ready
+from app.backend.services.tracing import Trace
 from app.backend.services.session_memory_updater import (
     default_structured_memory,
     normalize_structured_memory,
@@ -59,7 +65,12 @@ def _build_rewrite_context(conversation_history: list) -> list:
     return rewrite_ctx
 
 
-def _ensure_web_coverage_in_context(question: str, final_context_chunks: list, web_chunks: list) -> list:
+def _ensure_web_coverage_in_context(
+    question: str,
+    final_context_chunks: list,
+    web_chunks: list,
+    score_memo: dict = None,
+) -> list:
     """Ensure at least one web chunk is present when web retrieval returned results."""
     if not final_context_chunks or not web_chunks:
         return final_context_chunks
@@ -73,6 +84,7 @@ def _ensure_web_coverage_in_context(question: str, final_context_chunks: list, w
             question=question,
             chunks=web_chunks,
             top_k=1,
+            score_memo=score_memo,
         )
         if not top_web:
             return final_context_chunks
@@ -88,58 +100,94 @@ def _ensure_web_coverage_in_context(question: str, final_context_chunks: list, w
         return final_context_chunks
 
 
-@query_bp.route('', methods=['POST'])
-def ask_question():
-    """
-    Ask a question and get AI-generated answer based on uploaded documents.
+def _web_retrieval_stage(question: str, routing_decision, lang_info: dict) -> list:
+    """Web lane for the parallel pipeline; empty unless routing enabled web search."""
+    if routing_decision is None or not routing_decision.web_enabled:
+        return []
+    lang_code = (lang_info or {}).get('code', 'en')
+    try:
+        # Pass language code for language-aware web search and domain filtering
+        return web_retrieval.web_retrieve_as_chunks(question, lang_code=lang_code)
+    except Exception as e:
+        logger.warning(f"[Query] Web retrieval failed, skipping web sources: {e}")
+        return []
 
-    RAG Pipeline (vector-first, web-secondary):
-    1. Validate input and retrieve session/conversation history
-    2. Embed the question using HuggingFace embeddings
-    3. Retrieve top K relevant chunks via vector similarity search (PRIMARY)
-    4. Rerank vector chunks using cross-encoder (PRIMARY)
-    5. (Optional) Web retrieval + rerank (SECONDARY LANE; appended after docs)
-    6. Generate answer using Gemini API with context (docs first, then web)
-    7. Store messages in database
-    8. Return answer with source citations
 
-    Expected JSON payload:
-    {
-        "question": str (required),
-        "session_id": int (optional),
-        "document_ids": [int] (optional),
-        "web_search": bool (optional)   # NEW: UI toggle
-    }
+def _vector_retrieval_stage(question_embedding, document_ids, user_id) -> list:
+    """pgvector retrieval on its own session (runs on a pipeline worker thread)."""
+    db = session_factory()
+    try:
+        return retrieval.retrieve_relevant_chunks(
+            db_session=db,
+            question_embedding=question_embedding,
+            document_ids=document_ids,
+            user_id=user_id,
+            top_k=Config.TOP_K_RETRIEVAL
+        )
+    finally:
+        db.close()
+
+
+# Strategies the rewrite gate picks from the question and history alone (no rerank score)
+_SPECULATIVE_STRATEGIES = ('conversation_context', 'decomposition')
+
+
+def _speculative_rewrite_strategy(question: str, rewrite_context_history: list):
+    """The strategy the rewrite gate will use, when cheap signals already tell; else None."""
+    strategy = get_query_rewriter().analyze_query_needs(
+        query=question,
+        conversation_history=rewrite_context_history,
+    )
+    if not Config.QUERY_REWRITE_STRATEGY_AUTO:
+        # The gate always fuses context, which only calls the LLM for follow-ups
+        return 'conversation_context' if strategy == 'conversation_context' else None
+    return strategy if strategy in _SPECULATIVE_STRATEGIES else None
+
+
+def _speculative_rewrite_stage(strategy: str, question: str, rewrite_context_history: list):
+    """The rewrite LLM call of `strategy`, started beside the first retrieval."""
+    query_rewriter = get_query_rewriter()
+    if strategy == 'conversation_context':
+        return query_rewriter.rewrite_with_conversation_context(
+            current_query=question,
+            conversation_history=rewrite_context_history,
+        )
+    return query_rewriter.decompose_complex_query(question)
+
+
+def _query_events(data: dict, stream: bool = False):
+    """
+    The RAG pipeline behind ask_question and ask_question_stream, as a
+    generator of (event, payload, status) tuples:
+    - ('response', body, status): a complete JSON response (errors, early
+      answers, and the final answer when not streaming)
+    - ('sources', {...}, None), ('token', {'text': ...}, None), ('done', body, None):
+      streaming mode; messages are stored once 'done' has been consumed
     """
+    t_request = time.perf_counter()
+    # Span tree of this request: /metrics histograms, slow-query log
+    trace = Trace("query", stream=stream)
+    pipeline = None
     try:
         # ═══════════════════════════════════════════════════════════
         # 1. VALIDATE INPUT & CHECK AUTHENTICATION
         # ═══════════════════════════════════════════════════════════
-        data = request.get_json()
-
         if not data or 'question' not in data:
-            return jsonify({'error': 'question is required'}), 400
+            yield 'response', {'error': 'question is required'}, 400
+            return
 
         question = data['question'].strip()
         if not question:
-            return jsonify({'error': 'question cannot be empty'}), 400
+            yield 'response', {'error': 'question cannot be empty'}, 400
+            return
         logger.warning(f"[DEBUG] Payload web_search={data.get('web_search')} question='{question[:60]}'")
         original_user_question = question
         session_id = data.get('session_id')
         document_ids = data.get('document_ids')
         folder_ids = data.get('folder_ids')  # NEW: folder filtering support
 
-        # Centralized routing decision (single source of truth for intent checks)
         web_toggle = bool(data.get('web_search', False))
         diagram_toggle = bool(data.get('diagram', False))
-        routing_decision = decide_tool_routing(
-            original_query=original_user_question,
-            effective_query=question,
-            web_toggle=web_toggle,
-            diagram_toggle=diagram_toggle,
-        )
-        web_enabled = routing_decision.web_enabled
-        diagram_enabled = routing_decision.diagram_enabled
 
         # Check if user is authenticated (optional)
         current_user_id = None
@@ -152,19 +200,14 @@ def ask_question():
             pass  # Not authenticated, that's okay
 
         if session_id and not current_user_id:
-            return jsonify({'error': 'Authentication required for session-based queries'}), 401
+            yield 'response', {'error': 'Authentication required for session-based queries'}, 401
+            return
 
         with get_db_session() as db:
             conversation_history = []
             rewrite_context_history = []
-            # ═══════════════════════════════════════════════════════════
-            # DETECT LANGUAGE (For multilingual support)
-            # ═══════════════════════════════════════════════════════════
-            lang_info = detect_language(question)
-            detected_lang_code = lang_info['code']
-            detected_lang_name = lang_info['name']
-            logger.info(f"[Query] Detected language: {detected_lang_code} ({detected_lang_name})")
-            
+            t_session = time.perf_counter()
+
             # ═══════════════════════════════════════════════════════════
             # 2. RETRIEVE SESSION & CONVERSATION HISTORY
             # ═══════════════════════════════════════════════════════════
@@ -173,12 +216,61 @@ def ask_question():
                 session = db.query(ConvSession).filter_by(id=session_id).first()
 
                 if not session:
-                    return jsonify({'error': f'Session {session_id} not found'}), 404
+                    yield 'response', {'error': f'Session {session_id} not found'}, 404
+                    return
 
                 # Session-bound queries are authenticated; enforce ownership.
                 if session.user_id != current_user_id:
-                    return jsonify({'error': 'Access denied to this session'}), 403
+                    yield 'response', {'error': 'Access denied to this session'}, 403
+                    return
 
+            # ═══════════════════════════════════════════════════════════
+            # PARALLEL STAGES (run while the history is loaded below)
+            #   routing ─┐
+            #   language ┴─ web
+            #   embed ───── retrieval (added once document scope is known)
+            #   rewrite_speculative (optional, also once the history is known)
+            # ═══════════════════════════════════════════════════════════
+            # Until the models are loaded, required stages may take as long as a cold load
+            pipeline = StagePipeline(trace=trace, required_timeouts=models_ready() and embeddings_loaded())
+            # Request-scoped intent memo: every routing call below reuses one classifier pass
+            intent_memo = {}
+            # Centralized routing decision (single source of truth for intent checks)
+            pipeline.add(
+                "routing",
+                lambda: decide_tool_routing(
+                    original_query=original_user_question,
+                    effective_query=question,
+                    web_toggle=web_toggle,
+                    diagram_toggle=diagram_toggle,
+                    intent_memo=intent_memo,
+                ),
+                default=toggles_only_routing(
+                    original_query=original_user_question,
+                    effective_query=question,
+                    web_toggle=web_toggle,
+                    diagram_toggle=diagram_toggle,
+                    error='routing stage failed or timed out',
+                ),
+            )
+            # Language support: detect for the answer language and language-aware web search
+            pipeline.add("language", lambda: detect_language(question), default={'code': 'en', 'name': 'English'})
+            # Using multilingual embedding model that supports Chinese, English, and 50+ languages
+            # Cross-lingual retrieval works automatically (e.g., Chinese query → English documents)
+            pipeline.add(
+                "embed",
+                lambda: get_embeddings().embed_query(question),  # Use original language
+                describe=lambda vec: {'dims': len(vec), 'question_chars': len(question)},
+            )
+            pipeline.add(
+                "web",
+                lambda routing, lang: _web_retrieval_stage(question, routing, lang),
+                after=["routing", "language"],
+                default=[],
+                describe=lambda chunks: {'chunks': len(chunks)},
+            )
+
+            if session_id:
                 # Get conversation history (last N messages)
                 messages = (
                     db.query(Message)
@@ -225,48 +317,90 @@ def ask_question():
                     document_ids = folder_doc_ids
                 
                 logger.info(f"[Query] Folder filter: {folder_ids} → {len(document_ids)} docs")
-
-            logger.info(f"[Query] Question: '{question[:50]}...'")
-            logger.info(f"[Query] Session: {session_id}, Documents: {document_ids}, History: {len(conversation_history)} msgs")
-            logger.info(
-                f"[Query] Web enabled: {web_enabled} "
-                f"(toggle={web_toggle}, explicit={routing_decision.web_requested_explicit})"
+            pipeline.record(
+                "session", time.perf_counter() - t_session,
+                history_messages=len(conversation_history),
+                documents=len(document_ids or []),
             )
 
             # ═══════════════════════════════════════════════════════════
-            # 3. EMBED QUESTION (No translation needed - multilingual model handles cross-lingual semantic matching)
+            # 3-4. VECTOR RETRIEVAL (PRIMARY), as soon as the question is embedded
             # ═══════════════════════════════════════════════════════════
-            # Using multilingual embedding model that supports Chinese, English, and 50+ languages
-            # Cross-lingual retrieval works automatically (e.g., Chinese query → English documents)
-            embeddings_model = get_embeddings()
-            question_embedding = embeddings_model.embed_query(question)  # Use original language
-            logger.info(f"[Query] Question embedded ({detected_lang_name}): {len(question_embedding)} dimensions")
+            scoped_document_ids = document_ids
+            pipeline.add(
+                "retrieval",
+                lambda question_embedding: _vector_retrieval_stage(
+                    question_embedding, scoped_document_ids, current_user_id
+                ),
+                after=["embed"],
+                describe=lambda chunks: {'chunks': len(chunks)},
+            )
+
+            # Speculative rewrite: when the question alone predicts the rewrite strategy
+            # (follow-up pronouns, compound question), its LLM call runs beside retrieval.
+            # The result is only used if the rerank gate below asks for that rewrite.
+            speculative_strategy = None
+            if Config.QUERY_REWRITE_ENABLED and Config.QUERY_REWRITE_SPECULATIVE:
+                speculative_strategy = _speculative_rewrite_strategy(question, rewrite_context_history)
+                if speculative_strategy:
+                    speculative_history = list(rewrite_context_history)
+                    pipeline.add(
+                        "rewrite_speculative",
+                        lambda: _speculative_rewrite_stage(speculative_strategy, question, speculative_history),
+                        default=None,
+                        describe=lambda _: {'strategy': speculative_strategy},
+                    )
+            speculative_used = False
+
+            # Answer-cache scope (documents retrieval searches, with versions); follow-ups
+            # depend on the conversation, so only history-free questions use the cache
+            cache_scope = None
+            if Config.ANSWER_CACHE_ENABLED and not conversation_history:
+                cache_scope = answer_cache.resolve_scope(db, scoped_document_ids, current_user_id)
 
             # ═══════════════════════════════════════════════════════════
-            # 4. VECTOR RETRIEVAL (PRIMARY)
+            # 5. JOIN: routing, language, embedding, retrieval, web (SECONDARY LANE)
             # ═══════════════════════════════════════════════════════════
-            retrieved_chunks = retrieval.retrieve_relevant_chunks(
-                db_session=db,
-                question_embedding=question_embedding,
-                document_ids=document_ids,
-                user_id=current_user_id,
-                top_k=Config.TOP_K_RETRIEVAL
+            stage_results = pipeline.join(["routing", "language", "embed", "retrieval", "web"])
+            routing_decision = stage_results["routing"]
+            web_enabled = routing_decision.web_enabled
+            diagram_enabled = routing_decision.diagram_enabled
+            lang_info = stage_results["language"]
+            detected_lang_code = lang_info['code']
+            detected_lang_name = lang_info['name']
+            question_embedding = stage_results["embed"]
+            retrieved_chunks = stage_results["retrieval"]
+            web_chunks = stage_results["web"]
+
+            logger.info(f"[Query] Detected language: {detected_lang_code} ({detected_lang_name})")
+            logger.info(f"[Query] Question: '{question[:50]}...'")
+            logger.info(f"[Query] Session: {session_id}, Documents: {document_ids}, History: {len(conversation_history)} msgs")
+            logger.info(
+                f"[Query] Web enabled: {web_enabled} "
+                f"(toggle={web_toggle}, explicit={routing_decision.web_requested_explicit})"
             )
+            logger.info(f"[Query] Question embedded ({detected_lang_name}): {len(question_embedding)} dimensions")
             logger.info(f"[Query] Retrieved {len(retrieved_chunks)} chunks (docs)")
+            if web_enabled:
+                logger.info(f"[Query] Retrieved {len(web_chunks)} chunks (web, lang={detected_lang_code})")
+            logger.info(f"[Query] Parallel stages (ms): {pipeline.timings_ms()}")
 
             # ═══════════════════════════════════════════════════════════
-            # 5. OPTIONAL WEB RETRIEVAL (SECONDARY LANE)
-            #     Language-aware: searches language-appropriate sources
+            # 5a. SEMANTIC ANSWER CACHE (near-duplicate question, same documents)
+            #     A hit skips reranking, rewriting, generation and tool detection
             # ═══════════════════════════════════════════════════════════
-            web_chunks = []
-            if web_enabled:
-                try:
-                    # Pass language code for language-aware web search and domain filtering
-                    web_chunks = web_retrieval.web_retrieve_as_chunks(question, lang_code=detected_lang_code)
-                    logger.info(f"[Query] Retrieved {len(web_chunks)} chunks (web, lang={detected_lang_code})")
-                except Exception as e:
-                    logger.warning(f"[Query] Web retrieval failed, skipping web sources: {e}")
-                    web_chunks = []
+            cache_key = None
+            cached = None
+            if cache_scope and not web_enabled:
+                t_cache = time.perf_counter()
+                cache_key = answer_cache.scope_key(cache_scope, language=detected_lang_code, diagram=diagram_enabled)
+                cached = answer_cache.lookup(cache_key, question_embedding)
+                pipeline.record("answer_cache", time.perf_counter() - t_cache, hit=cached is not None)
+                if cached is not None:
+                    logger.info(
+                        f"[Query] Answer cache hit (similarity={cached.similarity:.3f}): "
+                        f"'{cached.question[:50]}'"
+                    )
 
             # ═══════════════════════════════════════════════════════════
             # 6. UNIFIED RERANKING (DOCS + WEB COMBINED)
@@ -276,7 +410,7 @@ def ask_question():
             logger.info(f"[Query] Combined pool: {len(retrieved_chunks)} docs + {len(web_chunks)} web = {len(all_chunks)} total")
 
             if not all_chunks:
-                return jsonify({
+                yield 'response', {
                     'answer': (
                         "I couldn't find any relevant information in the available sources to answer your question. "
                         "Please upload documents, enable web search, or try rephrasing your question."
@@ -287,24 +421,34 @@ def ask_question():
                         'num_chunks_retrieved': 0,
                         'num_chunks_reranked': 0,
                         'num_web_chunks': 0,
-                        'error': 'No relevant chunks found in docs or web'
+                        'error': 'No relevant chunks found in docs or web',
+                        'stage_timings_ms': pipeline.timings_ms(),
+                        'degraded_stages': pipeline.degraded(),
                     }
-                }), 200
+                }, 200
+                return
 
-            try:
-                final_context_chunks = reranking.rerank_chunks(
-                    question=question,
-                    chunks=all_chunks,
-                    top_k=Config.RERANK_TOP_K
-                )
-                logger.info(f"[Query] Unified reranking: top {len(final_context_chunks)} chunks selected")
-                # Log source type breakdown
-                doc_count = sum(1 for c in final_context_chunks if c.get('metadata', {}).get('source_type') != 'web')
-                web_count = len(final_context_chunks) - doc_count
-                logger.info(f"[Query] Final mix: {doc_count} docs + {web_count} web")
-            except Exception as e:
-                logger.warning(f"[Query] Unified reranking failed, using top retrieval results: {e}")
-                final_context_chunks = all_chunks[:Config.RERANK_TOP_K]
+            t_rerank = time.perf_counter()
+            # Scores shared by every rerank pass of this request
+            rerank_memo = {}
+            if cached is not None:
+                final_context_chunks = cached.context_chunks
+            else:
+                try:
+                    final_context_chunks = reranking.rerank_chunks(
+                        question=question,
+                        chunks=all_chunks,
+                        top_k=Config.RERANK_TOP_K,
+                        score_memo=rerank_memo,
+                    )
+                    logger.info(f"[Query] Unified reranking: top {len(final_context_chunks)} chunks selected")
+                    # Log source type breakdown
+                    doc_count = sum(1 for c in final_context_chunks if c.get('metadata', {}).get('source_type') != 'web')
+                    web_count = len(final_context_chunks) - doc_count
+                    logger.info(f"[Query] Final mix: {doc_count} docs + {web_count} web")
+                except Exception as e:
+                    logger.warning(f"[Query] Unified reranking failed, using top retrieval results: {e}")
+                    final_context_chunks = all_chunks[:Config.RERANK_TOP_K]
 
             # If web retrieval was enabled and returned results, retain at least one web item
             # in final context to avoid doc-only drift for explicit online/current requests.
@@ -313,7 +457,12 @@ def ask_question():
                     question=question,
                     final_context_chunks=final_context_chunks,
                     web_chunks=web_chunks,
+                    score_memo=rerank_memo,
                 )
+            pipeline.record(
+                "rerank", time.perf_counter() - t_rerank,
+                chunks_in=len(all_chunks), chunks_out=len(final_context_chunks),
+            )
 
             # ═══════════════════════════════════════════════════════════
             # 6a. ADAPTIVE QUERY REWRITING (Phase 1 & 2)
@@ -328,14 +477,15 @@ def ask_question():
             rewritten_avg_score = 0.0
             
             logger.warning(f"[QueryRewrite] Config.QUERY_REWRITE_ENABLED = {Config.QUERY_REWRITE_ENABLED}")
+            t_rewrite = time.perf_counter()
             
-            if Config.QUERY_REWRITE_ENABLED and final_context_chunks:
+            if Config.QUERY_REWRITE_ENABLED and final_context_chunks and cached is None:
                 # Calculate average rerank score to assess retrieval quality
                 avg_rerank_score = (
                     sum(c.get('rerank_score', 0) for c in final_context_chunks) / len(final_context_chunks)
                     if final_context_chunks else 0.0
                 )
-                logger.warning(f"[QueryRewrite] Feature enabled, checking scores...")
+                logger.warning("[QueryRewrite] Feature enabled, checking scores...")
                 logger.warning(f"[QueryRewrite] Average rerank score: {avg_rerank_score:.2f}")
                 logger.warning(f"[QueryRewrite] Thresholds - Poor: {Config.RERANK_QUALITY_THRESHOLD_POOR}, Decent: {Config.RERANK_QUALITY_THRESHOLD_DECENT}")
                 logger.warning(f"[QueryRewrite] Rewrite context messages: {len(rewrite_context_history) if rewrite_context_history else 0}")
@@ -380,12 +530,21 @@ def ask_question():
                         # Apply rewriting strategy
                         rewritten_query = None
                         use_original_for_rerank = False  # Default: use rewritten query for reranking
+
+                        # The speculative call made the same request; None if it failed
+                        speculative = None
+                        if speculative_strategy == strategy:
+                            speculative = pipeline.join(["rewrite_speculative"])["rewrite_speculative"]
+                            speculative_used = speculative is not None
+                            logger.info(f"[QueryRewrite] Speculative {strategy} {'used' if speculative_used else 'failed'}")
                         
                         if strategy == 'conversation_context':
-                            rewritten_query = query_rewriter.rewrite_with_conversation_context(
-                                current_query=question,
-                                conversation_history=rewrite_context_history
-                            )
+                            rewritten_query = speculative
+                            if rewritten_query is None:
+                                rewritten_query = query_rewriter.rewrite_with_conversation_context(
+                                    current_query=question,
+                                    conversation_history=rewrite_context_history
+                                )
                         elif strategy == 'expansion':
                             variants = query_rewriter.expand_query_with_synonyms(
                                 original_query=question,
@@ -395,7 +554,9 @@ def ask_question():
                             # Use the first alternative variant for rewrite/retrieval.
                             rewritten_query = variants[1] if variants and len(variants) > 1 else question
                         elif strategy == 'decomposition':
-                            sub_questions = query_rewriter.decompose_complex_query(question)
+                            sub_questions = speculative
+                            if sub_questions is None:
+                                sub_questions = query_rewriter.decompose_complex_query(question)
                             
                             # Multi-query retrieval: retrieve chunks for each sub-question
                             if sub_questions and len(sub_questions) > 1:
@@ -447,7 +608,7 @@ def ask_question():
                             
                             if not multi_query_done:
                                 # Single query strategies - do normal retrieval
-                                logger.warning(f"[QueryRewrite] Retrying retrieval with rewritten query")
+                                logger.warning("[QueryRewrite] Retrying retrieval with rewritten query")
                                 logger.warning(f"  Original: {question}")
                                 logger.warning(f"  Rewritten: {rewritten_query[:200]}..." if len(rewritten_query) > 200 else f"  Rewritten: {rewritten_query}")
                                 
@@ -471,7 +632,8 @@ def ask_question():
                             retry_final = reranking.rerank_chunks(
                                 question=rerank_question,
                                 chunks=retry_chunks + web_chunks,  # Include web chunks in reranking
-                                top_k=Config.RERANK_TOP_K
+                                top_k=Config.RERANK_TOP_K,
+                                score_memo=rerank_memo,
                             )
                             
                             # Calculate new average score
@@ -501,14 +663,14 @@ def ask_question():
                                     logger.warning(f"[QueryRewrite] ✗ Keeping original query (insufficient improvement: +{improvement:.2f})")
                             else:
                                 # Always use rewritten version
-                                logger.warning(f"[QueryRewrite] Using rewritten query (retry_on_improvement=False)")
+                                logger.warning("[QueryRewrite] Using rewritten query (retry_on_improvement=False)")
                                 final_context_chunks = retry_final
                                 # Keep retrieval rewrite separate from user-facing question.
                                 accepted_rewritten_query = rewritten_query
                                 query_was_rewritten = True
                                 rewrite_strategy_used = strategy
                         else:
-                            logger.debug(f"[QueryRewrite] Query unchanged after rewriting attempt")
+                            logger.debug("[QueryRewrite] Query unchanged after rewriting attempt")
                     
                     except Exception as rewrite_err:
                         logger.error(f"[QueryRewrite] Rewriting failed: {rewrite_err}", exc_info=True)
@@ -517,9 +679,17 @@ def ask_question():
                     logger.info(f"[QueryRewrite] Not triggered - Score too high (avg={avg_rerank_score:.2f} >= {Config.RERANK_QUALITY_THRESHOLD_DECENT})")
             else:
                 if not Config.QUERY_REWRITE_ENABLED:
-                    logger.info(f"[QueryRewrite] Feature is DISABLED in config")
+                    logger.info("[QueryRewrite] Feature is DISABLED in config")
                 elif not final_context_chunks:
-                    logger.info(f"[QueryRewrite] Skipped - No chunks retrieved")
+                    logger.info("[QueryRewrite] Skipped - No chunks retrieved")
+                elif cached is not None:
+                    logger.info("[QueryRewrite] Skipped - Answer cache hit")
+
+            pipeline.record(
+                "rewrite", time.perf_counter() - t_rewrite,
+                rewritten=query_was_rewritten, strategy=rewrite_strategy_used,
+                speculative=speculative_strategy, speculative_used=speculative_used,
+            )
 
             # Rewrite acceptance can replace final chunks; re-apply web-presence guarantee.
             if web_enabled and web_chunks:
@@ -527,6 +697,7 @@ def ask_question():
                     question=question,
                     final_context_chunks=final_context_chunks,
                     web_chunks=web_chunks,
+                    score_memo=rerank_memo,
                 )
             
             # ═══════════════════════════════════════════════════════════
@@ -553,14 +724,40 @@ def ask_question():
                 effective_query=original_user_question,
                 web_toggle=web_toggle,
                 diagram_toggle=diagram_toggle,
+                intent_memo=intent_memo,
             )
             web_enabled = routing_decision.web_enabled
             diagram_enabled = routing_decision.diagram_enabled
 
+            # ═══════════════════════════════════════════════════════════
+            # 7. PREPARE SOURCE CITATIONS (docs + web)
+            # ═══════════════════════════════════════════════════════════
+            sources = []
+            for i, chunk in enumerate(final_context_chunks, 1):
+                md = chunk.get('metadata', {}) or {}
+                sources.append({
+                    "chunk_id": chunk.get("chunk_id"),
+                    "doc_id": chunk.get("document_id"),  # Changed from document_id to doc_id for frontend compatibility
+                    "filename": chunk.get("filename"),
+                    "content": chunk.get("content", "")[:300] + ("..." if len(chunk.get("content","")) > 300 else ""),
+                    "score": chunk.get("rerank_score", chunk.get("similarity", 0.0)),
+                    "chunk_order": chunk.get("chunk_order", 0),
+                    "citation_index": i,  # Preserve LLM's reference order (S1, S2, etc.) even after frontend sorting
+                    "metadata": md,
+                    "source_type": md.get("source_type", "doc"),     # "doc" or "web"
+                    "url": md.get("url"),                           # only for web
+                    "title": md.get("title"),                       # only for web
+                })
+
+            # Source mix metadata is reused for response + session-memory provenance.
+            num_doc_chunks = sum(1 for c in final_context_chunks if c.get('metadata', {}).get('source_type') != 'web')
+            num_web_chunks = len(final_context_chunks) - num_doc_chunks
+
             # ═══════════════════════════════════════════════════════════
             # GENERATE ANSWER IN USER'S LANGUAGE
             # ═══════════════════════════════════════════════════════════
-            result = generation.generate_answer(
+            t_generate = time.perf_counter()
+            answer_kwargs = dict(
                 question=question,
                 context_chunks=final_context_chunks,
                 conversation_history=conversation_history,
@@ -571,12 +768,42 @@ def ask_question():
                 web_requested=routing_decision.web_requested_explicit,
                 diagram_requested=routing_decision.diagram_requested_explicit,
             )
+            if stream:
+                # Sources first, then answer text as the LLM produces it
+                yield 'sources', {
+                    'sources': sources,
+                    'session_id': session_id,
+                    'detected_language': {'code': detected_lang_code, 'name': detected_lang_name},
+                }, None
+            if cached is not None:
+                result = {
+                    'answer': cached.answer,
+                    'model_used': cached.model_used,
+                    'finish_reason': cached.finish_reason,
+                }
+                if stream:
+                    yield 'token', {'text': cached.answer}, None
+            elif stream:
+                result = {}
+                for delta in generation.stream_answer(result, **answer_kwargs):
+                    yield 'token', {'text': delta}, None
+            else:
+                result = generation.generate_answer(**answer_kwargs)
 
             answer = result['answer']
+            pipeline.record(
+                "generation", time.perf_counter() - t_generate,
+                context_chunks=len(final_context_chunks),
+                prompt_chars=result.get('prompt_chars', 0),
+                answer_chars=len(answer),
+                streamed=stream,
+                cached=cached is not None,
+            )
             
             # Only generate diagrams if diagram mode is enabled
-            tool_output = None
-            if diagram_enabled:
+            tool_output = cached.tool_output if cached is not None else None
+            t_tool = time.perf_counter()
+            if diagram_enabled and cached is None:
                 try:
                     tool_output = detect_and_generate_tool(
                         question=question,
@@ -593,126 +820,127 @@ def ask_question():
                 except Exception as tool_err:
                     logger.warning(f"[Tool] Detection failed: {tool_err}")
                     tool_output = None
+                pipeline.record(
+                    "tool", time.perf_counter() - t_tool,
+                    tool_type=tool_output.get('type') if isinstance(tool_output, dict) else None,
+                )
 
-            # ═══════════════════════════════════════════════════════════
-            # 7. PREPARE SOURCE CITATIONS (docs + web)
-            # ═══════════════════════════════════════════════════════════
-            sources = []
-            for i, chunk in enumerate(final_context_chunks, 1):
-                md = chunk.get('metadata', {}) or {}
-                sources.append({
-                    "chunk_id": chunk.get("chunk_id"),
-                    "doc_id": chunk.get("document_id"),  # Changed from document_id to doc_id for frontend compatibility
-                    "filename": chunk.get("filename"),
-                    "content": chunk.get("content", "")[:300] + ("..." if len(chunk.get("content","")) > 300 else ""),
-                    "score": chunk.get("rerank_score", chunk.get("similarity", 0.0)),
-                    "chunk_order": chunk.get("chunk_order", 0),
-                    "citation_index": i,  # Preserve LLM's reference order (S1, S2, etc.) even after frontend sorting
-                    "metadata": md,
-                    "source_type": md.get("source_type", "doc"),     # "doc" or "web"
-                    "url": md.get("url"),                           # only for web
-                    "title": md.get("title"),                       # only for web
-                })
-
-            # Source mix metadata is reused for response + session-memory provenance.
-            num_doc_chunks = sum(1 for c in final_context_chunks if c.get('metadata', {}).get('source_type') != 'web')
-            num_web_chunks = len(final_context_chunks) - num_doc_chunks
+            if cache_key is not None and cached is None and result.get('finish_reason') != 'ERROR':
+                answer_cache.store(
+                    cache_key,
+                    question_embedding,
+                    question=question,
+                    answer=answer,
+                    model_used=result['model_used'],
+                    finish_reason=result.get('finish_reason', 'COMPLETED'),
+                    context_chunks=final_context_chunks,
+                    tool_output=tool_output,
+                )
 
             # ═══════════════════════════════════════════════════════════
             # 8. STORE MESSAGES IN DATABASE (if session exists)
             # ═══════════════════════════════════════════════════════════
-            # 8. STORE MESSAGES IN DATABASE (if session exists)
-            # ═══════════════════════════════════════════════════════════
-            if session_id:
-                # Determine first-turn status before inserting new messages.
-                had_prior_messages = (
-                    db.query(Message)
-                    .filter_by(session_id=session_id)
-                    .count() > 0
-                )
+            # Runs before the JSON response, or after the last streamed event
+            def store_turn():
+                t_store = time.perf_counter()
+                if session_id:
+                    # Determine first-turn status before inserting new messages.
+                    had_prior_messages = (
+                        db.query(Message)
+                        .filter_by(session_id=session_id)
+                        .count() > 0
+                    )
 
-                # Store user message with rewrite metadata
-                user_msg_metadata = None
-                if query_was_rewritten:
-                    user_msg_metadata = {
-                        'query_rewritten': True,
-                        'original_query': original_question,
-                        'rewritten_query': accepted_rewritten_query,
-                        'rewrite_strategy': rewrite_strategy_used,
-                        'score_improvement': rewritten_avg_score - original_avg_score
-                    }
+                    # Store user message with rewrite metadata
+                    user_msg_metadata = None
+                    if query_was_rewritten:
+                        user_msg_metadata = {
+                            'query_rewritten': True,
+                            'original_query': original_question,
+                            'rewritten_query': accepted_rewritten_query,
+                            'rewrite_strategy': rewrite_strategy_used,
+                            'score_improvement': rewritten_avg_score - original_avg_score
+                        }
                 
-                user_msg = Message(
-                    session_id=session_id,
-                    role='user',
-                    content=original_question,
-                    sources=user_msg_metadata  # Store rewrite metadata in sources field
-                )
-                db.add(user_msg)
-
-                assistant_msg = Message(
-                    session_id=session_id,
-                    role='assistant',
-                    content=answer,
-                    sources={'chunks': sources, 'tool': tool_output}
-                )
-                db.add(assistant_msg)
-                db.flush()
+                    user_msg = Message(
+                        session_id=session_id,
+                        role='user',
+                        content=original_question,
+                        sources=user_msg_metadata  # Store rewrite metadata in sources field
+                    )
+                    db.add(user_msg)
 
-                # Per-query memory auto-refresh with provenance.
-                mem = db.query(SessionMemory).filter_by(session_id=session_id).first()
-                if not mem:
-                    mem = SessionMemory(
+                    assistant_msg = Message(
                         session_id=session_id,
-                        structured_data=default_structured_memory(),
-                        freeform_text='',
-                        freeform_enabled=0,
-                        latest_diagram_artifact=None,
+                        role='assistant',
+                        content=answer,
+                        sources={'chunks': sources, 'tool': tool_output}
                     )
-                    db.add(mem)
+                    db.add(assistant_msg)
+                    db.flush()
 
-                mem.structured_data = update_structured_memory_from_query(
-                    structured_data=normalize_structured_memory(mem.structured_data),
-                    original_question=original_question,
-                    answer=answer,
-                    user_message_id=user_msg.id,
-                    assistant_message_id=assistant_msg.id,
-                    rewrite_strategy=rewrite_strategy_used,
-                    rewritten_query=accepted_rewritten_query,
-                    score_improvement=(rewritten_avg_score - original_avg_score) if query_was_rewritten else None,
-                    web_enabled=web_enabled,
-                    diagram_enabled=diagram_enabled,
-                    web_requested_explicit=routing_decision.web_requested_explicit,
-                    diagram_requested_explicit=routing_decision.diagram_requested_explicit,
-                    num_doc_chunks=num_doc_chunks,
-                    num_web_chunks=num_web_chunks,
-                )
+                    # Per-query memory auto-refresh with provenance.
+                    mem = db.query(SessionMemory).filter_by(session_id=session_id).first()
+                    if not mem:
+                        mem = SessionMemory(
+                            session_id=session_id,
+                            structured_data=default_structured_memory(),
+                            freeform_text='',
+                            freeform_enabled=0,
+                            latest_diagram_artifact=None,
+                        )
+                        db.add(mem)
 
-                if isinstance(tool_output, dict):
-                    t = tool_output.get('type')
-                    if t == 'mermaid' and tool_output.get('code'):
-                        mem.latest_diagram_artifact = {
-                            'type': 'mermaid',
-                            'mermaid': tool_output.get('code'),
-                        }
-                    elif t == 'desmos' and tool_output.get('expressions'):
-                        mem.latest_diagram_artifact = {
-                            'type': 'desmos',
-                            'desmos': tool_output.get('expressions'),
-                        }
+                    mem.structured_data = update_structured_memory_from_query(
+                        structured_data=normalize_structured_memory(mem.structured_data),
+                        original_question=original_question,
+                        answer=answer,
+                        user_message_id=user_msg.id,
+                        assistant_message_id=assistant_msg.id,
+                        rewrite_strategy=rewrite_strategy_used,
+                        rewritten_query=accepted_rewritten_query,
+                        score_improvement=(rewritten_avg_score - original_avg_score) if query_was_rewritten else None,
+                        web_enabled=web_enabled,
+                        diagram_enabled=diagram_enabled,
+                        web_requested_explicit=routing_decision.web_requested_explicit,
+                        diagram_requested_explicit=routing_decision.diagram_requested_explicit,
+                        num_doc_chunks=num_doc_chunks,
+                        num_web_chunks=num_web_chunks,
+                    )
+
+                    if isinstance(tool_output, dict):
+                        t = tool_output.get('type')
+                        if t == 'mermaid' and tool_output.get('code'):
+                            mem.latest_diagram_artifact = {
+                                'type': 'mermaid',
+                                'mermaid': tool_output.get('code'),
+                            }
+                        elif t == 'desmos' and tool_output.get('expressions'):
+                            mem.latest_diagram_artifact = {
+                                'type': 'desmos',
+                                'desmos': tool_output.get('expressions'),
+                            }
 
-                # Auto-generate session title from first question only
-                if session and session.title == 'New Chat':
-                    if not had_prior_messages:
-                        session.title = question[:60] + ('...' if len(question) > 60 else '')
+                    # Auto-generate session title from first question only
+                    if session and session.title == 'New Chat':
+                        if not had_prior_messages:
+                            session.title = question[:60] + ('...' if len(question) > 60 else '')
 
-                db.commit()
-                logger.info(f"[Query] Messages stored in session {session_id}")
+                    db.commit()
+                    logger.info(f"[Query] Messages stored in session {session_id}")
+                    pipeline.record("store", time.perf_counter() - t_store, messages=2)
+
+            if not stream:
+                store_turn()
+
+            stage_timings = pipeline.timings_ms()
+            stage_timings['total'] = round((time.perf_counter() - t_request) * 1000, 1)
+            logger.info(f"[Query] Stage timings (ms): {stage_timings}")
 
             # ═══════════════════════════════════════════════════════════
             # 9. RETURN RESPONSE
             # ═══════════════════════════════════════════════════════════
-            return jsonify({
+            response_body = {
                 'answer': answer,
                 'sources': sources,
                 'tool': tool_output,
@@ -739,18 +967,138 @@ def ask_question():
                     'intent_model': routing_decision.model_name,
                     'intent_inference_ok': routing_decision.inference_ok,
                     'intent_inference_error': routing_decision.inference_error,
+                    'intent_cache_hit': routing_decision.intent_cache_hit,
+                    'answer_cache_hit': cached is not None,
+                    'answer_cache_similarity': cached.similarity if cached is not None else None,
                     # Query rewriting metrics
                     'query_rewritten': query_was_rewritten,
                     'rewrite_strategy': rewrite_strategy_used,
                     'original_query': original_question if query_was_rewritten else None,
                     'rewritten_query': accepted_rewritten_query if query_was_rewritten else None,
-                    'score_improvement': (rewritten_avg_score - original_avg_score) if query_was_rewritten else None
+                    'score_improvement': (rewritten_avg_score - original_avg_score) if query_was_rewritten else None,
+                    'rewrite_speculative': speculative_strategy,
+                    'rewrite_speculative_used': speculative_used,
+                    # Latency breakdown: parallel stages (routing, language, embed, retrieval, web)
+                    # overlap each other and the history load; the rest run in sequence
+                    'stage_timings_ms': stage_timings,
+                    'degraded_stages': pipeline.degraded(),
                 }
-            }), 200
+            }
+            if stream:
+                yield 'done', response_body, None
+                # Persist only once the client has the whole answer
+                store_turn()
+                return
+            yield 'response', response_body, 200
 
+    except StageTimeout as e:
+        # A required stage (embed, retrieval) did not answer in time: retryable, not a 500
+        logger.error(f"[Query] {e}")
+        trace.root.set(error=str(e)[:200])
+        trace.finish(status="timeout")
+        yield 'response', {
+            'error': 'The question took too long to process, please try again',
+            'stage': e.stage,
+        }, 504
     except Exception as e:
         logger.error(f"[Query] Pipeline error: {e}", exc_info=True)
-        return jsonify({
+        trace.root.set(error=str(e)[:200])
+        trace.finish(status="error")
+        yield 'response', {
             'error': 'An error occurred while processing your question',
             'details': str(e) if current_app.debug else 'Enable debug mode for details'
-        }), 500
\ No newline at end of file
+        }, 500
+    finally:
+        # Also reached when the caller stops early (JSON response sent, client gone):
+        # stages still queued or waiting on their inputs are skipped
+        if pipeline is not None:
+            pipeline.cancel()
+        trace.finish()
+
+
+@query_bp.route('', methods=['POST'])
+def ask_question():
+    """
+    Ask a question and get AI-generated answer based on uploaded documents.
+
+    RAG Pipeline (vector-first, web-secondary):
+    1. Validate input and retrieve session/conversation history
+    2. Embed the question using HuggingFace embeddings
+    3. Retrieve top K relevant chunks via vector similarity search (PRIMARY)
+    4. Rerank vector chunks using cross-encoder (PRIMARY)
+    5. (Optional) Web retrieval + rerank (SECONDARY LANE; appended after docs)
+       Routing, language detection, embedding, retrieval and web retrieval run
+       concurrently (StagePipeline) and are joined before reranking. With
+       QUERY_REWRITE_SPECULATIVE, a rewrite predicted from the question alone
+       (follow-up, compound question) starts beside them as well.
+    6. Generate answer using Gemini API with context (docs first, then web)
+    7. Store messages in database
+    8. Return answer with source citations
+
+    Expected JSON payload:
+    {
+        "question": str (required),
+        "session_id": int (optional),
+        "document_ids": [int] (optional),
+        "web_search": bool (optional)   # NEW: UI toggle
+    }
+    """
+    events = _query_events(request.get_json(), stream=False)
+    for event, body, status in events:
+        if event == 'response':
+            _run_to_end(events)
+            return jsonify(body), status
+
+
+def _run_to_end(events) -> None:
+    """
+    Resume the pipeline after its final 'response' so it leaves get_db_session()
+    normally and commits; a generator left suspended would be closed later
+    (GeneratorExit), which skips the commit.
+    """
+    for _ in events:
+        pass
+
+
+def _sse(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str, ensure_ascii=False)}\n\n"
+
+
+@query_bp.route('/stream', methods=['POST'])
+def ask_question_stream():
+    """
+    Streaming variant of ask_question (Server-Sent Events); same JSON payload.
+
+    Events, in order:
+        sources : {"sources": [...], "session_id", "detected_language"}
+        token   : {"text": "..."} answer deltas, as the LLM streams them
+        done    : the full ask_question response body (answer, tool, metadata)
+        error   : {"error", "details"} if the pipeline fails after streaming started
+
+    Validation and auth errors are returned as plain JSON with their status
+    code before any event. Messages and session memory are stored after the
+    done event, so an interrupted stream stores nothing.
+    """
+    # Everything up to the first event (validation, retrieval, rerank) runs here
+    events = _query_events(request.get_json(), stream=True)
+    first_event, first_body, status = next(events)
+    if first_event == 'response':
+        _run_to_end(events)
+        if status != 200:
+            return jsonify(first_body), status
+
+    def event_stream():
+        if first_event == 'response':
+            # Answered without generation (e.g. nothing retrieved)
+            yield _sse('done', first_body)
+            return
+        yield _sse(first_event, first_body)
+        for event, body, _ in events:
+            # A 'response' here is the pipeline's error response
+            yield _sse('error' if event == 'response' else event, body)
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
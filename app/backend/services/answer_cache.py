@@ -0,0 +1,224 @@
+"""
+Semantic answer cache
+Serves the stored answer of an earlier question when a new one is a
+near-duplicate (cosine of the question embeddings >= ANSWER_CACHE_MIN_SIMILARITY)
+asked over the same document scope.
+
+The scope key holds every document retrieval can see for the request together
+with its version counter (documents.version). Uploading, deleting or editing a
+document in scope changes the key, so answers built from the old documents are
+never matched again; they age out through ANSWER_CACHE_TTL_S and the LRU bound
+(ANSWER_CACHE_SIZE).
+
+Each scope has its own small index of normalized question vectors, so a lookup
+is one matrix-vector product over the questions already asked in that scope.
+"""
+import dataclasses
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.backend.config import Config
+from app.backend.models import Document
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    model_used: str
+    finish_reason: str
+    context_chunks: List[Dict]
+    tool_output: Optional[Dict]
+    created_at: float
+    similarity: float = 1.0
+
+
+def resolve_scope(db: Session, document_ids: Optional[Sequence[int]], user_id: Optional[int]) -> Tuple:
+    """
+    (id, version) of every document retrieval searches for this request, sorted
+    by id. Mirrors the filters of retrieval.retrieve_relevant_chunks.
+    """
+    query = db.query(Document.id, Document.version)
+    if document_ids:
+        query = query.filter(Document.id.in_(list(document_ids)))
+    if user_id is None:
+        query = query.filter(Document.user_id.is_(None))
+    else:
+        query = query.filter(Document.user_id == user_id)
+    return tuple(sorted((doc_id, version or 0) for doc_id, version in query.all()))
+
+
+def scope_key(documents: Tuple, language: str, diagram: bool) -> Tuple:
+    """Documents plus everything else the answer depends on besides the question."""
+    return (documents, language, bool(diagram), Config.EMBEDDING_MODEL, Config.LLM_MODEL)
+
+
+def _normalize(vector: Sequence[float]) -> np.ndarray:
+    vec = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+class _ScopeIndex:
+    """Question vectors of one scope; the matrix is rebuilt lazily after changes."""
+
+    def __init__(self):
+        self.vectors: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._ids: List[int] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def add(self, entry_id: int, vector: np.ndarray) -> None:
+        self.vectors[entry_id] = vector
+        self._matrix = None
+
+    def remove(self, entry_id: int) -> None:
+        if self.vectors.pop(entry_id, None) is not None:
+            self._matrix = None
+
+    def nearest(self, vector: np.ndarray) -> Optional[Tuple[int, float]]:
+        if not self.vectors:
+            return None
+        if self._matrix is None:
+            self._ids = list(self.vectors)
+            self._matrix = np.stack([self.vectors[i] for i in self._ids])
+        sims = self._matrix @ vector
+        best = int(np.argmax(sims))
+        return self._ids[best], float(sims[best])
+
+
+class SemanticAnswerCache:
+    """Thread-safe; entries are evicted by TTL and by least-recent use across all scopes."""
+
+    def __init__(self, capacity: int, ttl_s: float, min_similarity: float):
+        self.capacity = max(0, int(capacity))
+        self.ttl_s = float(ttl_s)
+        self.min_similarity = float(min_similarity)
+        self._entries: "OrderedDict[int, Tuple[Hashable, CachedAnswer]]" = OrderedDict()
+        self._scopes: Dict[Hashable, _ScopeIndex] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _drop(self, entry_id: int) -> None:
+        key, _ = self._entries.pop(entry_id)
+        index = self._scopes[key]
+        index.remove(entry_id)
+        if not index.vectors:
+            del self._scopes[key]
+
+    def _nearest_live(self, key: Hashable, vector: np.ndarray) -> Optional[Tuple[int, float]]:
+        """Best match in the scope, dropping expired entries met on the way."""
+        now = time.monotonic()
+        while key in self._scopes:
+            entry_id, similarity = self._scopes[key].nearest(vector)
+            if now - self._entries[entry_id][1].created_at <= self.ttl_s:
+                return entry_id, similarity
+            self._drop(entry_id)
+            self.expired += 1
+        return None
+
+    def lookup(self, key: Hashable, embedding: Sequence[float]) -> Optional[CachedAnswer]:
+        """The cached answer for a near-duplicate question in this scope, or None."""
+        if self.capacity == 0:
+            return None
+        vector = _normalize(embedding)
+        with self._lock:
+            match = self._nearest_live(key, vector)
+            if match is None or match[1] < self.min_similarity:
+                self.misses += 1
+                return None
+            entry_id, similarity = match
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            entry = self._entries[entry_id][1]
+        return dataclasses.replace(
+            entry,
+            context_chunks=[dict(c) for c in entry.context_chunks],
+            similarity=round(similarity, 4),
+        )
+
+    def store(
+        self,
+        key: Hashable,
+        embedding: Sequence[float],
+        *,
+        question: str,
+        answer: str,
+        model_used: str,
+        finish_reason: str,
+        context_chunks: List[Dict],
+        tool_output: Optional[Dict] = None,
+    ) -> None:
+        if self.capacity == 0:
+            return
+        vector = _normalize(embedding)
+        entry = CachedAnswer(
+            question=question,
+            answer=answer,
+            model_used=model_used,
+            finish_reason=finish_reason,
+            context_chunks=[dict(c) for c in context_chunks],
+            tool_output=tool_output,
+            created_at=time.monotonic(),
+        )
+        with self._lock:
+            # A near-duplicate answered concurrently is replaced, not kept twice
+            match = self._nearest_live(key, vector)
+            if match is not None and match[1] >= self.min_similarity:
+                self._drop(match[0])
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (key, entry)
+            self._scopes.setdefault(key, _ScopeIndex()).add(entry_id, vector)
+            while len(self._entries) > self.capacity:
+                self._drop(next(iter(self._entries)))
+                self.evicted += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'scopes': len(self._scopes),
+                'capacity': self.capacity,
+                'ttl_s': self.ttl_s,
+                'min_similarity': self.min_similarity,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+                'expired': self.expired,
+                'evicted': self.evicted,
+            }
+
+
+_cache = SemanticAnswerCache(
+    Config.ANSWER_CACHE_SIZE,
+    Config.ANSWER_CACHE_TTL_S,
+    Config.ANSWER_CACHE_MIN_SIMILARITY,
+)
+
+
+def lookup(key: Hashable, embedding: Sequence[float]) -> Optional[CachedAnswer]:
+    return _cache.lookup(key, embedding)
+
+
+def store(key: Hashable, embedding: Sequence[float], **entry) -> None:
+    _cache.store(key, embedding, **entry)
+
+
+def get_answer_cache_stats() -> Dict:
+    return _cache.stats()
@@ -0,0 +1,264 @@
+"""
+Multi-file ingestion
+Loads and cleans a batch of files in a process pool (PDF/PPTX parsing is
+CPU-bound and holds the GIL), runs the chunks of every file through one shared
+batched embedding stage, then stores and commits each document on its own so a
+bad file only fails its own result.
+
+Large PDFs (should_stream_document) skip the shared stages: each one goes
+through run_streaming_ingestion_pipeline on its own, after the small files,
+so a textbook in the batch is never held in memory as a whole.
+
+Stages:
+1. Load   (process pool)  : load_document() per file
+2. Chunk  (this process)  : classification sample + semantic chunking, sharing one
+                            IngestionEmbeddingCache across the batch
+3. Clean  (process pool)  : clean_chunk_text() over all chunks of all files
+4. Embed  (this process)  : one embed_texts() call for every kept chunk
+5. Store  (per document)  : topic classification + bulk insert + commit
+
+The process pool is created on the first batch and kept for the life of the
+process, so its spawned children import the ingestion stack only once.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document as LCDocument
+
+from app.backend.config import Config
+from app.backend.database import get_db_session
+from app.backend.services.injestion import (
+    IngestionEmbeddingCache,
+    NO_USABLE_CHUNKS_ERROR,
+    classify_chunks,
+    classify_document_sample,
+    clean_chunk_text,
+    embed_texts,
+    filter_clean_chunks,
+    load_document,
+    run_streaming_ingestion_pipeline,
+    should_stream_document,
+    split_documents_by_type,
+    store_document,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _BatchItem:
+    file_path: str
+    filename: str
+    lc_docs: List[LCDocument] = field(default_factory=list)
+    document_subjects: List[str] = field(default_factory=list)
+    chunks: List[LCDocument] = field(default_factory=list)
+    vectors: List[List[float]] = field(default_factory=list)
+    error: Optional[str] = None
+    document: Optional[Dict] = None
+
+
+def _load_file_worker(file_path: str) -> List[Tuple[str, Dict]]:
+    """Process-pool entry point; returns plain tuples so the result pickles cheaply."""
+    return [(d.page_content, dict(d.metadata or {})) for d in load_document(file_path)]
+
+
+def _error_message(e: Exception) -> str:
+    return str(e) if isinstance(e, ValueError) else f"Ingestion failed: {e}"
+
+
+def loader_process_count() -> int:
+    return max(1, Config.INGESTION_LOADER_PROCESSES or (os.cpu_count() or 1))
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_loader_pool() -> ProcessPoolExecutor:
+    """Process-wide loader pool (created on first use, replaced if a child died)."""
+    global _pool
+    with _pool_lock:
+        # A pool whose child crashed rejects all further work (BrokenProcessPool)
+        if _pool is not None and getattr(_pool, "_broken", False):
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            # spawn: forking a process that already holds torch/tokenizer threads is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=loader_process_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _pool
+
+
+def run_batch_ingestion_pipeline(
+    files: List[Tuple[str, str]],
+    user_id: Optional[int] = None,
+    subject: Optional[str] = None,
+    folder_id: Optional[int] = None,
+) -> List[Dict]:
+    """
+    Ingest several saved files. files is a list of (file_path, filename).
+    Returns one {filename, status, document | error} dict per file, in input order.
+    """
+    all_items = [_BatchItem(file_path=p, filename=name) for p, name in files]
+    if not all_items:
+        return []
+    t_total = time.perf_counter()
+
+    items: List[_BatchItem] = []
+    streamed: List[_BatchItem] = []
+    for item in all_items:
+        (streamed if should_stream_document(item.file_path) else items).append(item)
+    if items:
+        _ingest_shared(items, user_id, folder_id)
+    for item in streamed:
+        _ingest_streamed(item, user_id, subject, folder_id)
+
+    logger.info(
+        f"[BatchIngestion] {sum(1 for i in all_items if not i.error)}/{len(all_items)} file(s) ingested "
+        f"({len(streamed)} streamed) in {time.perf_counter() - t_total:.2f}s"
+    )
+
+    results = []
+    for item in all_items:
+        if item.error:
+            results.append({"filename": item.filename, "status": "failed", "error": item.error})
+        else:
+            results.append({"filename": item.filename, "status": "ingested", "document": item.document})
+    return results
+
+
+def _ingest_streamed(
+    item: _BatchItem,
+    user_id: Optional[int],
+    subject: Optional[str],
+    folder_id: Optional[int],
+) -> None:
+    """One large PDF, page batch by page batch, in its own transaction."""
+    try:
+        with get_db_session() as session:
+            doc = run_streaming_ingestion_pipeline(
+                session,
+                item.file_path,
+                user_id=user_id,
+                subject=subject,
+                folder_id=folder_id,
+                filename=item.filename,
+            )
+            item.document = doc.to_dict()
+    except Exception as e:
+        logger.error(f"[BatchIngestion] Streaming ingestion failed for {item.filename}: {e}", exc_info=not isinstance(e, ValueError))
+        item.error = _error_message(e)
+
+
+def _ingest_shared(items: List[_BatchItem], user_id: Optional[int], folder_id: Optional[int]) -> None:
+    """Small files: pooled load and clean, one shared embedding pass, then one store per file."""
+    processes = min(loader_process_count(), len(items))
+
+    pool = get_loader_pool()
+    # ── 1. Load (parallel) ──
+    t0 = time.perf_counter()
+    futures = [pool.submit(_load_file_worker, item.file_path) for item in items]
+    for item, fut in zip(items, futures):
+        try:
+            item.lc_docs = [
+                LCDocument(page_content=text, metadata=meta) for text, meta in fut.result()
+            ]
+        except Exception as e:
+            logger.warning(f"[BatchIngestion] Load failed for {item.filename}: {e}")
+            item.error = _error_message(e)
+    logger.info(
+        f"[BatchIngestion] Loaded {len(items)} file(s) with {processes} process(es) "
+        f"in {time.perf_counter() - t0:.2f}s"
+    )
+
+    # ── 2. Classify + chunk (shared embedding cache) ──
+    t0 = time.perf_counter()
+    embedding_cache = IngestionEmbeddingCache()
+    for item in items:
+        if item.error:
+            continue
+        try:
+            classified = classify_document_sample(item.lc_docs)
+            item.document_subjects = [s['name'] for s in classified]
+            file_ext = os.path.splitext(item.filename)[1].lstrip(".")
+            item.chunks = split_documents_by_type(
+                item.lc_docs, file_ext, embedding_cache=embedding_cache
+            )
+        except Exception as e:
+            logger.warning(f"[BatchIngestion] Chunking failed for {item.filename}: {e}")
+            item.error = _error_message(e)
+        item.lc_docs = []  # pages are no longer needed
+    logger.info(f"[BatchIngestion] Chunked in {time.perf_counter() - t0:.2f}s")
+
+    # ── 3. Clean (parallel, all chunks of all files) ──
+    t0 = time.perf_counter()
+    live = [item for item in items if not item.error]
+    raw_texts = [c.page_content for item in live for c in item.chunks]
+    cleaned = list(pool.map(
+        clean_chunk_text, raw_texts,
+        chunksize=max(1, len(raw_texts) // (loader_process_count() * 4)),
+    ))
+    offset = 0
+    for item in live:
+        n = len(item.chunks)
+        item.chunks = filter_clean_chunks(item.chunks, cleaned[offset:offset + n], embedding_cache)
+        offset += n
+        if not item.chunks:
+            item.error = NO_USABLE_CHUNKS_ERROR
+    logger.info(f"[BatchIngestion] Cleaned {len(raw_texts)} chunk(s) in {time.perf_counter() - t0:.2f}s")
+
+    # ── 4. Embed (one batched call for the whole batch) ──
+    live = [item for item in items if not item.error]
+    texts = [c.page_content for item in live for c in item.chunks]
+    if texts:
+        t0 = time.perf_counter()
+        try:
+            vectors = embed_texts(texts, embedding_cache=embedding_cache)
+        except Exception as e:
+            logger.error(f"[BatchIngestion] Embedding failed: {e}", exc_info=True)
+            for item in live:
+                item.error = _error_message(e)
+            vectors = []
+        offset = 0
+        for item in live:
+            if item.error:
+                continue
+            n = len(item.chunks)
+            item.vectors = vectors[offset:offset + n]
+            offset += n
+        logger.info(
+            f"[BatchIngestion] Embedded {len(texts)} chunk(s) in {time.perf_counter() - t0:.2f}s "
+            f"(cache hit rate {embedding_cache.hit_rate:.0%})"
+        )
+
+    # ── 5. Store (one transaction per document) ──
+    for item in items:
+        if item.error:
+            continue
+        try:
+            chunk_classifications = classify_chunks(item.chunks, item.vectors, item.document_subjects)
+            with get_db_session() as session:
+                doc = store_document(
+                    session,
+                    file_path=item.file_path,
+                    user_id=user_id,
+                    folder_id=folder_id,
+                    document_subjects=item.document_subjects,
+                    chunks=item.chunks,
+                    vectors=item.vectors,
+                    chunk_classifications=chunk_classifications,
+                    filename=item.filename,
+                )
+                item.document = doc.to_dict()
+        except Exception as e:
+            logger.error(f"[BatchIngestion] Store failed for {item.filename}: {e}", exc_info=not isinstance(e, ValueError))
+            item.error = _error_message(e)
+        item.chunks, item.vectors = [], []
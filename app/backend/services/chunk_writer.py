@@ -0,0 +1,146 @@
+"""
+Bulk writer for document_chunks rows
+Streams chunk rows through PostgreSQL COPY on the session's own connection, so
+the insert is part of the caller's transaction (commit/rollback unchanged).
+
+Methods (Config.CHUNK_INSERT_METHOD):
+- 'copy'   : COPY ... FROM STDIN (text format), rows streamed from an iterator
+- 'insert' : batched multi-row INSERT (SQLAlchemy insertmanyvalues)
+- 'orm'    : one DocumentChunk object per row (previous behaviour)
+"""
+import io
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session as DBSession
+
+from app.backend.config import Config
+from app.backend.models import DocumentChunk
+
+logger = logging.getLogger(__name__)
+
+CHUNK_COLUMNS = ("document_id", "chunk_order", "content", "embedding", "chunk_metadata")
+
+_COPY_SQL = (
+    f"COPY {DocumentChunk.__tablename__} ({', '.join(CHUNK_COLUMNS)}) "
+    "FROM STDIN WITH (FORMAT text)"
+)
+
+# COPY text format escapes (backslash first)
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_field(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def _vector_literal(vec: Sequence[float]) -> str:
+    """pgvector text input: [x1,x2,...]"""
+    if hasattr(vec, "tolist"):
+        vec = vec.tolist()
+    return "[" + ",".join(repr(float(x)) for x in vec) + "]"
+
+
+def _copy_line(row: Dict[str, Any]) -> str:
+    fields = (
+        _copy_field(row["document_id"]),
+        _copy_field(row["chunk_order"]),
+        _copy_field(row["content"]),
+        _copy_field(_vector_literal(row["embedding"]) if row.get("embedding") is not None else None),
+        _copy_field(json.dumps(row.get("chunk_metadata"), ensure_ascii=False) if row.get("chunk_metadata") is not None else None),
+    )
+    return "\t".join(fields) + "\n"
+
+
+class _CopyRowStream(io.RawIOBase):
+    """File-like object for cursor.copy_expert that encodes rows lazily (bounded memory)."""
+
+    def __init__(self, rows: Iterable[Dict[str, Any]]):
+        self._rows: Iterator[Dict[str, Any]] = iter(rows)
+        self._buf = b""
+        self.count = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buf) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._buf += _copy_line(row).encode("utf-8")
+            self.count += 1
+        if size < 0:
+            out, self._buf = self._buf, b""
+        else:
+            out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+
+def _copy_chunks(db_session: DBSession, rows: Iterable[Dict[str, Any]]) -> Optional[int]:
+    """Returns None (nothing consumed) if the driver has no COPY support."""
+    # Raw DB-API connection bound to the session's current transaction
+    dbapi_conn = db_session.connection().connection
+    with dbapi_conn.cursor() as cur:
+        if not hasattr(cur, "copy_expert"):
+            return None
+        stream = _CopyRowStream(rows)
+        cur.copy_expert(_COPY_SQL, stream, size=1 << 16)
+    return stream.count
+
+
+def _insert_chunks(db_session: DBSession, rows: Iterable[Dict[str, Any]], batch_size: int) -> int:
+    count = 0
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append({c: row.get(c) for c in CHUNK_COLUMNS})
+        if len(batch) >= batch_size:
+            db_session.execute(insert(DocumentChunk), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db_session.execute(insert(DocumentChunk), batch)
+        count += len(batch)
+    return count
+
+
+def _orm_chunks(db_session: DBSession, rows: Iterable[Dict[str, Any]]) -> int:
+    count = 0
+    for row in rows:
+        db_session.add(DocumentChunk(**{c: row.get(c) for c in CHUNK_COLUMNS}))
+        count += 1
+    db_session.flush()
+    return count
+
+
+def bulk_insert_chunks(
+    db_session: DBSession,
+    rows: Iterable[Dict[str, Any]],
+    method: Optional[str] = None,
+) -> int:
+    """
+    Insert chunk rows ({document_id, chunk_order, content, embedding, chunk_metadata})
+    inside the session's transaction. Does not commit. Returns the row count.
+
+    Note: rows written with 'copy'/'insert' bypass the identity map, so
+    Document.chunks is not populated on already-loaded Document objects.
+    """
+    method = (method or getattr(Config, "CHUNK_INSERT_METHOD", "copy") or "copy").lower()
+
+    if method == "copy":
+        # Make sure pending ORM rows (e.g. the parent Document) exist before COPY
+        db_session.flush()
+        count = _copy_chunks(db_session, rows)
+        if count is not None:
+            return count
+        logger.warning("[ChunkWriter] Driver has no COPY support, using batched INSERT")
+        method = "insert"
+
+    if method == "insert":
+        return _insert_chunks(db_session, rows, int(getattr(Config, "CHUNK_INSERT_BATCH_SIZE", 1000)))
+
+    return _orm_chunks(db_session, rows)
@@ -2,17 +2,24 @@
 Subject and topic classification service using embedding-based similarity
 Classifies documents and chunks into predefined subject/topic hierarchy
 """
-from typing import List, Dict, Optional
+import hashlib
+import json
+import os
+from typing import List, Dict, Optional, Tuple
 import numpy as np
 from sentence_transformers import SentenceTransformer
-import google.generativeai as genai
 
 from app.backend.config import Config
+from app.backend.services.llm_client import get_llm_client
 
 
 # Global cache for embeddings
-_subject_embeddings: Optional[Dict[str, List[float]]] = None
-_topic_embeddings: Optional[Dict[str, Dict[str, List[float]]]] = None
+# Rows are L2-normalized, so cosine similarity is a plain matrix product.
+_subject_names: Optional[List[str]] = None
+_subject_matrix: Optional[np.ndarray] = None          # (n_subjects, dim)
+_topic_paths: Optional[List[str]] = None              # "Topic/Subtopic", grouped by subject
+_topic_matrix: Optional[np.ndarray] = None            # (n_topics, dim)
+_topic_slices: Optional[Dict[str, slice]] = None      # subject -> rows of _topic_matrix
 _embeddings_model: Optional[SentenceTransformer] = None
 
 
@@ -31,63 +38,153 @@ def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
     return float(dot_product / (norm1 * norm2))
 
 
+def normalize_rows(vectors) -> np.ndarray:
+    """(n, dim) float32 matrix with unit-length rows (zero rows stay zero)."""
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+SUBJECT_DESCRIPTIONS = {
+    "Math": "mathematics calculus algebra geometry statistics probability equations formulas theorems proofs",
+    "Computer Science": "programming algorithms data structures software coding implementation computational complexity",
+    "Artificial Intelligence": "machine learning deep learning neural networks AI models training optimization computer vision natural language processing CNNs transformers",
+    "Physics": "mechanics dynamics energy force momentum quantum relativity electromagnetism thermodynamics particles",
+    "Chemistry": "molecules atoms reactions compounds elements bonding organic inorganic physical chemistry synthesis",
+    "Biology": "cells organisms genetics DNA RNA proteins evolution ecology species life biological systems",
+    "Language Learning": "grammar vocabulary pronunciation syntax morphology linguistics language acquisition translation",
+    "Geography": "locations maps regions climate landforms countries continents spatial earth",
+    "Economics": "markets supply demand GDP inflation prices trade financial monetary policy",
+    "Social Studies": "history politics society government culture civilization historical events",
+    "Computer Systems": "architecture hardware operating systems networks processors memory storage protocols",
+    "General": "general information knowledge topics concepts ideas"
+}
+
+
+def _subject_prompts() -> List[str]:
+    # Use keyword-rich descriptions for better semantic matching
+    return [
+        f"{subject}: {SUBJECT_DESCRIPTIONS.get(subject, subject)}"
+        for subject in Config.VALID_SUBJECTS
+    ]
+
+
+def _topic_prompts():
+    """(paths, prompts, slices) for the Subject -> Topic -> Subtopic tree."""
+    paths: List[str] = []
+    prompts: List[str] = []
+    slices: Dict[str, slice] = {}
+    for subject, tree in Config.SUBJECT_TREE.items():
+        start = len(paths)
+        for topic, subtopics in tree['topics'].items():
+            for subtopic in subtopics:
+                paths.append(f"{topic}/{subtopic}")
+                # Enhanced prompt with context
+                prompts.append(f"This text discusses {subtopic} in {topic}, which is part of {subject}.")
+        slices[subject] = slice(start, len(paths))
+    return paths, prompts, slices
+
+
+def _index_key(model_name: str, subject_prompts: List[str], topic_prompts: List[str]) -> str:
+    """Hash of everything the vectors depend on: model, subjects and the topic tree prompts."""
+    payload = json.dumps(
+        {
+            "model": model_name,
+            "subjects": list(Config.VALID_SUBJECTS),
+            "subject_prompts": subject_prompts,
+            "topic_prompts": topic_prompts,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def _index_paths(key: str) -> Tuple[str, str]:
+    base = os.path.join(Config.CLASSIFICATION_INDEX_DIR, f"classification_{key}")
+    return base + ".npy", base + ".json"
+
+
+def _load_index(key: str, expected_rows: int) -> Optional[np.ndarray]:
+    """Memory-map a saved index, or None if missing/stale/corrupt."""
+    npy_path, meta_path = _index_paths(key)
+    if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(npy_path, mmap_mode="r")
+        if meta.get("key") != key or vectors.shape[0] != expected_rows:
+            return None
+        return vectors
+    except Exception as e:
+        print(f"[Classification] Ignoring unreadable index {npy_path}: {e}")
+        return None
+
+
+def _save_index(key: str, model_name: str, vectors: np.ndarray, n_subjects: int) -> None:
+    npy_path, meta_path = _index_paths(key)
+    try:
+        os.makedirs(Config.CLASSIFICATION_INDEX_DIR, exist_ok=True)
+        # Write to temp files and rename, so a concurrent reader never sees a partial file
+        tmp_npy = f"{npy_path}.{os.getpid()}.tmp"
+        with open(tmp_npy, "wb") as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+        tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "model": model_name, "subjects": n_subjects, "rows": int(vectors.shape[0])}, f)
+        os.replace(tmp_npy, npy_path)
+        os.replace(tmp_meta, meta_path)
+        print(f"[Classification] Saved classification index → {npy_path}")
+    except OSError as e:
+        print(f"[Classification] Could not save classification index: {e}")
+
+
 def initialize_classification_embeddings(embeddings_model: SentenceTransformer):
     """
     Pre-compute embeddings for all subjects and topics.
     Called once when backend starts or when first classification is needed.
+
+    The matrices are saved under Config.CLASSIFICATION_INDEX_DIR, keyed by a hash
+    of the embedding model and the subject tree; later starts memory-map that
+    file instead of re-encoding, and any change to the model or tree produces a
+    new key (and a rebuild).
     
     Args:
         embeddings_model: The sentence transformer model to use
     """
-    global _subject_embeddings, _topic_embeddings, _embeddings_model
+    global _subject_names, _subject_matrix, _topic_paths, _topic_matrix, _topic_slices, _embeddings_model
     
-    if _subject_embeddings is not None:
+    if _subject_matrix is not None:
         return  # Already initialized
     
     _embeddings_model = embeddings_model
     print("[Classification] Initializing subject and topic embeddings...")
-    
-    # Subject embeddings with rich, descriptive prompts
-    subject_descriptions = {
-        "Math": "mathematics calculus algebra geometry statistics probability equations formulas theorems proofs",
-        "Computer Science": "programming algorithms data structures software coding implementation computational complexity",
-        "Artificial Intelligence": "machine learning deep learning neural networks AI models training optimization computer vision natural language processing CNNs transformers",
-        "Physics": "mechanics dynamics energy force momentum quantum relativity electromagnetism thermodynamics particles",
-        "Chemistry": "molecules atoms reactions compounds elements bonding organic inorganic physical chemistry synthesis",
-        "Biology": "cells organisms genetics DNA RNA proteins evolution ecology species life biological systems",
-        "Language Learning": "grammar vocabulary pronunciation syntax morphology linguistics language acquisition translation",
-        "Geography": "locations maps regions climate landforms countries continents spatial earth",
-        "Economics": "markets supply demand GDP inflation prices trade financial monetary policy",
-        "Social Studies": "history politics society government culture civilization historical events",
-        "Computer Systems": "architecture hardware operating systems networks processors memory storage protocols",
-        "General": "general information knowledge topics concepts ideas"
-    }
-    
-    _subject_embeddings = {}
-    for subject in Config.VALID_SUBJECTS:
-        # Use keyword-rich descriptions for better semantic matching
-        description = subject_descriptions.get(subject, subject)
-        prompt = f"{subject}: {description}"
-        _subject_embeddings[subject] = embeddings_model.embed_query(prompt)
-    
-    print(f"[Classification] Computed {len(_subject_embeddings)} subject embeddings")
-    
-    # Topic embeddings (hierarchical: Subject -> Topic -> Subtopic)
-    _topic_embeddings = {}
-    total_topics = 0
-    
-    for subject, tree in Config.SUBJECT_TREE.items():
-        _topic_embeddings[subject] = {}
-        
-        for topic, subtopics in tree['topics'].items():
-            for subtopic in subtopics:
-                path = f"{topic}/{subtopic}"
-                # Enhanced prompt with context
-                prompt = f"This text discusses {subtopic} in {topic}, which is part of {subject}."
-                _topic_embeddings[subject][path] = embeddings_model.embed_query(prompt)
-                total_topics += 1
-    
-    print(f"[Classification] Computed {total_topics} topic embeddings across {len(_topic_embeddings)} subjects")
+
+    topic_paths, topic_prompts, topic_slices = _topic_prompts()
+    subject_prompts = _subject_prompts()
+    model_name = getattr(embeddings_model, "model_name", None) or Config.EMBEDDING_MODEL
+    key = _index_key(model_name, subject_prompts, topic_prompts)
+    expected_rows = len(subject_prompts) + len(topic_prompts)
+
+    vectors = _load_index(key, expected_rows) if Config.CLASSIFICATION_INDEX_PERSIST else None
+    if vectors is not None:
+        print(f"[Classification] Memory-mapped cached index ({key})")
+    else:
+        # One batched encoder call for every subject and subtopic prompt
+        vectors = normalize_rows(embeddings_model.embed_documents(subject_prompts + topic_prompts))
+        if Config.CLASSIFICATION_INDEX_PERSIST:
+            _save_index(key, model_name, vectors, len(subject_prompts))
+
+    _topic_paths = topic_paths
+    _topic_slices = topic_slices
+    _topic_matrix = vectors[len(subject_prompts):]
+    _subject_names = list(Config.VALID_SUBJECTS)
+    _subject_matrix = vectors[:len(subject_prompts)]
+
+    print(f"[Classification] Computed {len(_subject_names)} subject embeddings")
+    print(f"[Classification] Computed {len(_topic_paths)} topic embeddings across {len(_topic_slices)} subjects")
     print("[Classification] Initialization complete ✓")
 
 
@@ -114,21 +211,17 @@ def classify_document_subjects(
     # Initialize embeddings if not done yet
     initialize_classification_embeddings(embeddings_model)
     
-    # Embed the sample
-    sample_embedding = embeddings_model.embed_query(content_sample)
-    
-    # Compare with pre-computed subject embeddings
-    similarities = {}
-    for subject, subj_emb in _subject_embeddings.items():
-        similarities[subject] = cosine_similarity(sample_embedding, subj_emb)
+    # Embed the sample and compare with all subject embeddings at once
+    sample_embedding = normalize_rows(embeddings_model.embed_query(content_sample))[0]
+    scores = _subject_matrix @ sample_embedding
     
     # Multi-subject: return all above threshold, sorted by confidence
+    order = np.argsort(-scores, kind="stable")
     results = [
-        {"name": subj, "confidence": float(score)}
-        for subj, score in similarities.items()
-        if score >= threshold
+        {"name": _subject_names[i], "confidence": float(scores[i])}
+        for i in order
+        if scores[i] >= threshold
     ]
-    results.sort(key=lambda x: x['confidence'], reverse=True)
     
     # Fallback to LLM classification if no embeddings match
     if not results:
@@ -139,6 +232,85 @@ def classify_document_subjects(
     return results
 
 
+def classify_chunks_topics(
+    chunk_embeddings,
+    document_subjects: List[str],
+    threshold: float = None,
+    top_k: int = 3,
+) -> List[List[Dict]]:
+    """
+    Batched classify_chunk_topics for all chunks of a document.
+
+    One (n_chunks, dim) x (dim, n_topics) product scores every chunk against
+    every topic; thresholding and per-subject top-k are vectorized.
+
+    Args:
+        chunk_embeddings: (n_chunks, dim) array or list of chunk vectors
+        document_subjects: List of subject names from document classification
+        threshold: Minimum similarity score (defaults to Config.TOPIC_SIMILARITY_THRESHOLD)
+        top_k: Topics kept per subject
+
+    Returns:
+        One classify_chunk_topics-style result list per chunk
+    """
+    if threshold is None:
+        threshold = Config.TOPIC_SIMILARITY_THRESHOLD
+
+    n_chunks = len(chunk_embeddings)
+    if _topic_matrix is None or n_chunks == 0:
+        return [[] for _ in range(n_chunks)]  # Not initialized yet
+
+    subjects = [s for s in document_subjects if s in _topic_slices and _topic_slices[s].stop > _topic_slices[s].start]
+    results: List[List[Dict]] = [[] for _ in range(n_chunks)]
+    if not subjects:
+        return results
+
+    # Only the rows for this document's subjects take part in the product
+    rows = np.concatenate([np.arange(_topic_slices[s].start, _topic_slices[s].stop) for s in subjects])
+    scores = normalize_rows(chunk_embeddings) @ _topic_matrix[rows].T   # (n_chunks, n_rows)
+
+    offset = 0
+    for subject in subjects:
+        sl = _topic_slices[subject]
+        width = sl.stop - sl.start
+        block = scores[:, offset: offset + width]
+        offset += width
+
+        k = min(top_k, width)
+        # Top-k per chunk: argpartition, then order those k columns by score (stable on ties)
+        if k < width:
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top.sort(axis=1)
+        else:
+            top = np.tile(np.arange(width), (n_chunks, 1))
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        keep = top_scores >= threshold
+        kept_counts = keep.sum(axis=1)
+
+        for i in np.nonzero(kept_counts)[0]:
+            n = int(kept_counts[i])
+            topics = []
+            for j in range(n):
+                # path format: "Calculus/Derivatives"
+                parts = _topic_paths[sl.start + int(top[i, j])].split('/')
+                topics.append({
+                    "name": parts[0],
+                    "subtopic": parts[1] if len(parts) > 1 else None,
+                    "confidence": float(top_scores[i, j])
+                })
+            results[i].append({
+                "name": subject,
+                # Average confidence of this subject's top topics
+                "confidence": float(top_scores[i, :n].mean()),
+                "topics": topics
+            })
+
+    return results
+
+
 def classify_chunk_topics(
     chunk_content: str,
     chunk_embedding: List[float],
@@ -147,6 +319,7 @@ def classify_chunk_topics(
 ) -> List[Dict]:
     """
     Classify chunk topics within known document subjects.
+    Single-chunk form of classify_chunks_topics().
     
     Args:
         chunk_content: The chunk text content
@@ -165,47 +338,7 @@ def classify_chunk_topics(
             ]
         }, ...]
     """
-    if threshold is None:
-        threshold = Config.TOPIC_SIMILARITY_THRESHOLD
-    
-    if not _topic_embeddings:
-        return []  # Not initialized yet
-    
-    results = []
-    
-    for subject in document_subjects:
-        subject_topics = _topic_embeddings.get(subject, {})
-        if not subject_topics:
-            continue
-        
-        topic_scores = []
-        
-        for topic_tree_path, topic_emb in subject_topics.items():
-            # topic_tree_path format: "Calculus/Derivatives"
-            similarity = cosine_similarity(chunk_embedding, topic_emb)
-            
-            if similarity >= threshold:
-                parts = topic_tree_path.split('/')
-                topic_scores.append({
-                    "name": parts[0],
-                    "subtopic": parts[1] if len(parts) > 1 else None,
-                    "confidence": float(similarity)
-                })
-        
-        if topic_scores:
-            # Sort by confidence and keep top 3
-            topic_scores.sort(key=lambda x: x['confidence'], reverse=True)
-            
-            # Calculate average confidence for this subject's topics
-            avg_confidence = sum(t['confidence'] for t in topic_scores[:3]) / min(len(topic_scores), 3)
-            
-            results.append({
-                "name": subject,
-                "confidence": float(avg_confidence),
-                "topics": topic_scores[:3]  # Top 3 topics per subject
-            })
-    
-    return results
+    return classify_chunks_topics([chunk_embedding], document_subjects, threshold=threshold)[0]
 
 
 def llm_classify_subject_fallback(content_sample: str) -> str:
@@ -219,9 +352,6 @@ def llm_classify_subject_fallback(content_sample: str) -> str:
         Subject name (validated against VALID_SUBJECTS)
     """
     try:
-        # Configure Gemini
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        
         prompt = f"""Classify this text into ONE category from this list:
 {', '.join(Config.VALID_SUBJECTS)}
 
@@ -230,8 +360,7 @@ Text sample:
 
 Return ONLY the category name, nothing else."""
         
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
+        response = get_llm_client().generate(prompt, task='classification', model='gemini-2.5-flash')
         predicted = response.text.strip()
         
         # Validate against known subjects
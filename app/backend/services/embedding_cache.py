@@ -0,0 +1,292 @@
+"""
+Two-tier content-addressed embedding cache
+Tier 1: in-process LRU. Tier 2: the embedding_cache table in Postgres.
+
+Keys are (model name, sha256 of whitespace-normalized text), so re-uploaded
+documents, repeated questions and repeated quiz queries skip the encoder, and
+a model change never serves stale vectors.
+
+Writes to Postgres (new vectors, last_used_at of rows that were hit) are
+queued to a background writer thread and are best-effort: a full queue drops
+the batch instead of blocking the request. The same thread prunes the table
+every EMBEDDING_CACHE_PRUNE_INTERVAL_S (rows unused for EMBEDDING_CACHE_TTL_DAYS,
+then the least recently used beyond EMBEDDING_CACHE_MAX_ROWS).
+"""
+import hashlib
+import logging
+import queue
+import threading
+import time
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import func, text as sql_text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.backend.config import Config
+from app.backend.database import session_factory
+from app.backend.models import EmbeddingCacheEntry
+from app.backend.services.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC + collapsed whitespace; the encoder output does not depend on either."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain Embeddings wrapper: looks up the LRU, then Postgres, and only
+    encodes what is missing (in one batched call). New vectors are written
+    back to both tiers.
+
+    on_encode(n_texts, seconds) is called after each real encoder call, so
+    throughput estimates never count cache hits.
+    """
+
+    def __init__(
+        self,
+        base: Embeddings,
+        model_name: str,
+        lru_size: int,
+        persist: bool = True,
+        on_encode: Optional[Callable[[int, float], None]] = None,
+    ):
+        self.base = base
+        self.on_encode = on_encode
+        self.model_name = model_name
+        self.persist = persist
+        self._lru = LRUCache(lru_size)
+        self._lock = threading.Lock()
+        self.db_hits = 0
+        self.encoded = 0
+        self.writes_dropped = 0
+        self.pruned = 0
+        self._writes: "queue.Queue" = queue.Queue(maxsize=max(1, Config.EMBEDDING_CACHE_WRITE_QUEUE))
+        self._writer: Optional[threading.Thread] = None
+
+    # ── Postgres tier ────────────────────────────────────────────────────
+    def _db_lookup(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        if not self.persist or not hashes:
+            return {}
+        db = session_factory()
+        try:
+            rows = (
+                db.query(EmbeddingCacheEntry.text_hash, EmbeddingCacheEntry.embedding)
+                .filter(
+                    EmbeddingCacheEntry.model_name == self.model_name,
+                    EmbeddingCacheEntry.text_hash.in_(hashes),
+                )
+                .all()
+            )
+            return {h: np.asarray(vec, dtype=np.float32) for h, vec in rows}
+        except Exception as e:
+            logger.warning(f"[EmbeddingCache] DB lookup failed, encoding instead: {e}")
+            return {}
+        finally:
+            db.close()
+
+    def _db_store(self, vectors: Dict[str, np.ndarray]) -> None:
+        self._enqueue("store", {h: vec.tolist() for h, vec in vectors.items()})
+
+    def _db_touch(self, hashes: List[str]) -> None:
+        self._enqueue("touch", list(hashes))
+
+    def _enqueue(self, kind: str, payload) -> None:
+        """Hand a write to the background writer; never blocks the caller."""
+        if not self.persist or not payload:
+            return
+        self._ensure_writer()
+        try:
+            self._writes.put_nowait((kind, payload))
+        except queue.Full:
+            with self._lock:
+                self.writes_dropped += 1
+
+    def _ensure_writer(self) -> None:
+        # Threads do not survive fork: a preloaded worker starts its own
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(
+                    target=self._writer_loop, name="embedding-cache-writer", daemon=True
+                )
+                self._writer.start()
+
+    def _writer_loop(self) -> None:
+        interval = Config.EMBEDDING_CACHE_PRUNE_INTERVAL_S  # <= 0 disables pruning
+        next_prune = time.monotonic() + interval if interval > 0 else float("inf")
+        while True:
+            timeout = None if interval <= 0 else max(0.0, next_prune - time.monotonic())
+            try:
+                kind, payload = self._writes.get(timeout=timeout)
+            except queue.Empty:
+                kind, payload = None, None
+            if kind == "store":
+                self._write_vectors(payload)
+            elif kind == "touch":
+                self._write_last_used(payload)
+            if time.monotonic() >= next_prune:
+                self.prune()
+                next_prune = time.monotonic() + interval
+
+    def _write_vectors(self, vectors: Dict[str, List[float]]) -> None:
+        db = session_factory()
+        try:
+            rows = [
+                {"model_name": self.model_name, "text_hash": h, "embedding": vec}
+                for h, vec in vectors.items()
+            ]
+            db.execute(pg_insert(EmbeddingCacheEntry).values(rows).on_conflict_do_nothing())
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[EmbeddingCache] DB write failed: {e}")
+        finally:
+            db.close()
+
+    def _write_last_used(self, hashes: List[str]) -> None:
+        db = session_factory()
+        try:
+            (
+                db.query(EmbeddingCacheEntry)
+                .filter(
+                    EmbeddingCacheEntry.model_name == self.model_name,
+                    EmbeddingCacheEntry.text_hash.in_(hashes),
+                )
+                .update({EmbeddingCacheEntry.last_used_at: func.now()}, synchronize_session=False)
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[EmbeddingCache] last_used_at update failed: {e}")
+        finally:
+            db.close()
+
+    def prune(self) -> int:
+        """Delete expired rows, then the least recently used beyond the row cap; returns rows deleted."""
+        db = session_factory()
+        try:
+            deleted = db.execute(
+                sql_text(
+                    "DELETE FROM embedding_cache "
+                    "WHERE last_used_at < now() - make_interval(secs => :ttl_s)"
+                ),
+                {"ttl_s": Config.EMBEDDING_CACHE_TTL_DAYS * 86400},
+            ).rowcount or 0
+            if Config.EMBEDDING_CACHE_MAX_ROWS > 0:
+                deleted += db.execute(
+                    sql_text(
+                        "DELETE FROM embedding_cache WHERE (model_name, text_hash) IN ("
+                        "SELECT model_name, text_hash FROM embedding_cache "
+                        "ORDER BY last_used_at DESC NULLS LAST OFFSET :max_rows)"
+                    ),
+                    {"max_rows": Config.EMBEDDING_CACHE_MAX_ROWS},
+                ).rowcount or 0
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[EmbeddingCache] Prune failed: {e}")
+            return 0
+        finally:
+            db.close()
+        if deleted:
+            logger.info(f"[EmbeddingCache] Pruned {deleted} row(s)")
+        with self._lock:
+            self.pruned += deleted
+        return deleted
+
+    # ── Embeddings interface ─────────────────────────────────────────────
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        hashes = [text_hash(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        for h in dict.fromkeys(hashes):
+            vec = self._lru.get(h)
+            if vec is not None:
+                found[h] = vec
+
+        missing = [h for h in dict.fromkeys(hashes) if h not in found]
+        if missing:
+            from_db = self._db_lookup(missing)
+            for h, vec in from_db.items():
+                self._lru.put(h, vec)
+            found.update(from_db)
+            with self._lock:
+                self.db_hits += len(from_db)
+            self._db_touch(list(from_db))
+
+        to_encode: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in found and h not in to_encode:
+                to_encode[h] = t
+        if to_encode:
+            t0 = time.perf_counter()
+            encoded = np.asarray(self.base.embed_documents(list(to_encode.values())), dtype=np.float32)
+            if self.on_encode is not None:
+                self.on_encode(len(to_encode), time.perf_counter() - t0)
+            new_vectors = dict(zip(to_encode.keys(), encoded))
+            for h, vec in new_vectors.items():
+                self._lru.put(h, vec)
+            found.update(new_vectors)
+            with self._lock:
+                self.encoded += len(new_vectors)
+            self._db_store(new_vectors)
+
+        return [found[h].tolist() for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> Dict:
+        lru = self._lru.stats()
+        with self._lock:
+            db_hits, encoded = self.db_hits, self.encoded
+        lookups = lru["hits"] + lru["misses"]
+        return {
+            "model_name": self.model_name,
+            "lru": lru,
+            "db_hits": db_hits,
+            "misses": encoded,  # texts that had to go through the encoder
+            "hit_rate": round((lru["hits"] + db_hits) / lookups, 3) if lookups else None,
+            "persist": self.persist,
+            "pending_writes": self._writes.qsize(),
+            "writes_dropped": self.writes_dropped,
+            "pruned": self.pruned,
+        }
+
+
+_cached: Optional[CachedEmbeddings] = None
+_cached_lock = threading.Lock()
+
+
+def get_cached_embeddings(
+    base: Embeddings,
+    on_encode: Optional[Callable[[int, float], None]] = None,
+) -> CachedEmbeddings:
+    """Process-wide cache around the given base encoder (created once)."""
+    global _cached
+    with _cached_lock:
+        if _cached is None or _cached.base is not base:
+            _cached = CachedEmbeddings(
+                base=base,
+                # ONNX embedders report a backend-qualified name, so INT8 and FP32 vectors never mix
+                model_name=getattr(base, "model_name", None) or Config.EMBEDDING_MODEL,
+                lru_size=Config.EMBEDDING_CACHE_LRU_SIZE,
+                persist=Config.EMBEDDING_CACHE_PERSIST,
+                on_encode=on_encode,
+            )
+    return _cached
+
+
+def get_embedding_cache_stats() -> Optional[Dict]:
+    return _cached.stats() if _cached is not None else None
@@ -1,14 +1,15 @@
 """
 Gemini-based answer generation service
-Generates contextual answers using Google's Gemini API
+Generates contextual answers and quizzes through the LLM client (Gemini by
+default, see llm_client.py)
 """
 import re
 import json
 import logging
-from typing import List, Dict, Optional
-import google.generativeai as genai
+from typing import Iterator, List, Dict, Optional
 
 from app.backend.config import Config
+from app.backend.services.llm_client import get_llm_client
 # Import formatting functions from modular prompt_builder
 from app.backend.services.prompt_builder import (
     format_context_section as format_context,
@@ -16,16 +17,8 @@ from app.backend.services.prompt_builder import (
 )
 
 logger = logging.getLogger(__name__)
-# Configure Gemini API once
-_configured = False
 
 
-def configure_gemini():
-    """Configure Gemini API with API key from config"""
-    global _configured
-    if not _configured:
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        _configured = True
 def _strip_code_fences(text: str) -> str:
     if not text:
         return ""
@@ -132,6 +125,50 @@ def _validate_quiz_data(quiz_data: dict, expected_questions: int) -> dict:
 
     return {"questions": normalized[:expected_questions]}
 
+def _answer_generation_config() -> Dict:
+    return {
+        'temperature': Config.LLM_TEMPERATURE,
+        'max_output_tokens': Config.MAX_TOKENS,
+    }
+
+
+def _generation_error_answer(e: Exception) -> str:
+    error_msg = f"Error generating response: {str(e)}"
+    return (
+        "I apologize, but I encountered an error while generating the response. "
+        "Please try rephrasing your question or contact support if the issue persists.\n\n"
+        f"Error details: {error_msg}"
+    )
+
+
+def build_answer_prompt(
+    question: str,
+    context_chunks: List[Dict],
+    conversation_history: Optional[List[Dict]] = None,
+    subject_context: Optional[Dict] = None,
+    language_info: Optional[Dict] = None,
+    web_enabled: bool = False,
+    diagram_enabled: bool = False,
+    web_requested: bool = False,
+    diagram_requested: bool = False,
+) -> str:
+    # Import here to avoid circular dependency
+    from app.backend.services.prompt_builder import build_prompt
+
+    # Dynamic prompt assembly
+    return build_prompt(
+        question=question,
+        context_chunks=context_chunks,
+        conversation_history=conversation_history,
+        subject_context=subject_context,
+        language_info=language_info,
+        web_enabled=web_enabled,
+        diagram_enabled=diagram_enabled,
+        web_requested=web_requested,
+        diagram_requested=diagram_requested,
+    )
+
+
 def generate_answer(
     question: str,
     context_chunks: List[Dict],
@@ -160,14 +197,9 @@ def generate_answer(
             - answer: Generated answer text
             - model_used: Model identifier
             - finish_reason: Completion status
+            - prompt_chars: Prompt length (for tracing)
     """
-    configure_gemini()
-
-    # Import here to avoid circular dependency
-    from app.backend.services.prompt_builder import build_prompt
-    
-    # Dynamic prompt assembly
-    prompt = build_prompt(
+    prompt = build_answer_prompt(
         question=question,
         context_chunks=context_chunks,
         conversation_history=conversation_history,
@@ -179,38 +211,70 @@ def generate_answer(
         diagram_requested=diagram_requested,
     )
 
-    # Initialize model
-    model = genai.GenerativeModel(
-        model_name=Config.LLM_MODEL,
-        generation_config={
-            'temperature': Config.LLM_TEMPERATURE,
-            'max_output_tokens': Config.MAX_TOKENS,
-        }
-    )
-
     # Generate response
     try:
-        response = model.generate_content(prompt)
+        response = get_llm_client().generate(
+            prompt,
+            task='answer',
+            model=Config.LLM_MODEL,
+            generation_config=_answer_generation_config(),
+        )
 
         return {
             'answer': response.text,
             'model_used': Config.LLM_MODEL,
-            'finish_reason': getattr(response, 'finish_reason', 'COMPLETED')
+            'finish_reason': response.finish_reason,
+            'prompt_chars': len(prompt),
         }
 
     except Exception as e:
         # Handle API errors gracefully
-        error_msg = f"Error generating response: {str(e)}"
         return {
-            'answer': (
-                "I apologize, but I encountered an error while generating the response. "
-                "Please try rephrasing your question or contact support if the issue persists.\n\n"
-                f"Error details: {error_msg}"
-            ),
+            'answer': _generation_error_answer(e),
             'model_used': Config.LLM_MODEL,
-            'finish_reason': 'ERROR'
+            'finish_reason': 'ERROR',
+            'prompt_chars': len(prompt),
         }
-    
+
+
+def stream_answer(result: Dict, **prompt_kwargs) -> Iterator[str]:
+    """
+    Streaming variant of generate_answer: yields answer text deltas as the LLM
+    produces them. Takes the same keyword arguments as generate_answer; when
+    the generator is exhausted, `result` holds the same dict generate_answer
+    returns (answer, model_used, finish_reason, prompt_chars).
+
+    An error before the first delta yields the same apology text as
+    generate_answer; an error mid-stream ends the answer where it stopped.
+    """
+    prompt = build_answer_prompt(**prompt_kwargs)
+    parts: List[str] = []
+    finish_reason = 'COMPLETED'
+    try:
+        for delta in get_llm_client().stream(
+            prompt,
+            task='answer',
+            model=Config.LLM_MODEL,
+            generation_config=_answer_generation_config(),
+        ):
+            parts.append(delta)
+            yield delta
+    except Exception as e:
+        logger.warning(f"[Generation] Streaming failed after {len(parts)} deltas: {e}")
+        finish_reason = 'ERROR'
+        if not parts:
+            apology = _generation_error_answer(e)
+            parts.append(apology)
+            yield apology
+
+    result.update({
+        'answer': ''.join(parts),
+        'model_used': Config.LLM_MODEL,
+        'finish_reason': finish_reason,
+        'prompt_chars': len(prompt),
+    })
+
+
 def build_quiz_prompt(
     num_questions: int,
     difficulty: str,
@@ -318,8 +382,6 @@ def generate_quiz(
         - model_used: Model identifier
         OR raises ValueError on parse failure
     """
-    configure_gemini()   # reuse existing helper — no-op if already configured
-
     prompt = build_quiz_prompt(
         num_questions  = num_questions,
         difficulty     = difficulty,
@@ -328,17 +390,17 @@ def generate_quiz(
         context_chunks = context_chunks,
     )
 
-    model = genai.GenerativeModel(
-        model_name        = Config.LLM_MODEL,
-        generation_config = {
-            'temperature':      0.4,
-            'max_output_tokens': 8192,
-        }
-    )
-
     try:
-        response = model.generate_content(prompt)
-        raw      = response.text.strip()
+        response = get_llm_client().generate(
+            prompt,
+            task              = 'quiz',
+            model             = Config.LLM_MODEL,
+            generation_config = {
+                'temperature':      0.4,
+                'max_output_tokens': 8192,
+            },
+        )
+        raw = response.text.strip()
     except Exception as e:
         logger.error(f'[Quiz] Gemini API error: {e}')
         raise RuntimeError(f'Gemini API call failed: {e}') from e
@@ -0,0 +1,308 @@
+"""
+Background ingestion job queue
+Uploads are recorded as rows in ingestion_jobs and processed by a pool of worker
+threads, so the upload request returns immediately and queued/running jobs survive
+a process restart.
+
+Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so several processes
+(e.g. gunicorn workers) can share the same queue without double-processing.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from app.backend.config import Config
+from app.backend.database import session_factory, get_db_session
+from app.backend.models import IngestionJob
+from app.backend.services.injestion import INGESTION_STAGES, run_ingestion_pipeline
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+
+@contextmanager
+def _job_session():
+    """
+    Short-lived session independent of the thread's scoped session.
+    The pipeline holds its own transaction open for the whole run; progress
+    updates must commit separately so pollers can see them.
+    """
+    db = session_factory()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _initial_progress() -> Dict:
+    return {stage: {'status': 'pending'} for stage in INGESTION_STAGES}
+
+
+# ──────────────────────────────────────────────────────────────────────────
+# Queue operations
+# ──────────────────────────────────────────────────────────────────────────
+
+def enqueue_ingestion_job(
+    db_session,
+    *,
+    file_path: str,
+    filename: str,
+    user_id: Optional[int] = None,
+    subject: Optional[str] = None,
+    folder_id: Optional[int] = None,
+) -> IngestionJob:
+    """Insert a queued job. The caller commits; call notify_ingestion_workers() afterwards."""
+    job = IngestionJob(
+        user_id=user_id,
+        folder_id=folder_id,
+        filename=filename,
+        file_path=file_path,
+        subject=subject,
+        status=JOB_QUEUED,
+        progress=_initial_progress(),
+        attempts=0,
+    )
+    db_session.add(job)
+    db_session.flush()
+    return job
+
+
+def _claim_next_job() -> Optional[int]:
+    """Atomically move the oldest queued job to running. Returns its id, or None."""
+    with _job_session() as db:
+        job = (
+            db.query(IngestionJob)
+            .filter(IngestionJob.status == JOB_QUEUED)
+            .order_by(IngestionJob.created_at, IngestionJob.id)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = JOB_RUNNING
+        job.started_at = datetime.utcnow()
+        job.attempts = (job.attempts or 0) + 1
+        job.error = None
+        job.progress = _initial_progress()
+        return job.id
+
+
+def _update_job(job_id: int, **fields) -> None:
+    with _job_session() as db:
+        job = db.get(IngestionJob, job_id)
+        if job is None:
+            return
+        for key, value in fields.items():
+            setattr(job, key, value)
+        job.updated_at = datetime.utcnow()
+
+
+class _JobProgressReporter:
+    """progress_callback for run_ingestion_pipeline that persists each stage update."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.progress = _initial_progress()
+
+    def __call__(self, stage: str, status: str, **details) -> None:
+        entry = dict(self.progress.get(stage) or {})
+        entry.update(details)
+        entry['status'] = status
+        now = datetime.utcnow().isoformat()
+        if status == 'running':
+            entry.setdefault('started_at', now)
+        elif status == 'completed':
+            entry['finished_at'] = now
+        self.progress[stage] = entry
+        # Reassign a fresh dict so SQLAlchemy detects the JSONB change
+        _update_job(self.job_id, stage=stage, progress=dict(self.progress))
+
+
+def _run_job(job_id: int) -> None:
+    with _job_session() as db:
+        job = db.get(IngestionJob, job_id)
+        if job is None:
+            return
+        params = {
+            'file_path': job.file_path,
+            'user_id': job.user_id,
+            'subject': job.subject,
+            'folder_id': job.folder_id,
+        }
+        filename = job.filename
+
+    logger.info(f"[IngestionJobs] Job {job_id} started: {filename}")
+    reporter = _JobProgressReporter(job_id)
+    try:
+        with get_db_session() as db:
+            doc = run_ingestion_pipeline(db_session=db, progress_callback=reporter, **params)
+            document_id = doc.id
+    except Exception as e:
+        logger.error(f"[IngestionJobs] Job {job_id} failed: {e}", exc_info=not isinstance(e, ValueError))
+        _update_job(
+            job_id,
+            status=JOB_FAILED,
+            error=str(e) if isinstance(e, ValueError) else f"Ingestion failed: {e}",
+            finished_at=datetime.utcnow(),
+        )
+        return
+
+    _update_job(job_id, status=JOB_COMPLETED, document_id=document_id, finished_at=datetime.utcnow())
+    logger.info(f"[IngestionJobs] Job {job_id} completed → document_id={document_id}")
+
+
+def requeue_stale_jobs(stale_after_s: Optional[float] = None) -> int:
+    """
+    Requeue running jobs whose heartbeat (updated_at) is older than stale_after_s,
+    i.e. jobs orphaned by a crashed or restarted worker process.
+    Jobs that already used INGESTION_JOB_MAX_ATTEMPTS are marked failed instead.
+    """
+    if stale_after_s is None:
+        stale_after_s = Config.INGESTION_JOB_STALE_AFTER_S
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after_s)
+
+    requeued = 0
+    with _job_session() as db:
+        stale_jobs = (
+            db.query(IngestionJob)
+            .filter(IngestionJob.status == JOB_RUNNING, IngestionJob.updated_at < cutoff)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for job in stale_jobs:
+            if (job.attempts or 0) >= Config.INGESTION_JOB_MAX_ATTEMPTS:
+                job.status = JOB_FAILED
+                job.error = f"Worker stopped responding after {job.attempts} attempt(s)"
+                job.finished_at = datetime.utcnow()
+            else:
+                job.status = JOB_QUEUED
+                requeued += 1
+    if stale_jobs:
+        logger.warning(f"[IngestionJobs] Recovered {len(stale_jobs)} stale job(s), {requeued} requeued")
+    return requeued
+
+
+# ──────────────────────────────────────────────────────────────────────────
+# Worker pool
+# ──────────────────────────────────────────────────────────────────────────
+
+class IngestionWorkerPool:
+    """
+    Fixed pool of daemon worker threads plus one supervisor thread.
+
+    - Workers sleep until notified (or the poll interval elapses), then claim and run jobs.
+    - The supervisor heartbeats jobs running in this process and requeues stale ones.
+    """
+
+    def __init__(self, num_workers: int, poll_interval_s: float):
+        self.num_workers = max(1, int(num_workers))
+        self.poll_interval_s = poll_interval_s
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._active_lock = threading.Lock()
+        self._active_jobs: set = set()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        # Jobs left "running" by a previous process have no live heartbeat.
+        try:
+            requeue_stale_jobs()
+        except Exception as e:
+            logger.warning(f"[IngestionJobs] Stale job recovery failed: {e}")
+
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._worker_loop, name=f"ingestion-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        sup = threading.Thread(target=self._supervisor_loop, name="ingestion-supervisor", daemon=True)
+        sup.start()
+        self._threads.append(sup)
+        self._wakeup.set()
+        logger.info(f"[IngestionJobs] Started {self.num_workers} ingestion worker(s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def active_job_ids(self) -> List[int]:
+        with self._active_lock:
+            return sorted(self._active_jobs)
+
+    def _worker_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(timeout=self.poll_interval_s)
+            if self._stop.is_set():
+                return
+            try:
+                job_id = _claim_next_job()
+            except Exception as e:
+                logger.warning(f"[IngestionJobs] Claim failed: {e}")
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.clear()
+                continue
+
+            # More jobs may be waiting; let idle siblings check too.
+            self._wakeup.set()
+            with self._active_lock:
+                self._active_jobs.add(job_id)
+            try:
+                _run_job(job_id)
+            finally:
+                with self._active_lock:
+                    self._active_jobs.discard(job_id)
+
+    def _supervisor_loop(self) -> None:
+        while not self._stop.wait(timeout=self.poll_interval_s * 5):
+            try:
+                active = self.active_job_ids()
+                if active:
+                    with _job_session() as db:
+                        (
+                            db.query(IngestionJob)
+                            .filter(IngestionJob.id.in_(active), IngestionJob.status == JOB_RUNNING)
+                            .update({IngestionJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+                        )
+                if requeue_stale_jobs():
+                    self.notify()
+            except Exception as e:
+                logger.warning(f"[IngestionJobs] Supervisor tick failed: {e}")
+
+
+_pool: Optional[IngestionWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def start_ingestion_workers() -> IngestionWorkerPool:
+    """Start the process-wide worker pool once."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = IngestionWorkerPool(
+                num_workers=Config.INGESTION_WORKERS,
+                poll_interval_s=Config.INGESTION_JOB_POLL_INTERVAL_S,
+            )
+            _pool.start()
+    return _pool
+
+
+def notify_ingestion_workers() -> None:
+    """Wake idle workers after a job is committed (no-op if workers are disabled here)."""
+    if _pool is not None:
+        _pool.notify()
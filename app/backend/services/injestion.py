@@ -1,8 +1,16 @@
 # app/backend/services/ingestion.py
+import hashlib
+import math
 import os
 import re
-from typing import List, Optional, Dict, Any
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Dict, Any, Callable, Iterator, Tuple
 from collections import defaultdict
+from itertools import chain, islice
+
+import numpy as np
 
 try:
     import fitz  # PyMuPDF
@@ -11,35 +19,210 @@ except ImportError:
     PYMUPDF_AVAILABLE = False
 
 from langchain_core.documents import Document as LCDocument
+from langchain_core.embeddings import Embeddings
 from langchain_community.document_loaders import (
     PDFPlumberLoader,
     Docx2txtLoader,
 )
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
+from sqlalchemy import text as sql_text
 from sqlalchemy.orm import Session as DBSession
 from pptx import Presentation
 
 from app.backend.config import Config
-from app.backend.models import Document, DocumentChunk
-from app.backend.services import classification
+from app.backend.models import Document
+from app.backend.services import classification, onnx_backend
+from app.backend.services.embedding_cache import CachedEmbeddings, get_cached_embeddings
+from app.backend.services.chunk_writer import bulk_insert_chunks
 
 # ── Singleton: model loaded once at startup ───────────────────────────────
-_embeddings: Optional[HuggingFaceEmbeddings] = None
+_embeddings: Optional[Embeddings] = None
+
+
+def embedding_batch_size() -> int:
+    """
+    Encoder batch size. Larger batches keep every core busy in torch's intra-op
+    pool; default scales with the CPU count unless EMBEDDING_BATCH_SIZE is set.
+    """
+    configured = getattr(Config, "EMBEDDING_BATCH_SIZE", 0) or 0
+    if configured > 0:
+        return int(configured)
+    return max(32, min(256, 16 * (os.cpu_count() or 1)))
 
 
-def get_embeddings() -> HuggingFaceEmbeddings:
-    """Lazy-load the HuggingFace embedding model once."""
+def get_base_embeddings() -> Embeddings:
+    """
+    Lazy-load the embedding model once (no caching layer): the HuggingFace
+    FP32 model, or its INT8 ONNX export when EMBEDDING_BACKEND=onnx.
+    """
     global _embeddings
+    if _embeddings is None and onnx_backend.resolve_backend(Config.EMBEDDING_BACKEND) == "onnx":
+        model = onnx_backend.load_onnx_model(Config.EMBEDDING_MODEL, "embedding")
+        if model is not None:
+            _embeddings = onnx_backend.OnnxEmbeddings(model, Config.EMBEDDING_MODEL, batch_size=embedding_batch_size())
     if _embeddings is None:
         _embeddings = HuggingFaceEmbeddings(
             model_name=Config.EMBEDDING_MODEL,
             model_kwargs={"device": "cpu"},
-            encode_kwargs={"normalize_embeddings": True},
+            encode_kwargs={"normalize_embeddings": True, "batch_size": embedding_batch_size()},
         )
     return _embeddings
 
 
+def embeddings_loaded() -> bool:
+    """Whether the embedding model is in memory (the next call will not load it)."""
+    return _embeddings is not None
+
+
+def get_embeddings() -> Embeddings:
+    """
+    Embedding model used by ingestion, query and quiz.
+    Wrapped in the persistent content-addressed cache unless EMBEDDING_CACHE_ENABLED is off.
+    """
+    base = get_base_embeddings()
+    if not Config.EMBEDDING_CACHE_ENABLED:
+        return base
+    return get_cached_embeddings(base, on_encode=embedding_throughput.record)
+
+
+class EmbeddingThroughput:
+    """
+    Running estimate of encoder throughput (texts/second), used to predict
+    semantic-chunking cost. Only texts the model actually encoded are recorded
+    (see _encode_texts): cache hits would inflate the rate.
+    """
+
+    def __init__(self, default_rate: float, alpha: float = 0.3, min_batch: int = 16):
+        self.default_rate = default_rate
+        self.alpha = alpha
+        self.min_batch = min_batch  # tiny batches are dominated by overhead
+        self._rate: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, n_texts: int, seconds: float) -> None:
+        if n_texts < self.min_batch or seconds <= 0:
+            return
+        rate = n_texts / seconds
+        with self._lock:
+            self._rate = rate if self._rate is None else (1 - self.alpha) * self._rate + self.alpha * rate
+
+    def texts_per_second(self) -> float:
+        with self._lock:
+            return self._rate if self._rate is not None else self.default_rate
+
+
+embedding_throughput = EmbeddingThroughput(Config.CHUNKING_DEFAULT_UNITS_PER_S)
+
+
+def _encode_texts(texts: List[str]) -> np.ndarray:
+    """Embed texts → float32 matrix, feeding embedding_throughput with real encoder work only."""
+    emb = get_embeddings()
+    if isinstance(emb, CachedEmbeddings):
+        # The cache times its own encoder calls (on_encode) and skips hits
+        return np.asarray(emb.embed_documents(texts), dtype=np.float32)
+    t0 = time.perf_counter()
+    vectors = np.asarray(emb.embed_documents(texts), dtype=np.float32)
+    embedding_throughput.record(len(texts), time.perf_counter() - t0)
+    return vectors
+
+
+# ──────────────────────────────────────────────────────────────────────────
+# Per-ingestion embedding cache
+# ──────────────────────────────────────────────────────────────────────────
+
+class IngestionEmbeddingCache:
+    """
+    Content-hash → vector cache scoped to one ingestion run.
+
+    Semantic chunking embeds units; a final chunk that is a single unit (or has the
+    same text as one) reuses that vector instead of going through the encoder again.
+    Chunks packed from several units can optionally use the length-weighted mean of
+    their unit vectors (Config.INGESTION_POOLED_CHUNK_EMBEDDINGS).
+    """
+
+    def __init__(self, pool_multi_unit_chunks: Optional[bool] = None):
+        if pool_multi_unit_chunks is None:
+            pool_multi_unit_chunks = bool(getattr(Config, "INGESTION_POOLED_CHUNK_EMBEDDINGS", False))
+        self.pool_multi_unit_chunks = pool_multi_unit_chunks
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._composites: Dict[str, List[str]] = {}  # chunk key → unit keys
+        self._unit_lengths: Dict[str, int] = {}
+        self.hits = 0
+        self.pooled = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1((text or "").strip().encode("utf-8")).hexdigest()
+
+    def register_composite(self, chunk_text: str, unit_texts: List[str]) -> None:
+        """Remember which units a packed chunk was built from (for the pooled path)."""
+        if len(unit_texts) < 2:
+            return
+        unit_keys = []
+        for u in unit_texts:
+            k = self.key(u)
+            self._unit_lengths[k] = len(u)
+            unit_keys.append(k)
+        self._composites[self.key(chunk_text)] = unit_keys
+
+    def rekey_composite(self, old_text: str, new_text: str) -> None:
+        """Follow a chunk whose text was rewritten after packing (cleaning) to its new key."""
+        old_key, new_key = self.key(old_text), self.key(new_text)
+        if old_key != new_key and old_key in self._composites:
+            self._composites[new_key] = self._composites.pop(old_key)
+
+    def _pooled_vector(self, key: str) -> Optional[np.ndarray]:
+        unit_keys = self._composites.get(key)
+        if not unit_keys or any(k not in self._vectors for k in unit_keys):
+            return None
+        weights = np.asarray([self._unit_lengths.get(k, 1) for k in unit_keys], dtype=np.float32)
+        mean = (np.stack([self._vectors[k] for k in unit_keys]) * weights[:, None]).sum(axis=0)
+        norm = float(np.linalg.norm(mean))
+        return mean / norm if norm > 0 else None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Return a (len(texts), dim) matrix, encoding only texts not seen before (deduplicated)."""
+        if not texts:
+            return np.zeros((0, Config.EMBEDDING_DIMENSION), dtype=np.float32)
+
+        keys = [self.key(t) for t in texts]
+        pending: Dict[str, str] = {}
+        for k, t in zip(keys, texts):
+            if k in self._vectors or k in pending:
+                self.hits += 1
+                continue
+            if self.pool_multi_unit_chunks:
+                pooled = self._pooled_vector(k)
+                if pooled is not None:
+                    self._vectors[k] = pooled
+                    self.pooled += 1
+                    continue
+            pending[k] = t
+            self.misses += 1
+
+        if pending:
+            encoded = _encode_texts(list(pending.values()))
+            for k, vec in zip(pending.keys(), encoded):
+                self._vectors[k] = vec
+
+        return np.stack([self._vectors[k] for k in keys])
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.pooled + self.misses
+        return (self.hits + self.pooled) / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cache_hits": self.hits,
+            "cache_pooled": self.pooled,
+            "cache_misses": self.misses,
+            "cache_hit_rate": round(self.hit_rate, 3),
+        }
+
+
 # ──────────────────────────────────────────────────────────────────────────
 # Semantic chunking helpers
 # ──────────────────────────────────────────────────────────────────────────
@@ -116,54 +299,177 @@ def _split_into_units(text: str, max_unit_chars: int = 600) -> List[str]:
     return units
 
 
-def _semantic_chunk_single_doc(
+def _split_docs_into_units(lc_docs: List[LCDocument]) -> List[List[str]]:
+    """Units of each doc (empty list for docs without text), in lc_docs order."""
+    doc_units: List[List[str]] = []
+    for d in lc_docs:
+        text = (d.page_content or "").strip()
+        doc_units.append(_split_into_units(text) if text else [])
+    return doc_units
+
+
+def _embed_unit_matrix(
+    units: List[str],
+    embedding_cache: Optional[IngestionEmbeddingCache] = None,
+) -> np.ndarray:
+    """Embed units in one batched encoder call → (n_units, dim) float32 matrix (rows normalized)."""
+    if not units:
+        return np.zeros((0, Config.EMBEDDING_DIMENSION), dtype=np.float32)
+    if embedding_cache is not None:
+        return embedding_cache.embed(units)
+    return _encode_texts(units)
+
+
+def _adjacent_similarities(vectors: np.ndarray) -> np.ndarray:
+    """Cosine similarity of each unit with the next one (row-wise dot, vectors are normalized)."""
+    if len(vectors) < 2:
+        return np.zeros(0, dtype=np.float32)
+    return np.einsum("ij,ij->i", vectors[:-1], vectors[1:])
+
+
+def _sampled_similarity_gaps(
+    doc_units: List[List[str]],
+    unit_stride: int,
+    embedding_cache: Optional[IngestionEmbeddingCache],
+) -> Tuple[List[Optional[np.ndarray]], List[Optional[np.ndarray]], List[Optional[List[int]]]]:
+    """Embed every unit_stride-th unit (plus the last) of each doc in one call."""
+    sample_idx: List[Optional[List[int]]] = []
+    flat: List[str] = []
+    for units in doc_units:
+        if len(units) < 2:
+            sample_idx.append(None)
+            continue
+        idx = list(range(0, len(units), unit_stride))
+        if idx[-1] != len(units) - 1:
+            idx.append(len(units) - 1)
+        sample_idx.append(idx)
+        flat.extend(units[i] for i in idx)
+
+    vectors = _embed_unit_matrix(flat, embedding_cache)
+    sample_vecs: List[Optional[np.ndarray]] = []
+    sample_sims: List[Optional[np.ndarray]] = []
+    offset = 0
+    for idx in sample_idx:
+        if idx is None:
+            sample_vecs.append(None)
+            sample_sims.append(None)
+            continue
+        vecs = vectors[offset: offset + len(idx)]
+        offset += len(idx)
+        sample_vecs.append(vecs)
+        sample_sims.append(_adjacent_similarities(vecs))
+    return sample_vecs, sample_sims, sample_idx
+
+
+def _approximate_adjacent_similarities(
+    doc_units: List[List[str]],
+    *,
+    unit_stride: int,
+    refine_units: int,
+    similarity_threshold: float,
+    embedding_cache: Optional[IngestionEmbeddingCache] = None,
+) -> Tuple[List[Optional[np.ndarray]], int]:
+    """
+    Approximate neighbour similarities for large documents at bounded cost.
+
+    1. Embed a sample (every unit_stride-th unit) and compare consecutive samples.
+    2. Gaps whose sample similarity is below the threshold contain a topic shift;
+       the lowest-similarity gaps are refined by embedding every unit inside them
+       (at most refine_units units in total), which recovers the exact boundary.
+    3. Shift gaps left unrefined break at their midpoint; all other positions get
+       the sample similarity, so only the length rule splits them.
+
+    Returns per-doc similarity arrays (None for docs with < 2 units) and the
+    number of units embedded.
+    """
+    sample_vecs, sample_sims, sample_idx = _sampled_similarity_gaps(doc_units, unit_stride, embedding_cache)
+    embedded = sum(len(idx) for idx in sample_idx if idx)
+
+    sims_out: List[Optional[np.ndarray]] = []
+    shift_gaps = []  # (sample sim, doc position, gap position)
+    for d, (units, idx, ssims) in enumerate(zip(doc_units, sample_idx, sample_sims)):
+        if idx is None:
+            sims_out.append(None)
+            continue
+        sims = np.empty(len(units) - 1, dtype=np.float32)
+        for g, sim in enumerate(ssims):
+            a, b = idx[g], idx[g + 1]
+            sims[a:b] = sim
+            if sim < similarity_threshold and b - a > 1:
+                shift_gaps.append((float(sim), d, g))
+        sims_out.append(sims)
+
+    # Refine the strongest shifts first while the budget lasts
+    shift_gaps.sort()
+    refine: List[Tuple[int, int]] = []
+    refine_texts: List[str] = []
+    budget = refine_units
+    for _, d, g in shift_gaps:
+        a, b = sample_idx[d][g], sample_idx[d][g + 1]
+        inner = b - a - 1
+        if inner <= budget:
+            budget -= inner
+            refine.append((d, g))
+            refine_texts.extend(doc_units[d][a + 1: b])
+        else:
+            # Unrefined shift: break once, in the middle of the gap
+            sims_out[d][a:b] = 1.0
+            sims_out[d][(a + b) // 2] = sample_sims[d][g]
+
+    if refine_texts:
+        inner_vecs = _embed_unit_matrix(refine_texts, embedding_cache)
+        embedded += len(refine_texts)
+        offset = 0
+        for d, g in refine:
+            a, b = sample_idx[d][g], sample_idx[d][g + 1]
+            inner = b - a - 1
+            gap_vecs = np.vstack([
+                sample_vecs[d][g: g + 1],
+                inner_vecs[offset: offset + inner],
+                sample_vecs[d][g + 1: g + 2],
+            ])
+            offset += inner
+            sims_out[d][a:b] = _adjacent_similarities(gap_vecs)
+
+    return sims_out, embedded
+
+
+def _pack_units_into_chunks(
     doc: LCDocument,
+    units: List[str],
+    sims: np.ndarray,
     *,
-    max_chunk_chars: int = 1400,
-    min_chunk_chars: int = 250,
-    similarity_threshold: float = 0.55,
+    max_chunk_chars: int,
+    min_chunk_chars: int,
+    similarity_threshold: float,
     debug: bool = False,
+    embedding_cache: Optional[IngestionEmbeddingCache] = None,
 ) -> List[LCDocument]:
     """
-    Semantic chunking:
-    - Split doc into units (bullets/paragraph/sentence packs)
-    - Embed each unit (normalized embeddings already)
-    - Start a new chunk when adjacent similarity drops below threshold
-    - Also respect max_chunk_chars to avoid overly large chunks
+    Greedy packing: start a new chunk when the similarity between unit i-1 and i
+    (sims[i-1]) drops below threshold, or the chunk would exceed max_chunk_chars.
     """
-    text = (doc.page_content or "").strip()
-    if not text:
-        return []
-
-    units = _split_into_units(text)
-    if len(units) <= 1:
-        return [doc]
-
-    vectors = get_embeddings().embed_documents(units)
-
-    # Cosine similarity = dot product since vectors normalized
-    def dot(a, b) -> float:
-        return sum(x * y for x, y in zip(a, b))
+    # Vectorized break candidates; the length rule depends on the running size so stays in the loop.
+    topic_shift = sims < similarity_threshold
 
     chunks: List[LCDocument] = []
     cur_units = [units[0]]
     cur_len = len(units[0])
 
-    for i in range(1, len(units)):
-        sim = dot(vectors[i - 1], vectors[i])
+    def emit():
+        chunk_text = "\n\n".join(cur_units).strip()
+        if embedding_cache is not None:
+            embedding_cache.register_composite(chunk_text, cur_units)
+        chunks.append(LCDocument(page_content=chunk_text, metadata=dict(doc.metadata or {})))
 
+    for i in range(1, len(units)):
         # break if topic shift OR chunk too big
-        should_break = (sim < similarity_threshold) or (cur_len + len(units[i]) + 1 > max_chunk_chars)
+        should_break = bool(topic_shift[i - 1]) or (cur_len + len(units[i]) + 1 > max_chunk_chars)
 
         if should_break and cur_len >= min_chunk_chars:
             if debug:
-                print(f"[semantic split] sim={sim:.2f} break at unit {i-1}->{i} meta={doc.metadata}")
-            chunks.append(
-                LCDocument(
-                    page_content="\n\n".join(cur_units).strip(),
-                    metadata=dict(doc.metadata or {}),
-                )
-            )
+                print(f"[semantic split] sim={sims[i - 1]:.2f} break at unit {i-1}->{i} meta={doc.metadata}")
+            emit()
             cur_units = [units[i]]
             cur_len = len(units[i])
         else:
@@ -171,16 +477,37 @@ def _semantic_chunk_single_doc(
             cur_len += len(units[i]) + 1
 
     if cur_units:
-        chunks.append(
-            LCDocument(
-                page_content="\n\n".join(cur_units).strip(),
-                metadata=dict(doc.metadata or {}),
-            )
-        )
+        emit()
 
     return chunks
 
 
+def _semantic_chunk_single_doc(
+    doc: LCDocument,
+    *,
+    max_chunk_chars: int = 1400,
+    min_chunk_chars: int = 250,
+    similarity_threshold: float = 0.55,
+    debug: bool = False,
+    embedding_cache: Optional[IngestionEmbeddingCache] = None,
+) -> List[LCDocument]:
+    """
+    Semantic chunking of one doc (page/slide window):
+    - Split doc into units (bullets/paragraph/sentence packs)
+    - Embed each unit (normalized embeddings already)
+    - Start a new chunk when adjacent similarity drops below threshold
+    - Also respect max_chunk_chars to avoid overly large chunks
+    """
+    return semantic_chunk_documents(
+        [doc],
+        max_chunk_chars=max_chunk_chars,
+        min_chunk_chars=min_chunk_chars,
+        similarity_threshold=similarity_threshold,
+        debug=debug,
+        embedding_cache=embedding_cache,
+    )
+
+
 def semantic_chunk_documents(
     lc_docs: List[LCDocument],
     *,
@@ -188,19 +515,78 @@ def semantic_chunk_documents(
     min_chunk_chars: int = 250,
     similarity_threshold: float = 0.55,
     debug: bool = False,
+    embedding_cache: Optional[IngestionEmbeddingCache] = None,
+    unit_stride: int = 1,
+    refine_units: int = 0,
+    doc_units: Optional[List[List[str]]] = None,
 ) -> List[LCDocument]:
-    """Apply semantic chunking across a list of docs, preserving metadata."""
+    """
+    Apply semantic chunking across a list of docs, preserving metadata.
+
+    Units from every doc are embedded in one batched call and all neighbour
+    similarities are computed as a single matrix operation per doc; packing
+    rules (and therefore chunk boundaries) are the same as per-doc chunking.
+
+    unit_stride > 1 switches to approximate similarities (see
+    _approximate_adjacent_similarities): only a sample of units plus the units
+    around detected topic shifts are embedded.
+
+    doc_units, when given (ChunkingPlan.doc_units), are the already split units
+    of each doc in lc_docs; otherwise the docs are split here.
+    """
+    t_start = time.perf_counter()
+
+    if doc_units is None:
+        doc_units = _split_docs_into_units(lc_docs)
+    flat_units: List[str] = [u for units in doc_units if len(units) > 1 for u in units]
+
+    t_embed = time.perf_counter()
+    if unit_stride > 1:
+        doc_sims, embedded = _approximate_adjacent_similarities(
+            doc_units,
+            unit_stride=unit_stride,
+            refine_units=refine_units,
+            similarity_threshold=similarity_threshold,
+            embedding_cache=embedding_cache,
+        )
+    else:
+        vectors = _embed_unit_matrix(flat_units, embedding_cache)
+        embedded = len(flat_units)
+        doc_sims = []
+        offset = 0
+        for units in doc_units:
+            if len(units) < 2:
+                doc_sims.append(None)
+                continue
+            doc_sims.append(_adjacent_similarities(vectors[offset: offset + len(units)]))
+            offset += len(units)
+    embed_s = time.perf_counter() - t_embed
+
     all_chunks: List[LCDocument] = []
-    for d in lc_docs:
+    for d, units, sims in zip(lc_docs, doc_units, doc_sims):
+        if not (d.page_content or "").strip():
+            continue
+        if len(units) <= 1:
+            all_chunks.append(d)  # nothing to split: keep the page as one chunk
+            continue
         all_chunks.extend(
-            _semantic_chunk_single_doc(
+            _pack_units_into_chunks(
                 d,
+                units,
+                sims,
                 max_chunk_chars=max_chunk_chars,
                 min_chunk_chars=min_chunk_chars,
                 similarity_threshold=similarity_threshold,
                 debug=debug,
+                embedding_cache=embedding_cache,
             )
         )
+
+    total_s = time.perf_counter() - t_start
+    print(
+        f"     ⏱  Semantic chunking: {len(lc_docs)} doc(s), {len(flat_units)} units "
+        f"({embedded} embedded) → {len(all_chunks)} chunks in {total_s:.2f}s (embed {embed_s:.2f}s)"
+    )
     return all_chunks
 
 
@@ -208,37 +594,52 @@ def semantic_chunk_documents(
 # Loading
 # ──────────────────────────────────────────────────────────────────────────
 
-def _load_pdf_with_pymupdf(file_path: str) -> List[LCDocument]:
-    """Load PDF using PyMuPDF (fitz) - better for mathematical content."""
+def iter_pdf_pages(file_path: str) -> Iterator[LCDocument]:
+    """
+    Yield one LCDocument per non-empty PDF page (PyMuPDF), so callers can
+    process a large PDF without holding every page in memory.
+    """
     try:
         doc = fitz.open(file_path)
-        lc_docs = []
-        
-        for page_num in range(len(doc)):
+    except Exception as e:
+        raise ValueError(f"PyMuPDF loading failed: {e}")
+
+    try:
+        total_pages = len(doc)
+        for page_num in range(total_pages):
             page = doc[page_num]
             # Extract text with layout preservation
             text = page.get_text("text", sort=True)
-            
+
             # Clean up common PDF extraction artifacts
             text = text.replace('\x00', '')  # Remove null bytes
             text = re.sub(r'\s+', ' ', text)  # Normalize whitespace
             text = text.strip()
-            
+
             if text:  # Only add non-empty pages
-                lc_docs.append(
-                    LCDocument(
-                        page_content=text,
-                        metadata={
-                            "source": file_path,
-                            "page": page_num + 1,
-                            "total_pages": len(doc),
-                        }
-                    )
+                yield LCDocument(
+                    page_content=text,
+                    metadata={
+                        "source": file_path,
+                        "page": page_num + 1,
+                        "total_pages": total_pages,
+                    }
                 )
-        
+    finally:
         doc.close()
+
+
+def pdf_page_count(file_path: str) -> int:
+    with fitz.open(file_path) as doc:
+        return len(doc)
+
+
+def _load_pdf_with_pymupdf(file_path: str) -> List[LCDocument]:
+    """Load PDF using PyMuPDF (fitz) - better for mathematical content."""
+    try:
+        lc_docs = list(iter_pdf_pages(file_path))
         return lc_docs if lc_docs else [LCDocument(page_content="", metadata={"source": file_path})]
-    
+
     except Exception as e:
         raise ValueError(f"PyMuPDF loading failed: {e}")
 
@@ -607,78 +1008,104 @@ def clean_pdf_extraction_noise(text: str) -> str:
 # Type-aware splitting
 # ──────────────────────────────────────────────────────────────────────────
 
-def split_documents_by_type(lc_docs: List[LCDocument], file_ext: str) -> List[LCDocument]:
+@dataclass
+class ChunkingPlan:
+    """How a document will be chunked, chosen from its unit count and encoder throughput."""
+    strategy: str               # 'semantic' | 'sampled_semantic' | 'recursive'
+    unit_count: int
+    estimated_seconds: float    # predicted embedding time of exact semantic chunking
+    unit_stride: int = 1
+    refine_units: int = 0
+    doc_units: Optional[List[List[str]]] = None  # units of each doc, reused by semantic_chunk_documents
+
+
+def plan_chunking(lc_docs: List[LCDocument]) -> ChunkingPlan:
     """
-    Adaptive chunking: Use semantic chunking for smaller/medium docs,
-    fall back to fast recursive chunking for very large documents.
+    Pick a chunking strategy within SEMANTIC_CHUNKING_BUDGET_S of embedding time:
+    - semantic         : every unit embedded (exact, small/medium docs)
+    - sampled_semantic : every k-th unit embedded, topic-shift gaps refined
+                         with the remaining budget (large docs)
+    - recursive        : character splitter, only when even the sample would
+                         need a stride above CHUNKING_MAX_SAMPLE_STRIDE
+    """
+    doc_units = _split_docs_into_units(lc_docs)
+    unit_count = sum(len(units) for units in doc_units if len(units) > 1)
+
+    rate = max(embedding_throughput.texts_per_second(), 1e-6)
+    estimated = unit_count / rate
+    budget_units = int(Config.SEMANTIC_CHUNKING_BUDGET_S * rate)
+    if unit_count <= budget_units:
+        return ChunkingPlan("semantic", unit_count, estimated, doc_units=doc_units)
+
+    refine_units = int(budget_units * Config.CHUNKING_REFINE_FRACTION)
+    sample_units = max(budget_units - refine_units, 1)
+    stride = math.ceil(unit_count / sample_units)
+    if stride > Config.CHUNKING_MAX_SAMPLE_STRIDE:
+        return ChunkingPlan("recursive", unit_count, estimated)
+    return ChunkingPlan(
+        "sampled_semantic", unit_count, estimated,
+        unit_stride=stride, refine_units=refine_units, doc_units=doc_units,
+    )
+
+
+def split_documents_by_type(
+    lc_docs: List[LCDocument],
+    file_ext: str,
+    embedding_cache: Optional[IngestionEmbeddingCache] = None,
+) -> List[LCDocument]:
+    """
+    Adaptive chunking: per-type semantic settings, with the strategy
+    (exact semantic, sampled semantic or recursive) chosen by plan_chunking().
     """
     ext = f".{file_ext.lower().lstrip('.')}"
-    
-    # Calculate total document size
-    total_chars = sum(len(d.page_content or "") for d in lc_docs)
-    
-    # Performance threshold: if document is too large, use simpler chunking
-    LARGE_DOC_THRESHOLD = 150000  # ~150KB of text
-    use_fast_chunking = total_chars > LARGE_DOC_THRESHOLD
-    
-    if use_fast_chunking:
-        print(f"     ℹ️  Large document ({total_chars} chars), using fast recursive chunking")
-        return _split_with_recursive(
-            lc_docs,
-            chunk_size=1000,
-            chunk_overlap=100,
-        )
-    
+
     # --- PPTX (already slide-based, usually small) ---
     if ext == ".pptx":
         # No need to merge slides, already loaded per-slide
-        return semantic_chunk_documents(
-            lc_docs,
-            max_chunk_chars=1200,  # Reduced for faster embedding
-            min_chunk_chars=200,
-            similarity_threshold=0.58,  # Slightly higher = fewer chunks
-            debug=False,
-        )
-
+        docs = lc_docs
+        params = dict(max_chunk_chars=1200, min_chunk_chars=200, similarity_threshold=0.58)  # Slightly higher = fewer chunks
     # --- PDF ---
-    if ext == ".pdf":
+    elif ext == ".pdf":
         # If it's a slide-like PDF, merge pages into windows first
         if _is_slide_like_pdf(lc_docs):
-            merged_docs = _merge_pdf_pages(lc_docs, window_pages=3)
-            return semantic_chunk_documents(
-                merged_docs,
-                max_chunk_chars=1400,
-                min_chunk_chars=250,
-                similarity_threshold=0.58,
-                debug=False,
-            )
-
-        # normal PDFs: semantic chunk per page
-        return semantic_chunk_documents(
-            lc_docs,
-            max_chunk_chars=1200,
-            min_chunk_chars=250,
-            similarity_threshold=0.58,
-            debug=False,
-        )
-
+            docs = _merge_pdf_pages(lc_docs, window_pages=3)
+            params = dict(max_chunk_chars=1400, min_chunk_chars=250, similarity_threshold=0.58)
+        else:
+            # normal PDFs: semantic chunk per page
+            docs = lc_docs
+            params = dict(max_chunk_chars=1200, min_chunk_chars=250, similarity_threshold=0.58)
     # --- DOCX ---
-    if ext == ".docx":
-        return semantic_chunk_documents(
+    elif ext == ".docx":
+        docs = lc_docs
+        params = dict(max_chunk_chars=1200, min_chunk_chars=250, similarity_threshold=0.58)
+    # --- TXT/default ---
+    else:
+        docs = lc_docs
+        params = dict(max_chunk_chars=1000, min_chunk_chars=200, similarity_threshold=0.58)
+
+    plan = plan_chunking(docs)
+    print(
+        f"     ℹ️  Chunking plan: {plan.strategy} ({plan.unit_count} units, "
+        f"~{plan.estimated_seconds:.0f}s exact embed"
+        + (f", stride {plan.unit_stride}, refine ≤{plan.refine_units}" if plan.strategy == "sampled_semantic" else "")
+        + ")"
+    )
+
+    if plan.strategy == "recursive":
+        return _split_with_recursive(
             lc_docs,
-            max_chunk_chars=1200,
-            min_chunk_chars=250,
-            similarity_threshold=0.58,
-            debug=False,
+            chunk_size=1000,
+            chunk_overlap=100,
         )
 
-    # --- TXT/default ---
     return semantic_chunk_documents(
-        lc_docs,
-        max_chunk_chars=1000,
-        min_chunk_chars=200,
-        similarity_threshold=0.58,
+        docs,
         debug=False,
+        embedding_cache=embedding_cache,
+        unit_stride=plan.unit_stride,
+        refine_units=plan.refine_units,
+        doc_units=plan.doc_units,
+        **params,
     )
 
 
@@ -686,7 +1113,12 @@ def split_documents_by_type(lc_docs: List[LCDocument], file_ext: str) -> List[LC
 # Embedding
 # ──────────────────────────────────────────────────────────────────────────
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
+def embed_texts(
+    texts: List[str],
+    embedding_cache: Optional[IngestionEmbeddingCache] = None,
+) -> List[List[float]]:
+    if embedding_cache is not None:
+        return embedding_cache.embed(texts).tolist()
     return get_embeddings().embed_documents(texts)
 
 
@@ -694,37 +1126,230 @@ def embed_texts(texts: List[str]) -> List[List[float]]:
 # Ingestion pipeline
 # ──────────────────────────────────────────────────────────────────────────
 
+# Stage names reported to progress callbacks (and persisted on ingestion jobs)
+INGESTION_STAGES = ("load", "chunk", "embed", "store")
+
+ProgressCallback = Callable[..., None]
+
+
+def _report_progress(progress_callback: Optional[ProgressCallback], stage: str, status: str, **details) -> None:
+    """Forward a stage update to the caller; progress reporting must never break ingestion."""
+    if progress_callback is None:
+        return
+    try:
+        progress_callback(stage, status, **details)
+    except Exception as e:
+        print(f"     ⚠️  Progress callback failed at {stage}/{status}: {e}")
+
+
+MIN_CHUNK_LEN = 140  # slightly higher: removes more junk
+# Same message from the single-file, streaming and batch pipelines
+NO_USABLE_CHUNKS_ERROR = (
+    "No usable chunks after cleaning/filtering. "
+    "Try lowering MIN_CHUNK_LEN or check the document extraction quality."
+)
+
+
+def classify_document_sample(lc_docs: List[LCDocument]) -> List[Dict]:
+    """Document-level subject classification from the first few pages/elements."""
+    # Extract sample from first few documents/pages
+    content_sample = ""
+    for doc in lc_docs[:5]:  # First 5 pages/elements
+        content_sample += doc.page_content + "\n"
+    content_sample = content_sample[:3000]  # Limit to 3000 chars
+
+    return classification.classify_document_subjects(
+        content_sample=content_sample,
+        embeddings_model=get_embeddings()
+    )
+
+
+def clean_chunk_text(text: str) -> str:
+    """Slide + PDF extraction cleanup for one chunk (pure function, safe to run in a process pool)."""
+    text = clean_slide_text(text or "")
+    text = clean_pdf_extraction_noise(text)
+    return text.strip()
+
+
+def filter_clean_chunks(
+    chunks: List[LCDocument],
+    cleaned_texts: Optional[List[str]] = None,
+    embedding_cache: Optional[IngestionEmbeddingCache] = None,
+) -> List[LCDocument]:
+    """
+    Apply cleaned text to chunks and drop those shorter than MIN_CHUNK_LEN.
+    With the chunking run's embedding_cache, packed chunks stay linked to their
+    units under the cleaned text, so the pooled path still finds them.
+    """
+    if cleaned_texts is None:
+        cleaned_texts = [clean_chunk_text(c.page_content) for c in chunks]
+
+    kept: List[LCDocument] = []
+    for c, text in zip(chunks, cleaned_texts):
+        if len(text) < MIN_CHUNK_LEN:
+            continue
+        if embedding_cache is not None:
+            embedding_cache.rekey_composite(c.page_content, text)
+        c.page_content = text
+        kept.append(c)
+    return kept
+
+
+def classify_chunks(
+    chunks: List[LCDocument],
+    vectors: List[List[float]],
+    document_subjects: List[str],
+) -> List[List[Dict]]:
+    """Topic classification for each chunk within the document's subjects (one batched call)."""
+    return classification.classify_chunks_topics(vectors, document_subjects)
+
+
+def chunk_semantic_params(file_ext: str) -> Dict[str, Any]:
+    # Keep params in one place so metadata matches real behavior
+    return {
+        "similarity_threshold": 0.55,
+        "max_chunk_chars": 1400,
+        "min_chunk_chars": 300 if file_ext.lower() in ["pdf", "docx"] else 250,
+    }
+
+
+def build_chunk_row(
+    *,
+    document_id: int,
+    chunk_order: int,
+    chunk: LCDocument,
+    vector: List[float],
+    topics: List[Dict],
+    document_subjects: List[str],
+    total_chunks: Optional[int],
+    semantic_params: Dict[str, Any],
+) -> Dict[str, Any]:
+    """One document_chunks row for bulk_insert_chunks()."""
+    # Determine dominant subject and topic for quick access
+    dominant_subject = topics[0]['name'] if topics else document_subjects[0]
+    dominant_topic = ""
+    if topics and topics[0].get('topics'):
+        top_topic = topics[0]['topics'][0]
+        dominant_topic = f"{top_topic['name']}/{top_topic.get('subtopic', '')}".rstrip('/')
+
+    return {
+        "document_id": document_id,
+        "chunk_order": chunk_order,
+        "content": chunk.page_content,
+        "embedding": vector,
+        "chunk_metadata": {
+            "chunk_index": chunk_order,
+            "total_chunks": total_chunks,
+            "chunking_method": "semantic_embedding",
+            "semantic_params": semantic_params,
+            "source": chunk.metadata,
+            "content_len": len(chunk.page_content or ""),
+            # NEW: Subject and topic classification
+            "subjects": topics,
+            "dominant_subject": dominant_subject,
+            "dominant_topic": dominant_topic,
+        },
+    }
+
+
+def store_document(
+    db_session: DBSession,
+    *,
+    file_path: str,
+    user_id: Optional[int],
+    folder_id: Optional[int],
+    document_subjects: List[str],
+    chunks: List[LCDocument],
+    vectors: List[List[float]],
+    chunk_classifications: List[List[Dict]],
+    progress_callback: Optional[ProgressCallback] = None,
+    filename: Optional[str] = None,
+) -> Document:
+    """Create the Document row, bulk-insert its chunks and commit (filename defaults to the file's)."""
+    filename = filename or os.path.basename(file_path)
+    file_ext = os.path.splitext(filename)[1].lstrip(".")
+
+    # ── 4. Create Document row ──
+    doc = Document(
+        user_id=user_id,
+        folder_id=folder_id,
+        filename=filename,
+        file_path=os.path.abspath(file_path),
+        file_type=file_ext,
+        title=filename,
+        subject=document_subjects,  # Array of classified subjects
+        chunk_count=len(chunks),
+    )
+    _report_progress(progress_callback, "store", "running", chunks=len(chunks))
+    db_session.add(doc)
+    db_session.flush()
+    print(f"[4] Document row created → id={doc.id}")
+
+    # ── 5. Insert chunks ──
+    semantic_params = chunk_semantic_params(file_ext)
+
+    def chunk_rows():
+        for idx, (chunk, vector) in enumerate(zip(chunks, vectors)):
+            yield build_chunk_row(
+                document_id=doc.id,
+                chunk_order=idx,
+                chunk=chunk,
+                vector=vector,
+                topics=chunk_classifications[idx],
+                document_subjects=document_subjects,
+                total_chunks=len(chunks),
+                semantic_params=semantic_params,
+            )
+
+    t_store = time.perf_counter()
+    bulk_insert_chunks(db_session, chunk_rows())
+    db_session.commit()
+    print(f"[5] Stored   : {len(chunks)} chunks → document_id={doc.id} in {time.perf_counter() - t_store:.2f}s")
+    _report_progress(progress_callback, "store", "completed", chunks=len(chunks), document_id=doc.id)
+    return doc
+
+
 def run_ingestion_pipeline(
     db_session: DBSession,
     file_path: str,
     user_id: Optional[int] = None,
     subject: Optional[str] = None,
     folder_id: Optional[int] = None,
+    progress_callback: Optional[ProgressCallback] = None,
 ) -> Document:
+    """
+    Load → Chunk → Embed → Store a single file.
+
+    progress_callback, if given, is called as callback(stage, status, **details)
+    with stage in INGESTION_STAGES and status 'running' or 'completed'.
+
+    Large PDFs (see should_stream_document) go through
+    run_streaming_ingestion_pipeline instead.
+    """
+    if should_stream_document(file_path):
+        return run_streaming_ingestion_pipeline(
+            db_session,
+            file_path,
+            user_id=user_id,
+            subject=subject,
+            folder_id=folder_id,
+            progress_callback=progress_callback,
+        )
+
     filename = os.path.basename(file_path)
     file_ext = os.path.splitext(filename)[1].lstrip(".")
 
     # ── 1. Load ──
     print(f"[1] Loading  : {filename}")
+    _report_progress(progress_callback, "load", "running")
     lc_docs = load_document(file_path)
     print(f"     → {len(lc_docs)} page(s)/element-doc(s) loaded")
+    _report_progress(progress_callback, "load", "completed", pages=len(lc_docs))
 
     # ── 1b. Classify Document Subjects ──
     print("[1b] Classifying document subjects...")
-    embeddings_model = get_embeddings()
-    
-    # Extract sample from first few documents/pages
-    content_sample = ""
-    for doc in lc_docs[:5]:  # First 5 pages/elements
-        content_sample += doc.page_content + "\n"
-    content_sample = content_sample[:3000]  # Limit to 3000 chars
-    
-    # Classify subjects
-    classified_subjects = classification.classify_document_subjects(
-        content_sample=content_sample,
-        embeddings_model=embeddings_model
-    )
-    
+    classified_subjects = classify_document_sample(lc_docs)
+
     # Extract subject names for document record
     document_subjects = [s['name'] for s in classified_subjects]
     print(f"     → Classified as: {', '.join(document_subjects)}")
@@ -732,59 +1357,163 @@ def run_ingestion_pipeline(
 
     # ── 2. Chunk ──
     print("[2] Chunking : method=semantic_embedding")
-    chunks = split_documents_by_type(lc_docs, file_ext)
-    print(f"     → {len(chunks)} raw chunks")
+    _report_progress(progress_callback, "chunk", "running")
+    # Unit vectors from chunking are reused when a final chunk has the same text.
+    embedding_cache = IngestionEmbeddingCache()
+    t_chunk = time.perf_counter()
+    chunks = split_documents_by_type(lc_docs, file_ext, embedding_cache=embedding_cache)
+    chunk_seconds = time.perf_counter() - t_chunk
+    print(f"     → {len(chunks)} raw chunks in {chunk_seconds:.2f}s")
 
     # ── 2b. Clean + Filter (BEFORE EMBEDDING/STORING) ──
-    MIN_CHUNK_LEN = 140  # slightly higher: removes more junk
-    cleaned_chunks: List[LCDocument] = []
-
-    for c in chunks:
-        text = c.page_content or ""
-        text = clean_slide_text(text)
-        text = clean_pdf_extraction_noise(text)
-
-        text = text.strip()
-        if len(text) < MIN_CHUNK_LEN:
-            continue
-
-        c.page_content = text
-        cleaned_chunks.append(c)
-
-    chunks = cleaned_chunks
+    raw_chunk_count = len(chunks)
+    chunks = filter_clean_chunks(chunks, embedding_cache=embedding_cache)
     print(f"     → {len(chunks)} cleaned chunks kept")
+    _report_progress(
+        progress_callback, "chunk", "completed",
+        raw_chunks=raw_chunk_count, chunks=len(chunks), seconds=round(chunk_seconds, 3),
+    )
 
     if not chunks:
-        raise ValueError(
-            "No usable chunks after cleaning/filtering. "
-            "Try lowering MIN_CHUNK_LEN or check the document extraction quality."
-        )
+        raise ValueError(NO_USABLE_CHUNKS_ERROR)
 
     # ── 3. Embed ──
     print(f"[3] Embedding: {len(chunks)} chunks via {Config.EMBEDDING_MODEL}")
+    _report_progress(progress_callback, "embed", "running", chunks=len(chunks))
     texts = [c.page_content for c in chunks]
-    vectors = embed_texts(texts)
+    hits_before = embedding_cache.hits + embedding_cache.pooled
+    misses_before = embedding_cache.misses
+    vectors = embed_texts(texts, embedding_cache=embedding_cache)
 
     if not vectors or not vectors[0]:
         raise RuntimeError("Embedding failed: got empty vectors.")
+    chunk_hits = embedding_cache.hits + embedding_cache.pooled - hits_before
+    chunk_misses = embedding_cache.misses - misses_before
+    chunk_hit_rate = chunk_hits / max(chunk_hits + chunk_misses, 1)
     print(f"     → dim={len(vectors[0])}")
-    
+    print(
+        f"     → embedding cache: {chunk_hits}/{len(texts)} chunks reused "
+        f"(hit rate {chunk_hit_rate:.0%}, pooled {embedding_cache.pooled})"
+    )
+
     # ── 3b. Classify Chunk Topics ──
     print(f"[3b] Classifying topics for {len(chunks)} chunks...")
-    chunk_classifications = []
-    
-    for idx, (chunk, vector) in enumerate(zip(chunks, vectors)):
-        # Classify topics for this chunk
-        topics = classification.classify_chunk_topics(
-            chunk_content=chunk.page_content,
-            chunk_embedding=vector,
-            document_subjects=document_subjects
-        )
-        chunk_classifications.append(topics)
-    
+    chunk_classifications = classify_chunks(chunks, vectors, document_subjects)
     print(f"     → Topic classification complete")
+    _report_progress(
+        progress_callback, "embed", "completed",
+        chunks=len(chunks), dim=len(vectors[0]),
+        chunk_cache_hit_rate=round(chunk_hit_rate, 3), **embedding_cache.stats(),
+    )
 
-    # ── 4. Create Document row ──
+    # ── 4-5. Store ──
+    doc = store_document(
+        db_session,
+        file_path=file_path,
+        user_id=user_id,
+        folder_id=folder_id,
+        document_subjects=document_subjects,
+        chunks=chunks,
+        vectors=vectors,
+        chunk_classifications=chunk_classifications,
+        progress_callback=progress_callback,
+    )
+    print("✅  Ingestion complete.")
+
+    # Preview first few chunks
+    for i, c in enumerate(chunks[:5]):
+        print(f"\n--- CHUNK {i} ---")
+        print(c.page_content[:1200])
+        print("LEN:", len(c.page_content))
+
+    return doc
+
+
+# ──────────────────────────────────────────────────────────────────────────
+# Streaming ingestion (large PDFs)
+# ──────────────────────────────────────────────────────────────────────────
+
+_STREAM_HEAD_PAGES = 12  # pages buffered up front for subject + slide-layout detection
+
+
+def should_stream_document(file_path: str) -> bool:
+    """PDFs at or above INGESTION_STREAMING_MIN_PAGES are ingested page-by-page."""
+    mode = (Config.INGESTION_STREAMING_MODE or "auto").lower()
+    if mode == "never" or not PYMUPDF_AVAILABLE:
+        return False
+    if not file_path.lower().endswith(".pdf"):
+        return False
+    if mode == "always":
+        return True
+    try:
+        return pdf_page_count(file_path) >= Config.INGESTION_STREAMING_MIN_PAGES
+    except Exception:
+        return False
+
+
+def _batched(iterable, size: int) -> Iterator[List]:
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def run_streaming_ingestion_pipeline(
+    db_session: DBSession,
+    file_path: str,
+    user_id: Optional[int] = None,
+    subject: Optional[str] = None,
+    folder_id: Optional[int] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+    page_batch_size: Optional[int] = None,
+    filename: Optional[str] = None,
+) -> Document:
+    """
+    Load → Chunk → Embed → Store a PDF in fixed-size page batches.
+
+    Pages come from iter_pdf_pages(); each batch is chunked, cleaned, embedded
+    and COPY'd to document_chunks before the next batch is read, so peak memory
+    depends on the batch size, not the page count. Everything is written in one
+    transaction and committed at the end, like run_ingestion_pipeline.
+
+    Chunking uses the PDF semantic settings for the whole file (slide layout is
+    decided from the first pages); the size-based recursive fallback does not
+    apply because memory and encoder batches no longer grow with the document.
+
+    filename is the original upload name when the saved path differs (batch uploads).
+    """
+    filename = filename or os.path.basename(file_path)
+    file_ext = os.path.splitext(filename)[1].lstrip(".")
+    # Multiple of 3 so slide windows (_merge_pdf_pages) never straddle two batches
+    page_batch_size = page_batch_size or Config.INGESTION_STREAM_PAGE_BATCH
+    page_batch_size = max(3, page_batch_size - page_batch_size % 3)
+
+    # ── 1. Load (head only) ──
+    total_pages = pdf_page_count(file_path)
+    print(f"[1] Streaming: {filename} ({total_pages} pages, {page_batch_size} pages/batch)")
+    _report_progress(progress_callback, "load", "running", pages=total_pages, streaming=True)
+    pages = iter_pdf_pages(file_path)
+    head = list(islice(pages, _STREAM_HEAD_PAGES))
+    if not head:
+        raise ValueError(NO_USABLE_CHUNKS_ERROR)
+
+    # ── 1b. Classify Document Subjects ──
+    print("[1b] Classifying document subjects...")
+    classified_subjects = classify_document_sample(head)
+    document_subjects = [s['name'] for s in classified_subjects]
+    print(f"     → Classified as: {', '.join(document_subjects)}")
+
+    slide_like = _is_slide_like_pdf(head)
+    chunk_kwargs = dict(
+        max_chunk_chars=1400 if slide_like else 1200,
+        min_chunk_chars=250,
+        similarity_threshold=0.58,
+        debug=False,
+    )
+
+    # ── 4. Document row first, so chunk batches can reference it ──
     doc = Document(
         user_id=user_id,
         folder_id=folder_id,
@@ -792,64 +1521,94 @@ def run_ingestion_pipeline(
         file_path=os.path.abspath(file_path),
         file_type=file_ext,
         title=filename,
-        subject=document_subjects,  # Array of classified subjects
-        chunk_count=len(chunks),
+        subject=document_subjects,
+        chunk_count=0,
     )
     db_session.add(doc)
     db_session.flush()
     print(f"[4] Document row created → id={doc.id}")
 
-    # ── 5. Insert chunks ──
-    # Keep params in one place so metadata matches real behavior
-    semantic_params = {
-        "similarity_threshold": 0.55,
-        "max_chunk_chars": 1400,
-        "min_chunk_chars": 300 if file_ext.lower() in ["pdf", "docx"] else 250,
-    }
+    semantic_params = chunk_semantic_params(file_ext)
+    chunk_order = 0
+    pages_done = 0
+    t_start = time.perf_counter()
+    timings = {"chunk": 0.0, "embed": 0.0, "store": 0.0}
+
+    for stage in ("chunk", "embed", "store"):
+        _report_progress(progress_callback, stage, "running", pages_done=0, chunks=0)
+
+    # chain() keeps its arguments until the end of the stream; through iter(head) it
+    # only holds a list iterator, which drops the head pages once it has yielded them
+    stream = chain(iter(head), pages)
+    del head
+    for batch in _batched(stream, page_batch_size):
+        pages_done += len(batch)
+
+        # ── 2. Chunk + clean ──
+        t0 = time.perf_counter()
+        embedding_cache = IngestionEmbeddingCache()  # per batch: bounded
+        docs = _merge_pdf_pages(batch, window_pages=3) if slide_like else batch
+        chunks = semantic_chunk_documents(docs, embedding_cache=embedding_cache, **chunk_kwargs)
+        chunks = filter_clean_chunks(chunks, embedding_cache=embedding_cache)
+        timings["chunk"] += time.perf_counter() - t0
+        if not chunks:
+            continue
 
-    for idx, (chunk, vector) in enumerate(zip(chunks, vectors)):
-        # Get topic classification for this chunk
-        topics = chunk_classifications[idx]
-        
-        # Determine dominant subject and topic for quick access
-        dominant_subject = topics[0]['name'] if topics else document_subjects[0]
-        dominant_topic = ""
-        if topics and topics[0].get('topics'):
-            top_topic = topics[0]['topics'][0]
-            dominant_topic = f"{top_topic['name']}/{top_topic.get('subtopic', '')}".rstrip('/')
-        
-        db_session.add(
-            DocumentChunk(
+        # ── 3. Embed + classify ──
+        t0 = time.perf_counter()
+        vectors = embed_texts([c.page_content for c in chunks], embedding_cache=embedding_cache)
+        chunk_classifications = classify_chunks(chunks, vectors, document_subjects)
+        timings["embed"] += time.perf_counter() - t0
+
+        # ── 5. Flush batch to the DB ──
+        t0 = time.perf_counter()
+        rows = (
+            build_chunk_row(
                 document_id=doc.id,
-                chunk_order=idx,
-                content=chunk.page_content,
-                embedding=vector,
-                chunk_metadata={
-                    "chunk_index": idx,
-                    "total_chunks": len(chunks),
-                    "chunking_method": "semantic_embedding",
-                    "semantic_params": semantic_params,
-                    "source": chunk.metadata,
-                    "content_len": len(chunk.page_content or ""),
-                    # NEW: Subject and topic classification
-                    "subjects": topics,
-                    "dominant_subject": dominant_subject,
-                    "dominant_topic": dominant_topic,
-                },
+                chunk_order=chunk_order + i,
+                chunk=chunk,
+                vector=vector,
+                topics=topics,
+                document_subjects=document_subjects,
+                total_chunks=None,  # filled in after the last batch
+                semantic_params=semantic_params,
             )
+            for i, (chunk, vector, topics) in enumerate(zip(chunks, vectors, chunk_classifications))
         )
-
+        chunk_order += bulk_insert_chunks(db_session, rows)
+        timings["store"] += time.perf_counter() - t0
+
+        print(f"     → pages {pages_done}/{total_pages}: {chunk_order} chunks stored")
+        _report_progress(progress_callback, "store", "running", pages_done=pages_done, chunks=chunk_order)
+        del batch, docs, chunks, vectors, chunk_classifications, embedding_cache
+
+    _report_progress(progress_callback, "load", "completed", pages=pages_done, streaming=True)
+    if chunk_order == 0:
+        raise ValueError(NO_USABLE_CHUNKS_ERROR)
+
+    # Chunk rows were written before the total was known
+    db_session.execute(
+        sql_text(
+            "UPDATE document_chunks "
+            "SET chunk_metadata = jsonb_set(chunk_metadata, '{total_chunks}', to_jsonb(CAST(:n AS integer))) "
+            "WHERE document_id = :doc_id"
+        ),
+        {"n": chunk_order, "doc_id": doc.id},
+    )
+    doc.chunk_count = chunk_order
     db_session.commit()
-    print(f"[5] Stored   : {len(chunks)} chunks → document_id={doc.id}")
-    print("✅  Ingestion complete.")
-
-    # Preview first few chunks
-    for i, c in enumerate(chunks[:5]):
-        print(f"\n--- CHUNK {i} ---")
-        print(c.page_content[:1200])
-        print("LEN:", len(c.page_content))
 
+    _report_progress(progress_callback, "chunk", "completed", chunks=chunk_order, seconds=round(timings["chunk"], 3))
+    _report_progress(progress_callback, "embed", "completed", chunks=chunk_order, seconds=round(timings["embed"], 3))
+    _report_progress(progress_callback, "store", "completed", chunks=chunk_order, document_id=doc.id)
+    print(
+        f"✅  Streaming ingestion complete: {chunk_order} chunks from {pages_done} pages "
+        f"in {time.perf_counter() - t_start:.2f}s "
+        f"(chunk {timings['chunk']:.1f}s, embed {timings['embed']:.1f}s, store {timings['store']:.1f}s)"
+    )
     return doc
+
+
 def _split_long_text(text: str, chunk_size: int) -> list[str]:
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
@@ -877,8 +1636,7 @@ def chunk_sections_to_db(
       - dominant_subject: str
       - dominant_topic: str (e.g. "Topic/Subtopic")
     """
-    from app.backend.services import classification  # uses classify_document_subjects + classify_chunk_topics
-    from app.backend.models import DocumentChunk
+    from app.backend.services import classification  # uses classify_document_subjects + classify_chunks_topics
     from langchain.text_splitter import RecursiveCharacterTextSplitter
 
     emb = get_embeddings()
@@ -959,22 +1717,20 @@ def chunk_sections_to_db(
     # ─────────────────────────────────────────────────────────
     total_chunks = len(candidate_chunks)
     order = 1
-    count = 0
+    rows: list[dict] = []
+
+    # One encoder batch + one matrix product for all sections
+    vectors = emb.embed_documents([c["text"] for c in candidate_chunks])
+    all_topic_results = classification.classify_chunks_topics(
+        vectors,
+        document_subjects=document_subject_names,
+        threshold=getattr(Config, "TOPIC_SIMILARITY_THRESHOLD", None)
+    )
 
-    for c in candidate_chunks:
+    for c, vec, topic_results in zip(candidate_chunks, vectors, all_topic_results):
         title = c["title"]
         chunk_text = c["text"]
 
-        vec = emb.embed_query(chunk_text)
-
-        # Topic classification within known document subjects
-        topic_results = classification.classify_chunk_topics(
-            chunk_content=chunk_text,
-            chunk_embedding=vec,
-            document_subjects=document_subject_names,
-            threshold=getattr(Config, "TOPIC_SIMILARITY_THRESHOLD", None)
-        )
-
         # Choose a dominant topic string like "Topic/Subtopic"
         dominant_topic = ""
         if topic_results:
@@ -1006,15 +1762,15 @@ def chunk_sections_to_db(
             "topic_matches": topic_results,           # optional detail for debugging/UI
         }
 
-        dc = DocumentChunk(
-            document_id=document_id,
-            chunk_order=order,
-            content=chunk_text,
-            embedding=vec,
-            chunk_metadata=md
-        )
-        db_session.add(dc)
+        rows.append({
+            "document_id": document_id,
+            "chunk_order": order,
+            "content": chunk_text,
+            "embedding": vec,
+            "chunk_metadata": md,
+        })
         order += 1
-        count += 1
 
+    # Same transaction as the caller's Document row; caller commits.
+    count = bulk_insert_chunks(db_session, rows)
     return count, doc_subject_results
\ No newline at end of file
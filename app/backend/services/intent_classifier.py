@@ -4,11 +4,15 @@ HF intent classifier for tool routing.
 Uses a multi-label DistilBERT model to predict tool intents:
 - web_search
 - diagram_enabled
+
+Concurrent requests are micro-batched (INTENT_BATCHING_ENABLED): cache misses
+are queued and run through the model together in one padded forward pass.
 """
 from __future__ import annotations
 
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import logging
+import threading
 
 import torch
 from transformers import (
@@ -19,16 +23,28 @@ from transformers import (
 )
 
 from app.backend.config import Config
+from app.backend.services import onnx_backend
+from app.backend.services.embedding_cache import normalize_text
+from app.backend.services.lru_cache import LRUCache
+from app.backend.services.micro_batcher import MicroBatcher
 
 
 logger = logging.getLogger(__name__)
 
 _tokenizer = None
-_model = None
+_model = None       # torch model, or OnnxModel when INTENT_BACKEND=onnx
 _device = None
+_backend = 'torch'
 _loaded_model_name: Optional[str] = None
 _id2label: Dict[int, str] = {}
 
+# (model name, backend, normalized text) -> label scores; shared across requests and users
+_intent_cache = LRUCache(getattr(Config, 'INTENT_CACHE_SIZE', 2048))
+_forward_passes = 0
+
+_batcher: Optional[MicroBatcher] = None
+_batcher_lock = threading.Lock()
+
 
 def _load_tokenizer(model_name: str):
     """
@@ -88,7 +104,7 @@ def _normalize_id2label(model) -> Dict[int, str]:
 
 
 def _ensure_loaded() -> None:
-    global _tokenizer, _model, _device, _loaded_model_name, _id2label
+    global _tokenizer, _model, _device, _backend, _loaded_model_name, _id2label
 
     model_name = getattr(Config, 'INTENT_MODEL_NAME', '').strip()
     if not model_name:
@@ -98,12 +114,19 @@ def _ensure_loaded() -> None:
         return
 
     _device = _resolve_device()
-    logger.info(f"[IntentClassifier] Loading model '{model_name}' on {_device}")
-
     _tokenizer = _load_tokenizer(model_name)
-    _model = AutoModelForSequenceClassification.from_pretrained(model_name)
-    _model.to(_device)
-    _model.eval()
+    _model = None
+    _backend = 'torch'
+    if _device == 'cpu' and onnx_backend.resolve_backend(getattr(Config, 'INTENT_BACKEND', 'torch')) == 'onnx':
+        _model = onnx_backend.load_onnx_model(model_name, 'classifier', tokenizer=_tokenizer)
+        if _model is not None:
+            _backend = 'onnx'
+
+    logger.info(f"[IntentClassifier] Loading model '{model_name}' on {_device} ({_backend})")
+    if _model is None:
+        _model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        _model.to(_device)
+        _model.eval()
 
     _id2label = _normalize_id2label(_model)
     _loaded_model_name = model_name
@@ -111,9 +134,10 @@ def _ensure_loaded() -> None:
 
 
 def warm_load_intent_classifier() -> bool:
-    """Warm-load intent classifier at startup. Returns True if successful."""
+    """Warm-load intent classifier at startup (plus one dummy pass). Returns True if successful."""
     try:
         _ensure_loaded()
+        _infer_label_scores_batch(['warm-up'])
         return True
     except Exception as e:
         logger.warning(f"[IntentClassifier] Warm-load failed: {e}")
@@ -127,10 +151,85 @@ def get_thresholds() -> Dict[str, float]:
     }
 
 
-def predict_intents(text: str) -> Dict:
+def _cache_key(text: str) -> str:
+    """Whitespace/Unicode-normalized text; case-folded too when the tokenizer lowercases anyway."""
+    key = normalize_text(text)
+    if getattr(_tokenizer, 'do_lower_case', False):
+        key = key.casefold()
+    return key
+
+
+def _infer_label_scores_batch(texts: List[str]) -> List[Dict[str, float]]:
+    """One padded forward pass over texts → [{label: sigmoid score}, ...]."""
+    global _forward_passes
+    _ensure_loaded()
+    max_len = int(getattr(Config, 'INTENT_MODEL_MAX_LENGTH', 256) or 256)
+
+    # Identical texts in one batch share a row
+    unique = list(dict.fromkeys(t or '' for t in texts))
+    if _backend == 'onnx':
+        probs = _model.run(unique).tolist()
+    else:
+        encoded = _tokenizer(
+            unique,
+            return_tensors='pt',
+            padding=True,
+            truncation=True,
+            max_length=max_len,
+        )
+        encoded = {k: v.to(_device) for k, v in encoded.items()}
+
+        with torch.no_grad():
+            logits = _model(**encoded).logits
+            probs = torch.sigmoid(logits).detach().cpu().tolist()
+    _forward_passes += 1
+
+    by_text: Dict[str, Dict[str, float]] = {}
+    for text, row in zip(unique, probs):
+        by_text[text] = {_id2label.get(idx, str(idx)): float(p) for idx, p in enumerate(row)}
+    return [by_text[t or ''] for t in texts]
+
+
+def _infer_label_scores(text: str) -> Dict[str, float]:
+    """Label scores for one text, through the micro-batcher when enabled."""
+    if not bool(getattr(Config, 'INTENT_BATCHING_ENABLED', True)):
+        return _infer_label_scores_batch([text])[0]
+    timeout = float(getattr(Config, 'INTENT_BATCH_TIMEOUT_S', 10.0))
+    return _get_batcher()(text, timeout=timeout)
+
+
+def _get_batcher() -> MicroBatcher:
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(
+                'intent',
+                _infer_label_scores_batch,
+                max_batch_size=int(getattr(Config, 'INTENT_BATCH_MAX_SIZE', 16)),
+                max_wait_ms=float(getattr(Config, 'INTENT_BATCH_MAX_WAIT_MS', 5.0)),
+            )
+    return _batcher
+
+
+def get_intent_batcher_stats() -> Optional[Dict]:
+    """Queue-depth / batch-size histograms, or None until the first batched request."""
+    return _batcher.stats() if _batcher is not None else None
+
+
+def get_intent_cache_stats() -> Dict:
+    stats = _intent_cache.stats()
+    stats['forward_passes'] = _forward_passes
+    return stats
+
+
+def predict_intents(text: str, memo: Optional[Dict[str, Dict]] = None) -> Dict:
     """
     Predict routing intents from user text.
 
+    Label scores are cached in a process-wide LRU keyed by normalized text, so
+    repeated phrasings skip the model. Pass a request-scoped dict as memo to
+    also reuse the full result (including failures) within one request.
+
     Returns:
         {
             'inference_ok': bool,
@@ -140,8 +239,20 @@ def predict_intents(text: str) -> Dict:
             'web_search': bool,
             'diagram_enabled': bool,
             'error': str|None,
+            'cache_hit': bool,
         }
     """
+    memo_key = normalize_text(text)
+    if memo is not None and memo_key in memo:
+        return dict(memo[memo_key])
+
+    result = _predict_intents_uncached(text)
+    if memo is not None:
+        memo[memo_key] = result
+    return dict(result)
+
+
+def _predict_intents_uncached(text: str) -> Dict:
     thresholds = get_thresholds()
     empty_scores = {'web_search': 0.0, 'diagram_enabled': 0.0}
 
@@ -154,28 +265,18 @@ def predict_intents(text: str) -> Dict:
             'web_search': False,
             'diagram_enabled': False,
             'error': 'intent routing disabled',
+            'cache_hit': False,
         }
 
     try:
         _ensure_loaded()
 
-        max_len = int(getattr(Config, 'INTENT_MODEL_MAX_LENGTH', 256) or 256)
-        encoded = _tokenizer(
-            text or '',
-            return_tensors='pt',
-            truncation=True,
-            max_length=max_len,
-        )
-        encoded = {k: v.to(_device) for k, v in encoded.items()}
-
-        with torch.no_grad():
-            logits = _model(**encoded).logits.squeeze(0)
-            probs = torch.sigmoid(logits).detach().cpu().tolist()
-
-        label_scores: Dict[str, float] = {}
-        for idx, p in enumerate(probs):
-            label = _id2label.get(idx, str(idx))
-            label_scores[label] = float(p)
+        cache_key = (_loaded_model_name, _backend, _cache_key(text))
+        label_scores = _intent_cache.get(cache_key)
+        cache_hit = label_scores is not None
+        if not cache_hit:
+            label_scores = _infer_label_scores(text)
+            _intent_cache.put(cache_key, label_scores)
 
         # Guardrails for required labels.
         web_score = float(label_scores.get('web_search', 0.0))
@@ -192,6 +293,7 @@ def predict_intents(text: str) -> Dict:
             'web_search': web_score >= thresholds['web_search'],
             'diagram_enabled': diagram_score >= thresholds['diagram_enabled'],
             'error': None,
+            'cache_hit': cache_hit,
         }
     except Exception as e:
         logger.warning(f"[IntentClassifier] Inference failed, fallback to toggles-only: {e}")
@@ -203,4 +305,5 @@ def predict_intents(text: str) -> Dict:
             'web_search': False,
             'diagram_enabled': False,
             'error': str(e),
+            'cache_hit': False,
         }
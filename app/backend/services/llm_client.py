@@ -0,0 +1,332 @@
+"""
+LLM client abstraction
+Every LLM call site (answers, quizzes, query rewriting, tool detection, subject
+classification) goes through an LLMClient, so the provider can be swapped
+(LLM_BACKEND) — e.g. for the deterministic local fake, which needs no network
+and makes the whole app load-testable offline.
+
+    client = get_llm_client()
+    client.generate(prompt, task="quiz", generation_config={...}).text
+    for delta in client.stream(prompt, task="answer", generation_config={...}): ...
+
+`task` names the call site (see TASKS). Gemini ignores it; the fake uses it to
+return output the caller can parse (quiz JSON, a one-word tool decision, ...).
+
+Backends:
+- gemini : google-generativeai (default). genai.configure runs once per process,
+           and the GenerativeModel for each (model, generation_config) pair is
+           built once and kept in an LRU (LLM_MODEL_CACHE_SIZE). Every handle
+           talks through genai's shared service client, so calls reuse its
+           connection instead of paying setup cost per request
+- fake   : deterministic output derived from the prompt, emitted word by word at
+           LLM_FAKE_TOKENS_PER_S after LLM_FAKE_LATENCY_MS
+
+With LLM_SCHEDULER_ENABLED the backend is wrapped in ScheduledLLMClient: each
+call first takes a rate-limit / concurrency permit for its model, by task
+priority (see llm_scheduler).
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, Tuple
+
+from app.backend.config import Config
+from app.backend.services.llm_scheduler import LLMScheduler
+from app.backend.services.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+TASKS = (
+    'answer',                   # generation.generate_answer / stream_answer
+    'quiz',                     # generation.generate_quiz
+    'rewrite.fusion',           # QueryRewriter strategies
+    'rewrite.expansion',
+    'rewrite.decomposition',
+    'rewrite.hyde',
+    'tool.detect',              # tool_detection
+    'tool.mermaid',
+    'tool.desmos',
+    'classification',           # classification.llm_classify_subject_fallback
+)
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    model: str
+    finish_reason: str = 'COMPLETED'
+
+
+class LLMClient:
+    """Interface: one-shot and streaming text generation."""
+
+    name = 'base'
+
+    def generate(
+        self,
+        prompt: str,
+        *,
+        task: str = 'answer',
+        model: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+    ) -> LLMResponse:
+        raise NotImplementedError
+
+    def stream(
+        self,
+        prompt: str,
+        *,
+        task: str = 'answer',
+        model: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+    ) -> Iterator[str]:
+        """Yield text deltas as they arrive. Default: one delta with the full answer."""
+        yield self.generate(prompt, task=task, model=model, generation_config=generation_config).text
+
+    def stats(self) -> Dict:
+        return {'backend': self.name}
+
+
+class GeminiClient(LLMClient):
+    name = 'gemini'
+
+    def __init__(self, cache_size: int = None):
+        self._configured = False
+        self._lock = threading.Lock()
+        self._models = LRUCache(Config.LLM_MODEL_CACHE_SIZE if cache_size is None else cache_size)
+        self.models_built = 0
+
+    @staticmethod
+    def _model_key(model: Optional[str], generation_config: Optional[Dict]) -> Tuple[str, str]:
+        config = json.dumps(generation_config or {}, sort_keys=True, default=str)
+        return model or Config.LLM_MODEL, config
+
+    def _model(self, model: Optional[str], generation_config: Optional[Dict]):
+        """The cached GenerativeModel for this (model, generation_config); built on first use."""
+        key = self._model_key(model, generation_config)
+        handle = self._models.get(key)
+        if handle is not None:
+            return handle
+
+        import google.generativeai as genai
+
+        with self._lock:
+            if not self._configured:
+                genai.configure(api_key=Config.GEMINI_API_KEY)
+                self._configured = True
+            handle = self._models.get(key)
+            if handle is None:
+                handle = genai.GenerativeModel(
+                    model_name=key[0],
+                    generation_config=generation_config or None,
+                )
+                self._models.put(key, handle)
+                self.models_built += 1
+        return handle
+
+    def stats(self) -> Dict:
+        return {'backend': self.name, 'models_built': self.models_built, 'model_cache': self._models.stats()}
+
+    @staticmethod
+    def _text(response) -> str:
+        try:
+            return response.text
+        except ValueError:  # several parts, or none (e.g. stopped at max tokens)
+            return "".join(getattr(part, 'text', '') for part in response.parts)
+
+    @staticmethod
+    def _finish_reason(response) -> str:
+        try:
+            reason = response.candidates[0].finish_reason
+            return getattr(reason, 'name', str(reason))
+        except (AttributeError, IndexError):
+            return 'COMPLETED'
+
+    def generate(self, prompt, *, task='answer', model=None, generation_config=None) -> LLMResponse:
+        response = self._model(model, generation_config).generate_content(prompt)
+        return LLMResponse(
+            text=self._text(response),
+            model=model or Config.LLM_MODEL,
+            finish_reason=self._finish_reason(response),
+        )
+
+    def stream(self, prompt, *, task='answer', model=None, generation_config=None) -> Iterator[str]:
+        response = self._model(model, generation_config).generate_content(prompt, stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:  # chunk without text parts (e.g. safety or finish metadata)
+                continue
+            if text:
+                yield text
+
+
+class FakeLLMClient(LLMClient):
+    """
+    Offline stand-in: the output is a deterministic function of (task, prompt),
+    so repeated runs produce identical output, and it has the shape each call
+    site parses. Latency is LLM_FAKE_LATENCY_MS plus one word per
+    1 / LLM_FAKE_TOKENS_PER_S seconds.
+    """
+
+    name = 'fake'
+
+    _WORDS = (
+        'the', 'answer', 'is', 'based', 'on', 'the', 'provided', 'sources', 'and',
+        'explains', 'each', 'step', 'with', 'a', 'short', 'example', '[S1]', '[S2]',
+    )
+
+    def __init__(self, latency_ms: float = None, tokens_per_s: float = None, answer_tokens: int = None):
+        self.latency_s = (Config.LLM_FAKE_LATENCY_MS if latency_ms is None else latency_ms) / 1000.0
+        self.tokens_per_s = Config.LLM_FAKE_TOKENS_PER_S if tokens_per_s is None else tokens_per_s
+        self.answer_tokens = Config.LLM_FAKE_ANSWER_TOKENS if answer_tokens is None else answer_tokens
+
+    # ── output per task ──────────────────────────────────────────────────
+    @staticmethod
+    def _digest(prompt: str) -> bytes:
+        return hashlib.sha256((prompt or '').encode('utf-8')).digest()
+
+    def _words(self, prompt: str, n: int) -> str:
+        digest = self._digest(prompt)
+        return ' '.join(self._WORDS[digest[i % len(digest)] % len(self._WORDS)] for i in range(n))
+
+    @staticmethod
+    def _quoted_query(prompt: str) -> str:
+        """The user's question, which every rewrite prompt quotes (after a label, if any)."""
+        match = (
+            re.search(r'(?:asks|Original|Question|Query):\s*"([^"\n]{1,500})"', prompt or '')
+            or re.search(r'"([^"\n]{3,500})"', prompt or '')
+        )
+        return match.group(1) if match else 'the question'
+
+    @staticmethod
+    def _question_line(prompt: str) -> str:
+        match = re.search(r'^Question:\s*(.*)$', prompt or '', flags=re.MULTILINE)
+        return (match.group(1) if match else '').lower()
+
+    def _quiz(self, prompt: str) -> str:
+        match = re.search(r'Generate exactly (\d+) questions', prompt or '')
+        count = int(match.group(1)) if match else 5
+        multi = 'All questions must be multi-select' in (prompt or '')
+        digest = self._digest(prompt)
+        questions = []
+        for i in range(1, count + 1):
+            letters = 'ABCD'
+            correct = [letters[digest[i % len(digest)] % 4]]
+            if multi:
+                correct.append(letters[(letters.index(correct[0]) + 1) % 4])
+            questions.append({
+                'id': i,
+                'type': 'multi_select' if multi else 'mcq',
+                'question': f"{'Select all that apply: ' if multi else ''}Which statement about topic {i} is supported by the sources?",
+                'options': [f"{letter}. {self._words(prompt + letter + str(i), 6)}" for letter in letters],
+                'correct': correct,
+                'explanation': self._words(prompt + str(i), 10),
+            })
+        return json.dumps({'questions': questions})
+
+    def _tool_decision(self, prompt: str) -> str:
+        question = self._question_line(prompt)
+        if any(w in question for w in ('diagram', 'flowchart', 'chart')):
+            return 'MERMAID'
+        if any(w in question for w in ('plot', 'graph', 'y=', 'f(x)')):
+            return 'DESMOS'
+        return 'NONE'
+
+    def _text_for(self, task: str, prompt: str) -> str:
+        query = self._quoted_query(prompt)
+        if task == 'quiz':
+            return self._quiz(prompt)
+        if task == 'rewrite.fusion':
+            return query
+        if task in ('rewrite.expansion', 'rewrite.decomposition'):
+            return f"1. {query}\n2. {query} {self._words(prompt, 3)}"
+        if task == 'rewrite.hyde':
+            return f"{query} {self._words(prompt, 60)}."
+        if task == 'tool.detect':
+            return self._tool_decision(prompt)
+        if task == 'tool.mermaid':
+            return json.dumps({
+                'nodes': [{'id': f'n{i}', 'label': f'Step {i}', 'shape': 'round'} for i in range(1, 4)],
+                'edges': [{'from': 'n1', 'to': 'n2', 'label': ''}, {'from': 'n2', 'to': 'n3', 'label': ''}],
+            })
+        if task == 'tool.desmos':
+            return json.dumps(['y=x^2', 'y=2x+1'])
+        if task == 'classification':
+            subjects = Config.VALID_SUBJECTS
+            return subjects[self._digest(prompt)[0] % len(subjects)]
+        return self._words(prompt, self.answer_tokens)
+
+    # ── LLMClient ────────────────────────────────────────────────────────
+    def stream(self, prompt, *, task='answer', model=None, generation_config=None) -> Iterator[str]:
+        if self.latency_s > 0:
+            time.sleep(self.latency_s)
+        delay = 1.0 / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+        # Split after each run of whitespace, so the deltas join back to the exact text
+        for token in re.findall(r'\S+\s*|\s+', self._text_for(task, prompt)):
+            if delay:
+                time.sleep(delay)
+            yield token
+
+    def generate(self, prompt, *, task='answer', model=None, generation_config=None) -> LLMResponse:
+        text = ''.join(self.stream(prompt, task=task, model=model, generation_config=generation_config))
+        return LLMResponse(text=text, model=f"fake:{model or Config.LLM_MODEL}")
+
+
+class ScheduledLLMClient(LLMClient):
+    """Wraps a backend so every call holds a scheduler permit (streams: until the last delta)."""
+
+    def __init__(self, inner: LLMClient, scheduler: LLMScheduler):
+        self.inner = inner
+        self.scheduler = scheduler
+        self.name = inner.name
+
+    def generate(self, prompt, *, task='answer', model=None, generation_config=None) -> LLMResponse:
+        with self.scheduler.permit(model or Config.LLM_MODEL, task):
+            return self.inner.generate(prompt, task=task, model=model, generation_config=generation_config)
+
+    def stream(self, prompt, *, task='answer', model=None, generation_config=None) -> Iterator[str]:
+        with self.scheduler.permit(model or Config.LLM_MODEL, task):
+            yield from self.inner.stream(prompt, task=task, model=model, generation_config=generation_config)
+
+    def stats(self) -> Dict:
+        return {**self.inner.stats(), 'scheduler': self.scheduler.stats()}
+
+
+_BACKENDS = {
+    'gemini': GeminiClient,
+    'fake': FakeLLMClient,
+}
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Process-wide client for Config.LLM_BACKEND (created once)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            backend = (Config.LLM_BACKEND or 'gemini').lower()
+            if backend not in _BACKENDS:
+                raise ValueError(f"Unknown LLM_BACKEND '{backend}' (expected one of {sorted(_BACKENDS)})")
+            _client = _BACKENDS[backend]()
+            if Config.LLM_SCHEDULER_ENABLED:
+                _client = ScheduledLLMClient(_client, LLMScheduler.from_config())
+            logger.info(f"[LLM] Using '{backend}' client (scheduler={'on' if Config.LLM_SCHEDULER_ENABLED else 'off'})")
+    return _client
+
+
+def get_llm_client_stats() -> Dict:
+    return get_llm_client().stats()
+
+
+def set_llm_client(client: Optional[LLMClient]) -> None:
+    """Swap the process-wide client (tests, benchmarks); None re-reads LLM_BACKEND."""
+    global _client
+    with _client_lock:
+        _client = client
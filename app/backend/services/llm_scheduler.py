@@ -0,0 +1,275 @@
+"""
+Scheduler for outbound LLM calls
+One /api/query can fan out into several LLM calls (context fusion, HyDE with a
+retry, decomposition, the answer, two tool-detection calls), so a burst of
+users quickly exceeds the provider's rate limit. Every call therefore takes a
+permit from its model's lane first:
+- token bucket   : LLM_RATE_LIMIT_RPM requests per minute, bursts of up to
+                   LLM_RATE_LIMIT_BURST
+- concurrency    : at most LLM_MAX_CONCURRENT calls in flight per model
+- priority queue : waiting calls are served by task class, answers first
+                   (answer, quiz > classification > rewrite.* > tool.*), FIFO
+                   within a class
+- deadlines      : a call gives up after LLM_QUEUE_TIMEOUT_S in the queue;
+                   optional tasks (rewrite.*, tool.*) after
+                   LLM_OPTIONAL_QUEUE_TIMEOUT_S, and at once when the bucket
+                   cannot serve them in that time
+
+A call that does not get a permit raises LLMOverloadedError. The optional
+call sites already fall back on errors (original query, no tool), so under
+load they are shed and the answer still goes out. A provider 429 empties the
+bucket, so the calls queued behind it back off instead of failing too.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from app.backend.config import Config
+from app.backend.services.metrics import Counter, HistogramFamily, register
+
+logger = logging.getLogger(__name__)
+
+# Task prefix -> priority (lower is served first)
+PRIORITIES = {
+    'answer': 0,
+    'quiz': 0,
+    'classification': 1,
+    'rewrite': 2,
+    'tool': 3,
+}
+OPTIONAL = ('rewrite', 'tool')
+
+_queue_wait = register(HistogramFamily(
+    "rag_llm_queue_wait_seconds",
+    [0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30],
+    ("model", "task"),
+    "Time LLM calls waited for a rate-limit / concurrency permit",
+))
+_shed_total = register(Counter("rag_llm_shed_total", "LLM calls dropped by the scheduler (deadline or shed)"))
+
+
+class LLMOverloadedError(RuntimeError):
+    """No permit within the call's deadline (reason 'deadline') or shed up front (reason 'shed')."""
+
+    def __init__(self, model: str, task: str, reason: str, waited_s: float):
+        super().__init__(f"LLM call {task} on {model} {reason} after {waited_s * 1000:.0f} ms in queue")
+        self.model = model
+        self.task = task
+        self.reason = reason
+        self.waited_s = waited_s
+
+
+def task_class(task: str) -> str:
+    return (task or 'answer').split('.', 1)[0]
+
+
+def task_priority(task: str) -> int:
+    return PRIORITIES.get(task_class(task), PRIORITIES['rewrite'])
+
+
+def is_optional(task: str) -> bool:
+    return task_class(task) in OPTIONAL
+
+
+class TokenBucket:
+    """Requests-per-second bucket; not locked itself, the owning lane's lock guards it."""
+
+    def __init__(self, rate_per_s: float, burst: int):
+        self.rate = float(rate_per_s)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, now: float) -> bool:
+        if self.unlimited:
+            return True
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def seconds_until(self, needed: float, now: float) -> float:
+        """Time until `needed` tokens are available (ignoring other takers)."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (needed - self.tokens) / self.rate)
+
+    def drain(self, now: float) -> None:
+        self._refill(now)
+        self.tokens = 0.0
+
+
+class _Lane:
+    """Bucket, in-flight count and priority-ordered wait queue of one model."""
+
+    def __init__(self, rate_per_s: float, burst: int, max_concurrent: int):
+        self.bucket = TokenBucket(rate_per_s, burst)
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.in_flight = 0
+        self.waiting: List[Tuple[int, int]] = []  # heap of (priority, seq)
+        self.cond = threading.Condition()
+        self.granted = 0
+        self.shed: Dict[str, int] = {}
+        self.rate_limited = 0
+
+    def ahead_of(self, entry: Tuple[int, int]) -> int:
+        return sum(1 for other in self.waiting if other < entry)
+
+
+class LLMScheduler:
+    """Thread-safe; one lane per model name, created on first use with the default limits."""
+
+    def __init__(
+        self,
+        rpm: float,
+        burst: int,
+        max_concurrent: int,
+        queue_timeout_s: float,
+        optional_timeout_s: float,
+    ):
+        self.rpm = float(rpm)
+        self.burst = int(burst)
+        self.max_concurrent = int(max_concurrent)
+        self.queue_timeout_s = float(queue_timeout_s)
+        self.optional_timeout_s = float(optional_timeout_s)
+        self._lanes: Dict[str, _Lane] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_config(cls) -> "LLMScheduler":
+        return cls(
+            Config.LLM_RATE_LIMIT_RPM,
+            Config.LLM_RATE_LIMIT_BURST,
+            Config.LLM_MAX_CONCURRENT,
+            Config.LLM_QUEUE_TIMEOUT_S,
+            Config.LLM_OPTIONAL_QUEUE_TIMEOUT_S,
+        )
+
+    def configure_model(self, model: str, rpm: float, burst: int, max_concurrent: int) -> None:
+        """Give one model its own limits (e.g. a higher quota); call before it receives traffic."""
+        with self._lock:
+            self._lanes[model] = _Lane(rpm / 60.0, burst, max_concurrent)
+
+    def _lane(self, model: str) -> _Lane:
+        with self._lock:
+            lane = self._lanes.get(model)
+            if lane is None:
+                lane = self._lanes[model] = _Lane(self.rpm / 60.0, self.burst, self.max_concurrent)
+            return lane
+
+    def _timeout_for(self, task: str) -> float:
+        return self.optional_timeout_s if is_optional(task) else self.queue_timeout_s
+
+    def acquire(self, model: str, task: str, timeout_s: Optional[float] = None) -> float:
+        """Block until the call may start; returns the seconds waited. Raises LLMOverloadedError."""
+        lane = self._lane(model)
+        timeout_s = self._timeout_for(task) if timeout_s is None else timeout_s
+        start = time.monotonic()
+        deadline = start + timeout_s
+        entry = (task_priority(task), next(self._seq))
+
+        with lane.cond:
+            heapq.heappush(lane.waiting, entry)
+            try:
+                if is_optional(task):
+                    # Shed up front when the bucket cannot reach this call before its deadline
+                    needed = lane.ahead_of(entry) + 1
+                    if lane.bucket.seconds_until(needed, start) > timeout_s:
+                        raise self._reject(lane, model, task, 'shed', start)
+                while True:
+                    now = time.monotonic()
+                    if lane.waiting[0] == entry and lane.in_flight < lane.max_concurrent:
+                        if lane.bucket.try_take(now):
+                            lane.in_flight += 1
+                            lane.granted += 1
+                            break
+                        wait = lane.bucket.seconds_until(1.0, now)
+                    else:
+                        wait = deadline - now  # woken by release() or a call ahead of us
+                    if now >= deadline:
+                        raise self._reject(lane, model, task, 'deadline', start)
+                    lane.cond.wait(max(0.001, min(wait, deadline - now)))
+            finally:
+                lane.waiting.remove(entry)
+                heapq.heapify(lane.waiting)
+                lane.cond.notify_all()
+
+        waited = time.monotonic() - start
+        _queue_wait.labels(model, task_class(task)).observe(waited)
+        return waited
+
+    def _reject(self, lane: _Lane, model: str, task: str, reason: str, start: float) -> LLMOverloadedError:
+        lane.shed[task] = lane.shed.get(task, 0) + 1
+        _shed_total.inc()
+        waited = time.monotonic() - start
+        logger.warning(
+            f"[LLMScheduler] {reason}: {task} on {model} after {waited * 1000:.0f} ms "
+            f"(in flight={lane.in_flight}, queued={len(lane.waiting) - 1})"
+        )
+        return LLMOverloadedError(model, task, reason, waited)
+
+    def release(self, model: str, rate_limited: bool = False) -> None:
+        """End a call; rate_limited (provider 429) empties the bucket so queued calls back off."""
+        lane = self._lane(model)
+        with lane.cond:
+            lane.in_flight -= 1
+            if rate_limited:
+                lane.rate_limited += 1
+                lane.bucket.drain(time.monotonic())
+            lane.cond.notify_all()
+
+    @contextmanager
+    def permit(self, model: str, task: str, timeout_s: Optional[float] = None):
+        self.acquire(model, task, timeout_s)
+        rate_limited = False
+        try:
+            yield
+        except Exception as e:
+            rate_limited = is_rate_limit_error(e)
+            raise
+        finally:
+            self.release(model, rate_limited=rate_limited)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lanes = dict(self._lanes)
+        out = {}
+        for model, lane in sorted(lanes.items()):
+            with lane.cond:
+                out[model] = {
+                    'rpm': round(lane.bucket.rate * 60, 1),
+                    'burst': lane.bucket.capacity,
+                    'tokens': None if lane.bucket.unlimited else round(lane.bucket.tokens, 2),
+                    'max_concurrent': lane.max_concurrent,
+                    'in_flight': lane.in_flight,
+                    'queued': len(lane.waiting),
+                    'granted': lane.granted,
+                    'shed': dict(lane.shed),
+                    'rate_limited': lane.rate_limited,
+                }
+        return {
+            'queue_timeout_s': self.queue_timeout_s,
+            'optional_queue_timeout_s': self.optional_timeout_s,
+            'models': out,
+            'queue_wait': _queue_wait.snapshot(),
+        }
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """Provider quota errors (google.api_core ResourceExhausted / HTTP 429)."""
+    return type(e).__name__ in ('ResourceExhausted', 'TooManyRequests') or getattr(e, 'code', None) == 429
@@ -0,0 +1,173 @@
+"""
+In-process metric primitives
+Thread-safe counters and fixed-bucket histograms for the inference services
+(intent batching, reranking, ...) and the query pipeline (tracing). Snapshots
+are plain dicts for the stats endpoints; render_prometheus() serves every
+registered metric in the Prometheus text format for /metrics.
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class Histogram:
+    """Fixed upper-bound buckets (Prometheus-style 'le'), plus count and sum."""
+
+    def __init__(self, name: str, buckets: Sequence[float], description: str = ""):
+        self.name = name
+        self.description = description
+        self.buckets: List[float] = sorted(float(b) for b in buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot: +Inf
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self) -> Dict:
+        """Cumulative bucket counts keyed by upper bound (as strings, '+Inf' last)."""
+        with self._lock:
+            counts = list(self._counts)
+            total, total_sum = self._count, self._sum
+        cumulative: Dict[str, int] = {}
+        running = 0
+        for bound, n in zip(self.buckets + [float("inf")], counts):
+            running += n
+            cumulative["+Inf" if bound == float("inf") else _fmt_bound(bound)] = running
+        return {
+            "buckets": cumulative,
+            "count": total,
+            "sum": round(total_sum, 6),
+            "mean": round(total_sum / total, 6) if total else None,
+        }
+
+
+class Counter:
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        with self._lock:
+            return self._value
+
+
+class HistogramFamily:
+    """Histograms sharing one name, one child per combination of label values."""
+
+    def __init__(self, name: str, buckets: Sequence[float], labelnames: Sequence[str], description: str = ""):
+        self.name = name
+        self.description = description
+        self.buckets = list(buckets)
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> Histogram:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        key = tuple(str(v) for v in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = Histogram(self.name, self.buckets, self.description)
+            return child
+
+    def children(self) -> Dict[Tuple[str, ...], Histogram]:
+        with self._lock:
+            return dict(self._children)
+
+    def snapshot(self) -> Dict:
+        return {
+            ",".join(f"{n}={v}" for n, v in zip(self.labelnames, key)): child.snapshot()
+            for key, child in sorted(self.children().items())
+        }
+
+
+def _fmt_bound(bound: float) -> str:
+    return str(int(bound)) if float(bound).is_integer() else repr(bound)
+
+
+def size_buckets(max_size: int) -> List[float]:
+    """1, 2, 4, ... up to max_size (inclusive) for batch-size / queue-depth histograms."""
+    buckets: List[float] = []
+    b = 1
+    while b < max_size:
+        buckets.append(b)
+        b *= 2
+    buckets.append(max(max_size, 1))
+    return buckets
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def register(metric):
+    """Register a metric under its name (returns the already-registered one if present)."""
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def get_metric(name: str) -> Optional[object]:
+    with _registry_lock:
+        return _registry.get(name)
+
+
+def all_metrics() -> Dict[str, object]:
+    with _registry_lock:
+        return dict(_registry)
+
+
+# ── Prometheus text exposition ───────────────────────────────────────────
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels.items()) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _histogram_lines(name: str, labels: Dict[str, str], snap: Dict) -> List[str]:
+    lines = [f"{name}_bucket{_label_str(labels, ('le', le))} {n}" for le, n in snap["buckets"].items()]
+    lines.append(f"{name}_sum{_label_str(labels)} {snap['sum']}")
+    lines.append(f"{name}_count{_label_str(labels)} {snap['count']}")
+    return lines
+
+
+def render_prometheus() -> str:
+    """Every registered metric in the Prometheus text exposition format (0.0.4)."""
+    lines: List[str] = []
+    for name, metric in sorted(all_metrics().items()):
+        if metric.description:
+            lines.append(f"# HELP {name} {metric.description}")
+        if isinstance(metric, Counter):
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {metric.value}")
+        elif isinstance(metric, Histogram):
+            lines.append(f"# TYPE {name} histogram")
+            lines.extend(_histogram_lines(name, {}, metric.snapshot()))
+        elif isinstance(metric, HistogramFamily):
+            lines.append(f"# TYPE {name} histogram")
+            for key, child in sorted(metric.children().items()):
+                lines.extend(_histogram_lines(name, dict(zip(metric.labelnames, key)), child.snapshot()))
+    return "\n".join(lines) + "\n"
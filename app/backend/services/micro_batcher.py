@@ -0,0 +1,163 @@
+"""
+Dynamic micro-batching for model inference
+Concurrent callers submit single items; a background thread groups them into
+batches (bounded by max_batch_size and max_wait_ms from the first queued item),
+runs one batched call, and hands each caller its own result. With workers > 1,
+up to that many batches run at the same time (each worker collects its own).
+
+Exports per-batcher histograms through services.metrics:
+- <name>_queue_depth : items waiting when a new item is submitted
+- <name>_batch_size  : items per executed batch
+- <name>_wait_ms     : time an item spent queued before its batch started
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+from app.backend.services.metrics import Counter, Histogram, register, size_buckets
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_STOP = object()
+
+
+class _Item:
+    __slots__ = ("payload", "future", "enqueued_at")
+
+    def __init__(self, payload, future: Future):
+        self.payload = payload
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    process_batch(payloads) must return one result per payload, in order.
+    If it raises, every caller in that batch gets the exception.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process_batch: Callable[[List[T]], List[R]],
+        *,
+        max_batch_size: int,
+        max_wait_ms: float,
+        workers: int = 1,
+    ):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self.workers = max(1, int(workers))
+        self._queue: "queue.Queue" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+
+        self.queue_depth = register(Histogram(
+            f"{name}_queue_depth", size_buckets(max(64, self.max_batch_size * 4)),
+            "Items already waiting when a new item is submitted",
+        ))
+        self.batch_size = register(Histogram(
+            f"{name}_batch_size", size_buckets(self.max_batch_size),
+            "Items per executed batch",
+        ))
+        self.wait_ms = register(Histogram(
+            f"{name}_wait_ms", [0.5, 1, 2, 5, 10, 20, 50, 100, 250, 1000],
+            "Queueing delay before the item's batch started (ms)",
+        ))
+        self.batches = register(Counter(f"{name}_batches_total", "Executed batches"))
+
+    # ── public API ───────────────────────────────────────────────────────
+    def submit(self, payload: T) -> "Future[R]":
+        self._ensure_started()
+        future: Future = Future()
+        self.queue_depth.observe(self._queue.qsize())
+        self._queue.put(_Item(payload, future))
+        return future
+
+    def __call__(self, payload: T, timeout: Optional[float] = None) -> R:
+        """Submit and wait for the result."""
+        return self.submit(payload).result(timeout=timeout)
+
+    def stop(self) -> None:
+        for _ in self._threads:
+            self._queue.put(_STOP)
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait_s * 1000, 3),
+            "workers": self.workers,
+            "pending": self._queue.qsize(),
+            "batches": self.batches.value,
+            "queue_depth": self.queue_depth.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+            "wait_ms": self.wait_ms.snapshot(),
+        }
+
+    # ── worker ───────────────────────────────────────────────────────────
+    def _ensure_started(self) -> None:
+        if len(self._threads) == self.workers and all(t.is_alive() for t in self._threads):
+            return
+        with self._start_lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._loop, name=f"{self.name}-batcher-{len(self._threads)}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _collect(self, first: _Item) -> List[_Item]:
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # handle after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            # Callers that already gave up (cancelled) are skipped
+            batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for item in batch:
+                self.wait_ms.observe((started - item.enqueued_at) * 1000)
+            self.batch_size.observe(len(batch))
+            self.batches.inc()
+
+            try:
+                results = self.process_batch([item.payload for item in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"{self.name}: batch returned {len(results)} results for {len(batch)} items"
+                    )
+            except Exception as e:
+                logger.warning(f"[MicroBatcher] {self.name} batch of {len(batch)} failed: {e}")
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+
+            for item, result in zip(batch, results):
+                item.future.set_result(result)
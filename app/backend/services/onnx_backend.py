@@ -0,0 +1,380 @@
+"""
+ONNX Runtime inference backend
+Exports the embedder, cross-encoder and intent classifier to ONNX, applies
+dynamic INT8 quantization, and serves them through ONNX Runtime on CPU.
+
+Selected per model with EMBEDDING_BACKEND / RERANK_BACKEND / INTENT_BACKEND
+(default INFERENCE_BACKEND): 'torch' keeps the FP32 PyTorch models, 'onnx'
+uses the quantized export. The first load exports into Config.ONNX_MODEL_DIR
+and checks the INT8 outputs against the FP32 PyTorch model on a fixed sample
+set; the result is stored next to the model (report.json). If the check fails,
+the caller falls back to PyTorch (ONNX_FALLBACK_ON_ACCURACY_FAIL).
+
+Tasks:
+- embedding     : mean-pooled, L2-normalized sentence vectors
+- cross-encoder : one relevance score per (query, passage) pair
+- classifier    : per-label sigmoid probabilities (multi-label)
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import onnxruntime as ort
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+from app.backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+TASKS = ("embedding", "cross-encoder", "classifier")
+
+# Fixed sample set for the FP32 vs INT8 check (mixed English / Chinese, like the course material)
+ACCURACY_QUERIES = [
+    "What is gradient descent and why does the learning rate matter?",
+    "Explain the difference between supply and demand curves",
+    "How does photosynthesis produce ATP?",
+    "什么是矩阵的特征值？",
+    "Search online for the latest research on transformers",
+    "Draw a diagram of the TCP three-way handshake",
+    "解释一下数据库的规范化",
+    "What is the time complexity of merge sort?",
+]
+ACCURACY_PASSAGES = [
+    "Gradient descent updates the parameters in the direction of the negative gradient of the loss; "
+    "too large a learning rate makes training diverge.",
+    "The equilibrium price is where the quantity supplied equals the quantity demanded.",
+    "The light-dependent reactions take place in the thylakoid membranes and produce ATP and NADPH.",
+    "特征值是满足 Av = λv 的标量 λ，其中 v 是非零向量。",
+    "Merge sort splits the list in half, sorts both halves recursively and merges them in linear time.",
+    "数据库规范化通过消除冗余来减少更新异常。",
+]
+
+_warned: Dict[str, bool] = {}
+_load_lock = threading.Lock()
+
+
+def resolve_backend(requested: str) -> str:
+    """'onnx' only when onnxruntime is importable; anything else means 'torch'."""
+    backend = (requested or "torch").strip().lower()
+    if backend != "onnx":
+        return "torch"
+    if not ONNXRUNTIME_AVAILABLE:
+        if not _warned.get("ort"):
+            logger.warning("[ONNX] onnxruntime is not installed, using the PyTorch backend")
+            _warned["ort"] = True
+        return "torch"
+    return "onnx"
+
+
+def backend_model_key(model_name: str, backend: str) -> str:
+    """Cache key for a model's outputs; quantized outputs must not mix with FP32 ones."""
+    return model_name if backend != "onnx" else f"{model_name}#onnx-int8"
+
+
+def _model_dir(model_name: str, task: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+    return os.path.join(Config.ONNX_MODEL_DIR, f"{slug}.{task}")
+
+
+# ── post-processing (shared by the ONNX runtime path and the FP32 reference) ──
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _mean_pool(last_hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (last_hidden * mask).sum(axis=1)
+    pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+def _cross_encoder_activation(config) -> str:
+    """Same default as sentence-transformers' CrossEncoder.predict."""
+    name = getattr(config, "sbert_ce_default_activation_function", None)
+    if name:
+        return "sigmoid" if "Sigmoid" in name else "identity"
+    return "sigmoid" if getattr(config, "num_labels", 1) == 1 else "identity"
+
+
+def _postprocess(task: str, output: np.ndarray, attention_mask: np.ndarray, config) -> np.ndarray:
+    output = output.astype(np.float32)
+    if task == "embedding":
+        return _mean_pool(output, attention_mask)
+    if task == "cross-encoder":
+        scores = output[:, 0] if getattr(config, "num_labels", 1) == 1 else output
+        return _sigmoid(scores) if _cross_encoder_activation(config) == "sigmoid" else scores
+    return _sigmoid(output)
+
+
+def _default_max_length(task: str, tokenizer) -> int:
+    if task == "embedding":
+        return Config.ONNX_EMBEDDING_MAX_LENGTH
+    if task == "classifier":
+        return int(getattr(Config, "INTENT_MODEL_MAX_LENGTH", 256) or 256)
+    return min(int(getattr(tokenizer, "model_max_length", 512) or 512), 512)
+
+
+def _tokenize(tokenizer, inputs, max_length: int, tensors: str):
+    """inputs: list of texts, or list of (text, text_pair) tuples for the cross-encoder."""
+    if inputs and isinstance(inputs[0], (tuple, list)):
+        first = [a for a, _ in inputs]
+        second = [b for _, b in inputs]
+        return tokenizer(first, second, padding=True, truncation=True, max_length=max_length, return_tensors=tensors)
+    return tokenizer(list(inputs), padding=True, truncation=True, max_length=max_length, return_tensors=tensors)
+
+
+# ── export + quantization ────────────────────────────────────────────────
+def _load_torch_model(model_name: str, task: str):
+    from transformers import AutoModel, AutoModelForSequenceClassification
+
+    if task == "embedding":
+        model = AutoModel.from_pretrained(model_name)
+    else:
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    return model
+
+
+def _torch_reference(model, tokenizer, task: str, inputs, max_length: int) -> np.ndarray:
+    """FP32 PyTorch outputs after the same post-processing as the ONNX path."""
+    import torch
+
+    encoded = _tokenize(tokenizer, inputs, max_length, "pt")
+    with torch.no_grad():
+        out = model(**encoded)
+    raw = out.last_hidden_state if task == "embedding" else out.logits
+    return _postprocess(task, raw.numpy(), encoded["attention_mask"].numpy(), model.config)
+
+
+def _accuracy_inputs(task: str):
+    if task == "cross-encoder":
+        return [(q, p) for q in ACCURACY_QUERIES for p in ACCURACY_PASSAGES]
+    if task == "embedding":
+        return ACCURACY_QUERIES + ACCURACY_PASSAGES
+    return ACCURACY_QUERIES
+
+
+def _export_fp32(model, tokenizer, task: str, path: str) -> None:
+    import torch
+
+    output_name = "last_hidden_state" if task == "embedding" else "logits"
+    sample = _tokenize(tokenizer, _accuracy_inputs(task)[:2], 32, "pt")
+    input_names = [n for n in tokenizer.model_input_names if n in sample]
+
+    class _NamedInputs(torch.nn.Module):
+        """Positional wrapper so export does not depend on forward()'s argument order."""
+
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *tensors):
+            return self.inner(**dict(zip(input_names, tensors)))[output_name]
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch", 1: "sequence"} if task == "embedding" else {0: "batch"}
+    torch.onnx.export(
+        _NamedInputs(model),
+        tuple(sample[name] for name in input_names),
+        path,
+        input_names=input_names,
+        output_names=[output_name],
+        dynamic_axes=dynamic_axes,
+        opset_version=14,
+        do_constant_folding=True,
+    )
+
+
+def compare_outputs(task: str, reference: np.ndarray, candidate: np.ndarray) -> Dict:
+    """Accuracy of candidate (INT8) outputs against reference (FP32) outputs."""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    if task == "embedding":
+        cos = (reference * candidate).sum(axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1) + 1e-12
+        )
+        return {
+            "min_cosine": round(float(cos.min()), 5),
+            "mean_cosine": round(float(cos.mean()), 5),
+            "passed": bool(cos.min() >= Config.ONNX_MIN_EMBEDDING_COSINE),
+        }
+    if task == "cross-encoder":
+        ranks_ref = reference.argsort().argsort().astype(np.float64)
+        ranks_new = candidate.argsort().argsort().astype(np.float64)
+        spearman = float(np.corrcoef(ranks_ref, ranks_new)[0, 1]) if len(reference) > 1 else 1.0
+        return {
+            "spearman": round(spearman, 5),
+            "max_abs_diff": round(float(np.abs(reference - candidate).max()), 5),
+            "passed": bool(spearman >= Config.ONNX_MIN_RANK_CORRELATION),
+        }
+    drift = float(np.abs(reference - candidate).max())
+    agreement = float(((reference >= 0.5) == (candidate >= 0.5)).mean())
+    return {
+        "max_prob_drift": round(drift, 5),
+        "decision_agreement": round(agreement, 5),
+        "passed": bool(drift <= Config.ONNX_MAX_PROB_DRIFT),
+    }
+
+
+def ensure_exported(model_name: str, task: str, tokenizer=None) -> Tuple[str, Dict]:
+    """
+    Path of the INT8 model and its accuracy report, exporting and quantizing
+    on first use. Files are written under temporary names and renamed, so
+    concurrent workers never load a partial model.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoTokenizer
+
+    model_dir = _model_dir(model_name, task)
+    int8_path = os.path.join(model_dir, "model.int8.onnx")
+    report_path = os.path.join(model_dir, "report.json")
+    if os.path.exists(int8_path) and os.path.exists(report_path):
+        with open(report_path, encoding="utf-8") as f:
+            return int8_path, json.load(f)
+
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_name)
+    max_length = _default_max_length(task, tokenizer)
+    logger.info(f"[ONNX] Exporting {model_name} ({task}) → {model_dir}")
+    t0 = time.perf_counter()
+
+    model = _load_torch_model(model_name, task)
+    tag = f"{os.getpid()}.tmp"
+    fp32_tmp = os.path.join(model_dir, f"model.onnx.{tag}")
+    int8_tmp = os.path.join(model_dir, f"model.int8.onnx.{tag}")
+    _export_fp32(model, tokenizer, task, fp32_tmp)
+    quantize_dynamic(fp32_tmp, int8_tmp, weight_type=QuantType.QInt8)
+
+    # Accuracy check: INT8 ONNX against the FP32 PyTorch model
+    inputs = _accuracy_inputs(task)
+    reference = _torch_reference(model, tokenizer, task, inputs, max_length)
+    candidate = OnnxModel(int8_tmp, task, tokenizer, model.config, max_length=max_length).run(inputs)
+    report = {
+        "model_name": model_name,
+        "task": task,
+        **compare_outputs(task, reference, candidate),
+        "fp32_mb": round(os.path.getsize(fp32_tmp) / 2**20, 1),
+        "int8_mb": round(os.path.getsize(int8_tmp) / 2**20, 1),
+        "export_s": round(time.perf_counter() - t0, 1),
+    }
+
+    os.replace(fp32_tmp, os.path.join(model_dir, "model.onnx"))
+    os.replace(int8_tmp, int8_path)
+    report_tmp = f"{report_path}.{tag}"
+    with open(report_tmp, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    os.replace(report_tmp, report_path)
+    logger.info(f"[ONNX] Exported {model_name} ({task}): {report}")
+    return int8_path, report
+
+
+# ── runtime ──────────────────────────────────────────────────────────────
+def create_session(path: str) -> "ort.InferenceSession":
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if Config.ONNX_INTRA_OP_THREADS > 0:
+        options.intra_op_num_threads = Config.ONNX_INTRA_OP_THREADS
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class OnnxModel:
+    """Tokenizer + ONNX Runtime session; run() returns post-processed outputs."""
+
+    def __init__(self, path: str, task: str, tokenizer, config, max_length: Optional[int] = None):
+        if task not in TASKS:
+            raise ValueError(f"Unknown ONNX task '{task}'")
+        self.path = path
+        self.task = task
+        self.tokenizer = tokenizer
+        self.config = config
+        self.max_length = max_length or _default_max_length(task, tokenizer)
+        self._session = None
+        self._session_pid = None
+        self._forked_sessions = []
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    @property
+    def session(self) -> "ort.InferenceSession":
+        """
+        Per-process session: ONNX Runtime's thread pool does not survive fork,
+        so a worker forked from a preloading master (gunicorn --preload) builds
+        its own. The inherited session is kept referenced, never destroyed,
+        because its destructor would wait on threads that only exist in the master.
+        """
+        if self._session is None or self._session_pid != os.getpid():
+            if self._session is not None:
+                self._forked_sessions.append(self._session)
+            self._session = create_session(self.path)
+            self._session_pid = os.getpid()
+        return self._session
+
+    def run(self, inputs: Sequence[Union[str, Tuple[str, str]]]) -> np.ndarray:
+        encoded = _tokenize(self.tokenizer, list(inputs), self.max_length, "np")
+        feed = {}
+        for name in self.input_names:
+            value = encoded.get(name)
+            if value is None:  # e.g. token_type_ids the tokenizer did not produce
+                value = np.zeros_like(encoded["input_ids"])
+            feed[name] = value.astype(np.int64)
+        output = self.session.run(None, feed)[0]
+        return _postprocess(self.task, output, encoded["attention_mask"], self.config)
+
+
+def load_onnx_model(model_name: str, task: str, tokenizer=None) -> Optional[OnnxModel]:
+    """
+    The quantized model, or None when it failed the accuracy check (and
+    ONNX_FALLBACK_ON_ACCURACY_FAIL is on) so the caller keeps PyTorch.
+    """
+    from transformers import AutoConfig, AutoTokenizer
+
+    with _load_lock:
+        tokenizer = tokenizer or AutoTokenizer.from_pretrained(model_name)
+        path, report = ensure_exported(model_name, task, tokenizer)
+    if not report.get("passed", False):
+        logger.warning(f"[ONNX] {model_name} ({task}) INT8 accuracy check failed: {report}")
+        if Config.ONNX_FALLBACK_ON_ACCURACY_FAIL:
+            return None
+    return OnnxModel(path, task, tokenizer, AutoConfig.from_pretrained(model_name))
+
+
+class OnnxEmbeddings(Embeddings):
+    """Drop-in for HuggingFaceEmbeddings (normalized vectors) on the INT8 model."""
+
+    def __init__(self, model: OnnxModel, model_name: str, batch_size: int = 32):
+        self.model = model
+        self.model_name = backend_model_key(model_name, "onnx")
+        self.batch_size = max(1, int(batch_size))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = [t.replace("\n", " ") for t in texts[start:start + self.batch_size]]
+            vectors.extend(self.model.run(batch).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class OnnxCrossEncoder:
+    """Drop-in for sentence_transformers.CrossEncoder.predict on the INT8 model."""
+
+    def __init__(self, model: OnnxModel, model_name: str):
+        self.model = model
+        self.model_name = backend_model_key(model_name, "onnx")
+
+    def predict(self, sentences, batch_size: int = 32, show_progress_bar: bool = False, **_) -> np.ndarray:
+        pairs = [tuple(p) for p in sentences]
+        scores = [self.model.run(pairs[i:i + batch_size]) for i in range(0, len(pairs), max(1, batch_size))]
+        return np.concatenate(scores) if scores else np.zeros((0,), dtype=np.float32)
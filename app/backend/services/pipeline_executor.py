@@ -0,0 +1,299 @@
+"""
+Stage executor for the query pipeline
+Runs independent stages of a request concurrently on a shared thread pool,
+starts dependent stages as soon as their inputs are ready, and joins them with
+per-stage timeouts. Every stage's wall time is recorded for the response.
+
+Usage:
+    pipeline = StagePipeline()
+    pipeline.add("embed", lambda: model.embed_query(q), timeout=10)
+    pipeline.add("retrieval", lambda vec: search(vec), after=["embed"], default=[])
+    results = pipeline.join()            # {"embed": [...], "retrieval": [...]}
+    pipeline.timings_ms()                # {"embed": 41.2, "retrieval": 12.7}
+
+A stage with a default is optional: on error or timeout the default is used
+(and passed on to dependents). A stage without a default is required: its
+error (or StageTimeout) is raised from join(), and stages after it are skipped.
+StagePipeline(required_timeouts=False) lets required stages run past their
+timeout (cold start: the first call still loads its model).
+
+With StagePipeline(trace=...) every stage and record() call also becomes a
+span of the request's trace (services/tracing.py); `describe` turns a stage's
+value into span attributes, e.g. describe=lambda chunks: {"chunks": len(chunks)}.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from app.backend.config import Config
+from app.backend.services.tracing import Trace
+
+logger = logging.getLogger(__name__)
+
+_NO_DEFAULT = object()
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_stage_pool() -> ThreadPoolExecutor:
+    """Process-wide pool shared by all requests (created once)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=Config.QUERY_PIPELINE_WORKERS,
+                thread_name_prefix="query-stage",
+            )
+    return _pool
+
+
+class StageTimeout(TimeoutError):
+    def __init__(self, stage: str, timeout_s: float):
+        super().__init__(f"Stage '{stage}' timed out after {timeout_s:.1f}s")
+        self.stage = stage
+        self.timeout_s = timeout_s
+
+
+class _Stage:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        after: List[str],
+        timeout_s: float,
+        default: Any,
+        describe: Optional[Callable[[Any], Dict]] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.after = after
+        self.timeout_s = timeout_s
+        self.default = default
+        self.describe = describe
+        self.future: Future = Future()   # resolved with the stage's value (or exception)
+        self.started_at: Optional[float] = None
+        self.seconds: Optional[float] = None
+        self.status = "pending"          # pending | running | ok | failed | timeout | skipped
+
+    def resolve(self, value: Any = None, error: Optional[BaseException] = None) -> bool:
+        """Set the outcome once; later outcomes (e.g. a result after a timeout) are dropped."""
+        try:
+            if error is not None:
+                self.future.set_exception(error)
+            else:
+                self.future.set_result(value)
+            return True
+        except InvalidStateError:
+            return False
+
+
+class StagePipeline:
+    """One request's stage graph. Not shared between requests."""
+
+    def __init__(
+        self,
+        pool: Optional[ThreadPoolExecutor] = None,
+        trace: Optional[Trace] = None,
+        required_timeouts: bool = True,
+    ):
+        self._pool = pool or get_stage_pool()
+        self._trace = trace
+        self._required_timeouts = required_timeouts
+        self._stages: Dict[str, _Stage] = {}
+        self._lock = threading.Lock()
+        self._timings: Dict[str, float] = {}
+        self._cancelled = False
+
+    # ── building ─────────────────────────────────────────────────────────
+    def add(
+        self,
+        name: str,
+        fn: Callable,
+        *,
+        after: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+        default: Any = _NO_DEFAULT,
+        describe: Optional[Callable[[Any], Dict]] = None,
+    ) -> None:
+        """
+        Schedule fn. It is called with the values of the `after` stages as
+        positional arguments, once all of them have finished.
+        """
+        after = list(after or [])
+        missing = [d for d in after if d not in self._stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {missing}")
+        if timeout is None:
+            timeout = Config.QUERY_STAGE_TIMEOUTS.get(name, Config.QUERY_STAGE_DEFAULT_TIMEOUT_S)
+
+        stage = _Stage(name, fn, after, timeout, default, describe)
+        self._stages[name] = stage
+
+        if not after:
+            self._start(stage)
+            return
+        pending = {"n": len(after)}
+        counter_lock = threading.Lock()
+
+        def on_dep_done(_):
+            with counter_lock:
+                pending["n"] -= 1
+                ready = pending["n"] == 0
+            if ready:
+                self._start(stage)
+
+        for dep in after:
+            self._stages[dep].future.add_done_callback(on_dep_done)
+
+    def _dep_value(self, name: str) -> Any:
+        stage = self._stages[name]
+        try:
+            return stage.future.result(timeout=0)
+        except Exception:
+            return None if stage.default is _NO_DEFAULT else stage.default
+
+    def _failed_requirement(self, stage: _Stage) -> Optional[BaseException]:
+        for name in stage.after:
+            dep = self._stages[name]
+            if dep.default is _NO_DEFAULT and dep.future.exception(timeout=0) is not None:
+                return dep.future.exception(timeout=0)
+        return None
+
+    def _start(self, stage: _Stage) -> None:
+        if self._cancelled:
+            stage.status = "skipped"
+            stage.resolve(error=RuntimeError("pipeline cancelled"))
+            return
+        dep_error = self._failed_requirement(stage)
+        if dep_error is not None:
+            # A required input is missing: running would only pass None along
+            stage.status = "skipped"
+            stage.resolve(error=dep_error)
+            return
+        args = [self._dep_value(d) for d in stage.after]
+
+        def run():
+            if self._cancelled:  # still queued in the pool when the request ended
+                stage.status = "skipped"
+                stage.resolve(error=RuntimeError("pipeline cancelled"))
+                return
+            stage.started_at = time.perf_counter()
+            stage.status = "running"
+            try:
+                value = stage.fn(*args)
+            except Exception as e:
+                elapsed = time.perf_counter() - stage.started_at
+                if stage.resolve(error=e):
+                    stage.status, stage.seconds = "failed", elapsed
+                    self._trace_stage(stage, error=str(e)[:200])
+                return
+            elapsed = time.perf_counter() - stage.started_at
+            if stage.resolve(value):
+                stage.status, stage.seconds = "ok", elapsed
+                self._trace_stage(stage, value=value)
+
+        try:
+            self._pool.submit(run)
+        except RuntimeError as e:  # pool shut down (interpreter exit)
+            stage.status = "failed"
+            stage.resolve(error=e)
+
+    # ── joining ──────────────────────────────────────────────────────────
+    def _wait_for(self, stage: _Stage) -> None:
+        """Block until the stage finishes or its own timeout (from its start) expires."""
+        while not stage.future.done():
+            if stage.started_at is None:
+                # Not running yet: queued in the pool or waiting on dependencies,
+                # whose own timeouts bound the wait
+                for dep in stage.after:
+                    self._wait_for(self._stages[dep])
+                wait([stage.future], timeout=0.005)
+                continue
+            if stage.default is _NO_DEFAULT and not self._required_timeouts:
+                wait([stage.future])
+                continue
+            remaining = stage.started_at + stage.timeout_s - time.perf_counter()
+            if remaining <= 0:
+                # The worker thread cannot be interrupted; its late result is discarded
+                if stage.resolve(error=StageTimeout(stage.name, stage.timeout_s)):
+                    stage.status = "timeout"
+                    stage.seconds = time.perf_counter() - stage.started_at
+                    logger.warning(f"[Pipeline] Stage '{stage.name}' timed out after {stage.timeout_s:.1f}s")
+                    self._trace_stage(stage)
+                return
+            wait([stage.future], timeout=remaining)
+
+    def join(self, names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Wait for the given (default: all) stages; returns {name: value}."""
+        results: Dict[str, Any] = {}
+        for name in names or list(self._stages):
+            stage = self._stages[name]
+            self._wait_for(stage)
+            try:
+                results[name] = stage.future.result(timeout=0)
+            except Exception as e:
+                if stage.default is _NO_DEFAULT:
+                    raise
+                if stage.status != "timeout":
+                    logger.warning(f"[Pipeline] Stage '{name}' failed, using default: {e}")
+                results[name] = stage.default
+        return results
+
+    def cancel(self) -> None:
+        """Skip stages that have not started yet (queued or waiting on inputs), e.g. the request ended early."""
+        self._cancelled = True
+
+    # ── timings ──────────────────────────────────────────────────────────
+    def _trace_stage(self, stage: _Stage, value: Any = None, error: Optional[str] = None) -> None:
+        if self._trace is None:
+            return
+        attrs: Dict[str, Any] = {}
+        if stage.describe is not None and stage.status == "ok":
+            try:
+                attrs = stage.describe(value) or {}
+            except Exception:
+                attrs = {}
+        if error:
+            attrs["error"] = error
+        # Stage spans hang off the root: they run on pool threads, beside the request thread
+        self._trace.add_span(
+            stage.name, stage.started_at, stage.seconds,
+            status=stage.status, parent=self._trace.root, **attrs,
+        )
+
+    @contextmanager
+    def measure(self, name: str, **attrs):
+        """Time an inline (main-thread) stage under the same timings report."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0, **attrs)
+
+    def record(self, name: str, seconds: float, **attrs) -> None:
+        """Add an inline stage's time (summed per name); attrs go on its trace span."""
+        with self._lock:
+            self._timings[name] = self._timings.get(name, 0.0) + seconds
+        if self._trace is not None:
+            self._trace.add_span(name, time.perf_counter() - seconds, seconds, **attrs)
+
+    def timings_ms(self) -> Dict[str, float]:
+        out = {}
+        for name, stage in self._stages.items():
+            if stage.seconds is not None:
+                out[name] = round(stage.seconds * 1000, 1)
+        with self._lock:
+            for name, secs in self._timings.items():
+                out[name] = round(secs * 1000, 1)
+        return out
+
+    def statuses(self) -> Dict[str, str]:
+        return {name: stage.status for name, stage in self._stages.items()}
+
+    def degraded(self) -> List[str]:
+        """Optional stages that fell back to their default (failed or timed out)."""
+        return [name for name, stage in self._stages.items() if stage.status in ("failed", "timeout")]
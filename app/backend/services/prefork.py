@@ -0,0 +1,85 @@
+"""
+Pre-fork model sharing for gunicorn --preload
+The master loads every model once (warmup.start_warmup(block=True)), then forks
+the workers, which share the weight pages copy-on-write instead of each holding
+a private copy. Used by gunicorn.conf.py:
+
+- prepare_master()    : master, before the models load (create_app)
+- prepare_for_fork()  : master, after the app is loaded
+- init_worker(...)    : each worker, right after fork
+
+Threads and connections do not survive fork, so everything of that kind is
+(re)created per worker: DB pool connections, the LLM client, the ingestion
+worker threads, and the torch intra-op pool (sized per worker to avoid
+oversubscription).
+"""
+import gc
+import logging
+import os
+
+from app.backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def torch_threads_per_worker(workers: int) -> int:
+    """TORCH_THREADS_PER_WORKER, or the CPUs split evenly between workers."""
+    if Config.TORCH_THREADS_PER_WORKER > 0:
+        return Config.TORCH_THREADS_PER_WORKER
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def prepare_master() -> None:
+    """
+    Keep the master's warm-up single-threaded: an OpenMP or tokenizer thread
+    pool started before fork is not usable in the children.
+    """
+    import torch
+
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    torch.set_num_threads(1)
+
+
+def prepare_for_fork() -> None:
+    """
+    Called in the master once the models are loaded. Closes pooled DB
+    connections (a socket must not be shared by several processes) and moves
+    every live object into the GC's permanent generation, so collections in
+    the workers do not write to, and thereby un-share, the master's pages.
+    """
+    from app.backend.database import engine
+
+    engine.dispose()
+    gc.collect()
+    gc.freeze()
+
+
+def init_worker(workers: int, preloaded: bool = True) -> None:
+    """
+    Called in each worker right after fork. Sizes the torch (and ONNX) thread
+    pools for this worker; with preloading, also replaces what the master's
+    fork left unusable.
+    """
+    import torch
+
+    threads = torch_threads_per_worker(workers)
+    torch.set_num_threads(threads)
+    if Config.ONNX_INTRA_OP_THREADS <= 0:
+        # ONNX sessions are created per worker (onnx_backend.OnnxModel), with this pool size
+        Config.ONNX_INTRA_OP_THREADS = threads
+
+    if preloaded:
+        from app.backend.database import engine
+
+        # Drop the pool inherited from the master without closing its sockets
+        engine.dispose(close=False)
+
+        # The LLM client's channel and model handles are rebuilt on first use
+        from app.backend.services.llm_client import set_llm_client
+        set_llm_client(None)
+
+        if Config.INGESTION_WORKERS_ENABLED:
+            from app.backend.services.ingestion_jobs import start_ingestion_workers
+            start_ingestion_workers()
+
+    logger.info(f"[Prefork] Worker {os.getpid()} ready (torch threads={threads}, preloaded={preloaded})")
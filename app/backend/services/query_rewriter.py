@@ -15,9 +15,8 @@ Date: March 2026
 import re
 import logging
 from typing import List, Dict, Optional, Union
-import google.generativeai as genai
-
 from app.backend.config import Config
+from app.backend.services.llm_client import get_llm_client
 
 logger = logging.getLogger(__name__)
 
@@ -41,14 +40,16 @@ class QueryRewriter:
             llm_model: Optional LLM model name (defaults to Config.LLM_MODEL)
         """
         self.llm_model = llm_model or Config.LLM_MODEL
-        self._configure_gemini()
     
-    def _configure_gemini(self):
-        """Configure Gemini API with credentials."""
-        try:
-            genai.configure(api_key=Config.GEMINI_API_KEY)
-        except Exception as e:
-            logger.warning(f"[QueryRewriter] Failed to configure Gemini: {e}")
+    def _generate(self, prompt: str, task: str, generation_config: Dict) -> str:
+        """One LLM call through the shared client (task: 'rewrite.<strategy>')."""
+        response = get_llm_client().generate(
+            prompt,
+            task=task,
+            model=self.llm_model,
+            generation_config=generation_config,
+        )
+        return response.text or ""
     
     # ════════════════════════════════════════════════════════════════
     # STRATEGY 1: CONVERSATIONAL CONTEXT FUSION
@@ -109,16 +110,14 @@ IMPORTANT:
 
 Rewritten question (one line only):"""
             
-            model = genai.GenerativeModel(self.llm_model)
-            response = model.generate_content(
+            rewritten = self._generate(
                 prompt,
+                task='rewrite.fusion',
                 generation_config={
                     'temperature': 0.3,  # Low temperature for consistent rewriting
                     'max_output_tokens': 200,
                 }
-            )
-            
-            rewritten = response.text.strip()
+            ).strip()
             
             # Clean up response (remove quotes, extra whitespace)
             rewritten = self._clean_rewritten_query(rewritten)
@@ -249,9 +248,9 @@ Output format (one variant per line):
 1. [variant 1]
 2. [variant 2]"""
             
-            model = genai.GenerativeModel(self.llm_model)
-            response = model.generate_content(
+            raw = self._generate(
                 prompt,
+                task='rewrite.expansion',
                 generation_config={
                     'temperature': 0.7,  # Moderate temperature for diversity
                     'max_output_tokens': 300,
@@ -259,7 +258,7 @@ Output format (one variant per line):
             )
             
             # Parse numbered list
-            variants = self._parse_numbered_variants(response.text)
+            variants = self._parse_numbered_variants(raw)
             
             # Always include original first
             all_variants = [original_query] + variants
@@ -386,16 +385,16 @@ Examples:
 
 Output format (numbered list, one per line):"""
             
-            model = genai.GenerativeModel(self.llm_model)
-            response = model.generate_content(
+            raw = self._generate(
                 prompt,
+                task='rewrite.decomposition',
                 generation_config={
                     'temperature': 0.5,
                     'max_output_tokens': 400,
                 }
             )
             
-            sub_questions = self._parse_numbered_variants(response.text)
+            sub_questions = self._parse_numbered_variants(raw)
 
             # Fallback for under-segmented outputs on clearly compound questions.
             if len(sub_questions) <= 1 and self._is_compound_question(query):
@@ -456,16 +455,16 @@ Just write the factual passage.
 
 Passage:"""
             
-            model = genai.GenerativeModel(self.llm_model)
-            response = model.generate_content(
+            raw = self._generate(
                 prompt,
+                task='rewrite.hyde',
                 generation_config={
                     'temperature': 0.5,
                     'max_output_tokens': 200,
                 }
             )
             
-            hypothetical_doc = self._clean_rewritten_query(response.text or "")
+            hypothetical_doc = self._clean_rewritten_query(raw)
 
             # Ensure HyDE output is substantive enough for retrieval + UI display.
             # Retry once with stricter constraints if too short.
@@ -480,14 +479,15 @@ Requirements:
 Query: \"{query}\"
 
 Passage:"""
-                retry = model.generate_content(
+                retry = self._generate(
                     retry_prompt,
+                    task='rewrite.hyde',
                     generation_config={
                         'temperature': 0.4,
                         'max_output_tokens': 260,
                     }
                 )
-                retry_text = self._clean_rewritten_query(retry.text or "")
+                retry_text = self._clean_rewritten_query(retry)
                 if len(retry_text.split()) >= len(hypothetical_doc.split()):
                     hypothetical_doc = retry_text
             
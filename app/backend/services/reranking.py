@@ -1,34 +1,162 @@
 """
 Cross-encoder reranking service
 Reranks retrieved chunks using a cross-encoder model for better precision
+
+(question, chunk) pairs from concurrent requests are merged into shared
+batches (RERANK_BATCHING_ENABLED) within a small latency budget, and at most
+RERANK_MAX_CONCURRENT_BATCHES model invocations run at once so parallel
+requests do not oversubscribe torch's intra-op threads.
+
+Scores are cached per (question hash, chunk id or content hash): in a
+request-scoped dict passed as score_memo, and in a process-wide LRU
+(RERANK_SCORE_CACHE_SIZE, 0 disables), so a pair is never scored twice.
 """
-from typing import List, Dict, Optional
+import threading
+from typing import List, Dict, Optional, Tuple
 from sentence_transformers import CrossEncoder
 
 from app.backend.config import Config
+from app.backend.services import onnx_backend
+from app.backend.services.embedding_cache import text_hash
+from app.backend.services.lru_cache import LRUCache
+from app.backend.services.micro_batcher import MicroBatcher
 
 
 # Singleton pattern for model loading
-_reranker: Optional[CrossEncoder] = None
+_reranker = None  # CrossEncoder, or OnnxCrossEncoder when RERANK_BACKEND=onnx
+_reranker_lock = threading.Lock()
+
+# Bounds concurrent predict() calls, batched or not
+_predict_slots = threading.BoundedSemaphore(max(1, Config.RERANK_MAX_CONCURRENT_BATCHES))
+
+_batcher: Optional[MicroBatcher] = None
+_batcher_lock = threading.Lock()
+
+_score_cache = LRUCache(Config.RERANK_SCORE_CACHE_SIZE)
+_pairs_scored = 0
 
 
-def get_reranker() -> CrossEncoder:
+def get_reranker():
     """
     Lazy-load and return the cross-encoder model.
     Model is loaded once and reused across requests.
     """
     global _reranker
     if _reranker is None:
-        print(f"[Reranker] Loading cross-encoder model: {Config.RERANK_MODEL}")
-        _reranker = CrossEncoder(Config.RERANK_MODEL)
-        print(f"[Reranker] Model loaded successfully")
+        with _reranker_lock:
+            if _reranker is None:
+                print(f"[Reranker] Loading cross-encoder model: {Config.RERANK_MODEL}")
+                if onnx_backend.resolve_backend(Config.RERANK_BACKEND) == "onnx":
+                    model = onnx_backend.load_onnx_model(Config.RERANK_MODEL, "cross-encoder")
+                    if model is not None:
+                        _reranker = onnx_backend.OnnxCrossEncoder(model, Config.RERANK_MODEL)
+                if _reranker is None:
+                    _reranker = CrossEncoder(Config.RERANK_MODEL)
+                print(f"[Reranker] Model loaded successfully ({type(_reranker).__name__})")
     return _reranker
 
 
+def _reranker_key() -> str:
+    """Model identity for the score cache (INT8 and FP32 scores never mix)."""
+    return getattr(get_reranker(), "model_name", None) or Config.RERANK_MODEL
+
+
+def _predict_pairs(pairs: List[Tuple[str, str]]) -> List[float]:
+    """One cross-encoder call over all pairs, holding a concurrency slot."""
+    reranker = get_reranker()
+    with _predict_slots:
+        scores = reranker.predict(pairs, batch_size=max(len(pairs), 1), show_progress_bar=False)
+    return [float(s) for s in scores]
+
+
+def _get_batcher() -> MicroBatcher:
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(
+                'rerank',
+                _predict_pairs,
+                max_batch_size=Config.RERANK_BATCH_MAX_PAIRS,
+                max_wait_ms=Config.RERANK_BATCH_MAX_WAIT_MS,
+                workers=Config.RERANK_MAX_CONCURRENT_BATCHES,
+            )
+    return _batcher
+
+
+def score_pairs(pairs: List[Tuple[str, str]]) -> List[float]:
+    """
+    Cross-encoder scores for (question, passage) pairs.
+    With batching enabled, the pairs join the shared queue and may be scored
+    together with pairs from other requests.
+    """
+    if not pairs:
+        return []
+    if not Config.RERANK_BATCHING_ENABLED:
+        return _predict_pairs(pairs)
+    batcher = _get_batcher()
+    futures = [batcher.submit(pair) for pair in pairs]
+    return [f.result(timeout=Config.RERANK_BATCH_TIMEOUT_S) for f in futures]
+
+
+def _chunk_key(chunk: Dict) -> str:
+    """Stored chunks by id (content is immutable per id); web chunks by content hash."""
+    if chunk.get('document_id') is not None and chunk.get('chunk_id') is not None:
+        return f"id:{chunk['chunk_id']}"
+    return f"sha:{text_hash(chunk.get('content') or '')}"
+
+
+def score_chunks(
+    question: str,
+    chunks: List[Dict],
+    score_memo: Optional[Dict] = None,
+) -> List[float]:
+    """
+    Cross-encoder score of each chunk against question, scoring only pairs
+    found in neither score_memo (request-scoped) nor the process-wide LRU.
+    """
+    global _pairs_scored
+    q_hash = text_hash(question)
+    keys = [(_reranker_key(), q_hash, _chunk_key(chunk)) for chunk in chunks]
+
+    scores: Dict = {}
+    to_score: Dict = {}  # key -> content, deduplicated
+    for key, chunk in zip(keys, chunks):
+        if key in scores or key in to_score:
+            continue
+        cached = score_memo.get(key) if score_memo is not None else None
+        if cached is None:
+            cached = _score_cache.get(key)
+        if cached is not None:
+            scores[key] = cached
+        else:
+            to_score[key] = chunk['content']
+
+    if to_score:
+        fresh = score_pairs([(question, content) for content in to_score.values()])
+        _pairs_scored += len(fresh)
+        for key, score in zip(to_score, fresh):
+            scores[key] = score
+            _score_cache.put(key, score)
+
+    if score_memo is not None:
+        score_memo.update(scores)
+    return [scores[key] for key in keys]
+
+
+def get_rerank_cache_stats() -> Dict:
+    return {**_score_cache.stats(), 'pairs_scored': _pairs_scored}
+
+
+def get_rerank_batcher_stats() -> Optional[Dict]:
+    """Queue-depth / batch-size histograms, or None until the first batched request."""
+    return _batcher.stats() if _batcher is not None else None
+
+
 def rerank_chunks(
     question: str,
     chunks: List[Dict],
-    top_k: int = None
+    top_k: int = None,
+    score_memo: Optional[Dict] = None,
 ) -> List[Dict]:
     """
     Rerank retrieved chunks using cross-encoder for better precision.
@@ -37,6 +165,8 @@ def rerank_chunks(
         question: User's question text
         chunks: List of chunk dicts from retrieval service
         top_k: Number of top chunks to return (defaults to Config.RERANK_TOP_K)
+        score_memo: Request-scoped dict of already computed scores (shared
+            between the rerank passes of one request)
     
     Returns:
         Reranked list of chunks with added 'rerank_score' field
@@ -47,26 +177,9 @@ def rerank_chunks(
     if not chunks:
         return []
     
-    # If we have fewer chunks than top_k, return all
-    if len(chunks) <= top_k:
-        # Still score them for consistency
-        reranker = get_reranker()
-        pairs = [(question, chunk['content']) for chunk in chunks]
-        scores = reranker.predict(pairs)
-        
-        for chunk, score in zip(chunks, scores):
-            chunk['rerank_score'] = float(score)
-        
-        # Sort by rerank score (descending)
-        chunks.sort(key=lambda x: x['rerank_score'], reverse=True)
-        return chunks
-    
-    # Prepare (question, chunk_content) pairs for cross-encoder
-    reranker = get_reranker()
-    pairs = [(question, chunk['content']) for chunk in chunks]
-    
-    # Score all pairs
-    scores = reranker.predict(pairs)
+    # Score all (question, chunk) pairs (even when there are fewer chunks than
+    # top_k, for consistency); pairs scored earlier come from the caches
+    scores = score_chunks(question, chunks, score_memo=score_memo)
     
     # Add scores to chunks
     for chunk, score in zip(chunks, scores):
@@ -6,8 +6,8 @@ This avoids all Gemini syntax hallucinations entirely.
 import logging
 import re
 import json
-import google.generativeai as genai
 from app.backend.config import Config
+from app.backend.services.llm_client import get_llm_client
 
 logger = logging.getLogger(__name__)
 
@@ -112,25 +112,18 @@ def build_mermaid_from_data(data: dict) -> str:
     return "\n".join(lines)
 
 
-# ─── Gemini caller ───────────────────────────────────────────────────────────
+# ─── LLM caller ──────────────────────────────────────────────────────────────
 
-def _call_gemini(prompt: str) -> str:
-    genai.configure(api_key=Config.GEMINI_API_KEY)
-    model = genai.GenerativeModel(
-        model_name=Config.LLM_MODEL,
-        generation_config={"temperature": 0.1, "max_output_tokens": 2048}
+def _call_llm(prompt: str, task: str) -> str:
+    response = get_llm_client().generate(
+        prompt,
+        task=task,
+        model=Config.LLM_MODEL,
+        generation_config={"temperature": 0.1, "max_output_tokens": 2048},
     )
-    response = model.generate_content(prompt)
     # Log why generation stopped
-    try:
-        finish = response.candidates[0].finish_reason
-        logger.warning(f"[ToolDetection] Gemini finish_reason: {finish}")
-    except Exception:
-        pass
-    try:
-        return "".join(part.text for part in response.parts).strip()
-    except Exception:
-        return response.text.strip()
+    logger.warning(f"[ToolDetection] LLM finish_reason ({task}): {response.finish_reason}")
+    return response.text.strip()
 
 
 def _parse_json_response(raw: str):
@@ -174,11 +167,12 @@ def detect_and_generate_tool(question: str, context_chunks: list, forced_type: s
         if forced_type:
             decision = forced_type.upper().strip()
         else:
-            raw_decision = _call_gemini(
+            raw_decision = _call_llm(
                 DETECTION_PROMPT.format(
                     question=question,
                     context=full_context,
-                )
+                ),
+                task="tool.detect",
             ).upper().strip()
             decision = raw_decision.split()[0] if raw_decision else "NONE"
 
@@ -186,11 +180,12 @@ def detect_and_generate_tool(question: str, context_chunks: list, forced_type: s
 
         # ── Step 2a: Build Mermaid from JSON data ─────────────────────────
         if decision == "MERMAID":
-            raw = _call_gemini(
+            raw = _call_llm(
                 MERMAID_DATA_PROMPT.format(
                     question=question,
                     context=full_context
-                )
+                ),
+                task="tool.mermaid",
             )
             try:
                 diagram_data = _parse_json_response(raw)
@@ -203,11 +198,12 @@ def detect_and_generate_tool(question: str, context_chunks: list, forced_type: s
 
         # # ── Step 2b: Desmos expressions ───────────────────────────────────
         if decision == "DESMOS":
-            raw = _call_gemini(
+            raw = _call_llm(
                 DESMOS_PROMPT.format(
                     question=question,
                     context=full_context
-                )
+                ),
+                task="tool.desmos",
             )
             try:
                 expressions = _parse_json_response(raw)
@@ -3,8 +3,9 @@
 Routing intent is inferred with a multi-label HF classifier.
 """
 from dataclasses import dataclass
-from typing import Optional
+from typing import Dict, Optional
 
+from app.backend.config import Config
 from app.backend.services.intent_classifier import predict_intents, get_thresholds
 
 
@@ -34,6 +35,7 @@ class RoutingDecision:
     thresholds: dict
     model_name: str
     inference_error: Optional[str]
+    intent_cache_hit: bool = False
 
 
 def decide_tool_routing(
@@ -42,6 +44,7 @@ def decide_tool_routing(
     effective_query: Optional[str] = None,
     web_toggle: bool = False,
     diagram_toggle: bool = False,
+    intent_memo: Optional[Dict[str, Dict]] = None,
 ) -> RoutingDecision:
     """
     Produce a single routing decision for web retrieval and diagram mode.
@@ -50,10 +53,12 @@ def decide_tool_routing(
     - Web retrieval is enabled by toggle OR classifier intent.
     - Diagram mode is enabled by toggle OR classifier intent.
     - If inference fails, fallback is toggles-only (no keyword fallback).
+    - Pass the same intent_memo dict for every call within a request so the
+      classifier runs at most once per question.
     """
     effective = effective_query if effective_query is not None else original_query
     thresholds = get_thresholds()
-    intent_result = predict_intents(original_query)
+    intent_result = predict_intents(original_query, memo=intent_memo)
 
     # Intent must reflect the original user phrasing, not rewritten variants.
     web_requested_explicit = bool(intent_result.get('web_search', False))
@@ -74,4 +79,32 @@ def decide_tool_routing(
         thresholds=thresholds,
         model_name=str(intent_result.get('model_name', '')),
         inference_error=intent_result.get('error'),
+        intent_cache_hit=bool(intent_result.get('cache_hit', False)),
+    )
+
+
+def toggles_only_routing(
+    *,
+    original_query: str,
+    effective_query: Optional[str] = None,
+    web_toggle: bool = False,
+    diagram_toggle: bool = False,
+    error: str = 'routing unavailable',
+) -> RoutingDecision:
+    """The toggles-only decision, without running the classifier (e.g. the routing stage timed out)."""
+    return RoutingDecision(
+        original_query=original_query,
+        effective_query=effective_query if effective_query is not None else original_query,
+        web_toggle=bool(web_toggle),
+        diagram_toggle=bool(diagram_toggle),
+        web_requested_explicit=False,
+        diagram_requested_explicit=False,
+        web_enabled=bool(web_toggle),
+        diagram_enabled=bool(diagram_toggle),
+        routing_source='toggles_only_fallback',
+        inference_ok=False,
+        intent_scores={'web_search': 0.0, 'diagram_enabled': 0.0},
+        thresholds=get_thresholds(),
+        model_name=getattr(Config, 'INTENT_MODEL_NAME', ''),
+        inference_error=error,
     )
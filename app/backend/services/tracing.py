@@ -0,0 +1,172 @@
+"""
+Request tracing for the query pipeline
+A Trace is a tree of timed spans (routing, embed, retrieval, web, rerank,
+rewrite, generation, tool, store, ...) carrying size attributes such as chunk
+counts and prompt characters. When the trace finishes:
+- the request's wall time goes into rag_request_duration_seconds, every other
+  span's into rag_stage_duration_seconds{stage}, and numeric span attributes
+  into rag_stage_size{stage,attr}; all are served at /metrics
+- a request slower than SLOW_QUERY_MS logs its whole span tree as one JSON
+  line on the 'slow_query' logger (SLOW_QUERY_LOG_FILE adds a file handler)
+
+Usage:
+    trace = Trace("query", stream=False)
+    with trace.span("rerank", chunks_in=len(pool)) as span:
+        top = rerank(pool)
+        span.set(chunks_out=len(top))
+    trace.add_span("embed", started_at, seconds, dims=384)   # timed elsewhere
+    trace.finish()
+
+StagePipeline(trace=...) adds a span for each of its stages and record() calls.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from app.backend.config import Config
+from app.backend.services.metrics import Counter, Histogram, HistogramFamily, register, size_buckets
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("slow_query")
+
+_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+_request_seconds = register(Histogram(
+    "rag_request_duration_seconds", _LATENCY_BUCKETS,
+    "Query pipeline wall time per request",
+))
+_stage_seconds = register(HistogramFamily(
+    "rag_stage_duration_seconds", _LATENCY_BUCKETS, ("stage",),
+    "Wall time per pipeline stage (parallel stages overlap)",
+))
+_stage_size = register(HistogramFamily(
+    "rag_stage_size", size_buckets(2 ** 17), ("stage", "attr"),
+    "Sizes recorded on pipeline stages (chunks, prompt and answer characters, ...)",
+))
+_slow_queries = register(Counter("rag_slow_queries_total", "Requests above SLOW_QUERY_MS"))
+
+_slow_query_handler: Optional[logging.Handler] = None
+
+
+def setup_tracing() -> None:
+    """Called once by create_app: the histograms above are registered for /metrics
+    before the first query, and SLOW_QUERY_LOG_FILE gets its file handler."""
+    global _slow_query_handler
+    if Config.SLOW_QUERY_LOG_FILE and _slow_query_handler is None:
+        _slow_query_handler = logging.FileHandler(Config.SLOW_QUERY_LOG_FILE)
+        _slow_query_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        slow_query_logger.addHandler(_slow_query_handler)
+
+
+class Span:
+    def __init__(self, name: str, start: float, attrs: Optional[Dict] = None):
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.status = "ok"
+        self.attrs: Dict = dict(attrs or {})
+        self.children: List["Span"] = []
+
+    def set(self, **attrs) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    @property
+    def seconds(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float) -> Dict:
+        out = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 1),
+            "duration_ms": round(self.seconds * 1000, 1),
+            "status": self.status,
+        }
+        if self.attrs:
+            out["attrs"] = self.attrs
+        if self.children:
+            out["children"] = [c.to_dict(origin) for c in sorted(self.children, key=lambda c: c.start)]
+        return out
+
+
+class Trace:
+    """One request's span tree. Spans may be added from pipeline worker threads."""
+
+    def __init__(self, name: str, **attrs):
+        self.root = Span(name, time.perf_counter(), attrs)
+        self._lock = threading.Lock()
+        self._open: List[Span] = []  # spans opened with span() on the request thread
+        self._finished = False
+
+    def _attach(self, span: Span, parent: Optional[Span]) -> Span:
+        if parent is None:
+            parent = self._open[-1] if self._open else self.root
+        with self._lock:
+            parent.children.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time a block on the request thread; spans opened inside it become its children."""
+        span = self._attach(Span(name, time.perf_counter(), attrs), None)
+        self._open.append(span)
+        try:
+            yield span
+        except BaseException:
+            span.status = "error"
+            raise
+        finally:
+            self._open.pop()
+            span.end = time.perf_counter()
+
+    def add_span(
+        self,
+        name: str,
+        start: float,
+        seconds: float,
+        status: str = "ok",
+        parent: Optional[Span] = None,
+        **attrs,
+    ) -> Span:
+        """Record a span timed elsewhere (perf_counter start); parent defaults to the open span."""
+        span = Span(name, start, attrs)
+        span.end = start + seconds
+        span.status = status
+        return self._attach(span, parent)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return self.root.to_dict(self.root.start)
+
+    def finish(self, status: Optional[str] = None) -> None:
+        """Close the root span, feed the histograms and log the tree if slow (once)."""
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        self.root.end = time.perf_counter()
+        if status:
+            self.root.status = status
+        _request_seconds.observe(self.root.seconds)
+        _observe_children(self.root)
+
+        elapsed_ms = self.root.seconds * 1000
+        if Config.SLOW_QUERY_MS > 0 and elapsed_ms >= Config.SLOW_QUERY_MS:
+            _slow_queries.inc()
+            try:
+                tree = json.dumps(self.to_dict(), default=str, ensure_ascii=False)
+            except Exception as e:  # never let logging break a request
+                tree = f"<unserializable trace: {e}>"
+            slow_query_logger.warning(f"[SlowQuery] {elapsed_ms:.0f} ms: {tree}")
+
+
+def _observe_children(span: Span) -> None:
+    for child in span.children:
+        _stage_seconds.labels(child.name).observe(child.seconds)
+        for attr, value in child.attrs.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                _stage_size.labels(child.name, attr).observe(value)
+        _observe_children(child)
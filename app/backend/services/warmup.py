@@ -0,0 +1,155 @@
+"""
+Startup model warm-up and readiness
+Loads every model in parallel when the app starts and runs one dummy inference
+on each, so lazy initialization (weights, tokenizers, kernel selection, ONNX
+session graphs) happens before the first user request instead of during it.
+
+/api/ready reports this state; /api/health only says the process is up. A
+load balancer should route traffic on /api/ready.
+
+Models:
+- embedder       : encoder behind get_embeddings (required)
+- classification : subject/topic index, built or memory-mapped after the embedder (required)
+- reranker       : cross-encoder (required)
+- intent         : intent classifier (optional; routing falls back to toggles-only)
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from app.backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_MODELS = ("embedder", "classification", "reranker")
+OPTIONAL_MODELS = ("intent",)
+
+_DUMMY_QUESTION = "What is gradient descent?"
+_DUMMY_PASSAGE = "Gradient descent updates parameters along the negative gradient of the loss."
+
+
+class WarmupState:
+    """Per-model status: pending | loading | ready | failed (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict] = {
+            name: {"status": "pending"} for name in REQUIRED_MODELS + OPTIONAL_MODELS
+        }
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def set(self, name: str, status: str, **info) -> None:
+        with self._lock:
+            self._models[name] = {"status": status, **info}
+
+    def is_ready(self) -> bool:
+        with self._lock:
+            if any(m["status"] in ("pending", "loading") for m in self._models.values()):
+                return False
+            return all(self._models[name]["status"] == "ready" for name in REQUIRED_MODELS)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            models = {name: dict(info) for name, info in self._models.items()}
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.perf_counter()) - self.started_at, 2)
+        return {"ready": self.is_ready(), "warmup_s": elapsed, "models": models}
+
+
+state = WarmupState()
+_start_lock = threading.Lock()
+_started = False
+_done = threading.Event()
+
+
+# ── per-model warm-up (load + one dummy inference, bypassing the caches) ──
+def _warm_embedder() -> None:
+    from app.backend.services.injestion import get_base_embeddings
+
+    get_base_embeddings().embed_documents([_DUMMY_QUESTION, _DUMMY_PASSAGE])
+
+
+def _warm_classification() -> None:
+    from app.backend.services import classification
+    from app.backend.services.injestion import get_embeddings
+
+    classification.initialize_classification_embeddings(get_embeddings())
+
+
+def _warm_reranker() -> None:
+    from app.backend.services.reranking import get_reranker
+
+    get_reranker().predict([(_DUMMY_QUESTION, _DUMMY_PASSAGE)], show_progress_bar=False)
+
+
+def _warm_intent() -> None:
+    from app.backend.services.intent_classifier import warm_load_intent_classifier
+
+    if not warm_load_intent_classifier():
+        raise RuntimeError("intent classifier warm-load failed (toggles-only routing until available)")
+
+
+def _run(name: str, fn: Callable[[], None]) -> bool:
+    state.set(name, "loading")
+    t0 = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        state.set(name, "failed", seconds=round(time.perf_counter() - t0, 2), error=str(e))
+        log = logger.error if name in REQUIRED_MODELS else logger.warning
+        log(f"[Warmup] {name} failed after {time.perf_counter() - t0:.1f}s: {e}")
+        return False
+    state.set(name, "ready", seconds=round(time.perf_counter() - t0, 2))
+    logger.info(f"[Warmup] {name} ready in {time.perf_counter() - t0:.1f}s")
+    return True
+
+
+def _run_all() -> None:
+    state.started_at = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="warmup") as pool:
+            # The classification index needs the embedder, so it runs right after it
+            def embedder_then_index():
+                if _run("embedder", _warm_embedder):
+                    _run("classification", _warm_classification)
+                else:
+                    state.set("classification", "failed", error="embedder unavailable")
+
+            pool.submit(embedder_then_index)
+            pool.submit(_run, "reranker", _warm_reranker)
+            pool.submit(_run, "intent", _warm_intent)
+    finally:
+        state.finished_at = time.perf_counter()
+        _done.set()
+        snapshot = state.snapshot()
+        logger.info(f"[Warmup] Finished in {snapshot['warmup_s']}s (ready={snapshot['ready']})")
+
+
+def start_warmup(block: bool = False, timeout: Optional[float] = None) -> None:
+    """
+    Start warming every model (once per process). With block=True, wait up to
+    timeout seconds for it to finish; otherwise it runs in a background thread
+    and /api/ready answers 503 until it is done.
+    """
+    global _started
+    with _start_lock:
+        if not _started:
+            _started = True
+            threading.Thread(target=_run_all, name="model-warmup", daemon=True).start()
+    if block:
+        _done.wait(timeout)
+
+
+def is_ready() -> bool:
+    # Without warm-up, models load lazily and readiness only means "process up"
+    return state.is_ready() if Config.WARMUP_ENABLED else True
+
+
+def readiness() -> Dict:
+    if not Config.WARMUP_ENABLED:
+        return {"ready": True, "warmup": "disabled"}
+    return state.snapshot()
@@ -833,7 +833,16 @@ async function uploadDocumentFromSidebar(file) {
       return;
     }
 
-    const uploadedDoc = data.document || null;
+    let uploadedDoc = data.document || null;
+    if (!uploadedDoc && data.job) {
+      // Background ingestion: poll the job until it finishes.
+      const job = await waitForIngestionJob(data.job.id, file.name);
+      if (!job || job.status !== 'completed') {
+        showToast('❌', job?.error || `${file.name} ingestion failed.`, 'error');
+        return;
+      }
+      uploadedDoc = job.document || null;
+    }
     const uploadedDocId = uploadedDoc?.id;
     const uploadedFolderId = uploadedDoc?.folder_id;
 
@@ -851,6 +860,20 @@ async function uploadDocumentFromSidebar(file) {
 }
 
 
+const INGESTION_STAGE_LABELS = { load: 'Loading', chunk: 'Chunking', embed: 'Embedding', store: 'Storing' };
+
+async function waitForIngestionJob(jobId, fileName, intervalMs = 1500) {
+  while (true) {
+    await new Promise(r => setTimeout(r, intervalMs));
+    const res = await fetch(`${API}/api/documents/jobs/${jobId}`);
+    if (!res.ok) return null;
+    const { job } = await res.json();
+    if (job.status === 'completed' || job.status === 'failed') return job;
+    const stageLabel = INGESTION_STAGE_LABELS[job.stage] || 'Queued';
+    showToast('⏳', `${stageLabel} ${fileName}…`, '');
+  }
+}
+
 async function loadDocuments() {
   try {
     const res  = await fetch(`${API}/api/documents/`);
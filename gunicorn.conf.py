@@ -0,0 +1,31 @@
+# gunicorn.conf.py — production server config (picked up automatically by `gunicorn app.backend.app:app`)
+#
+# GUNICORN_PRELOAD=1 (default): the master imports the app, which loads and warms every
+# model before the workers are forked; workers then share those weight pages
+# copy-on-write instead of each loading its own copy. GUNICORN_PRELOAD=0 restores
+# per-worker loading. See README "Memory per worker" for how to measure the difference.
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+# Without preload each worker loads the models during boot
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") not in {"0", "false", "False"}
+
+if preload_app:
+    # Read by Config when the master imports the app
+    os.environ["PRELOAD_MODELS"] = "1"
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        from app.backend.services.prefork import prepare_for_fork
+        prepare_for_fork()
+
+
+def post_fork(server, worker):
+    # Torch threads are set per worker in both modes (CPUs / workers by default)
+    from app.backend.services.prefork import init_worker
+    init_worker(workers, preloaded=preload_app)
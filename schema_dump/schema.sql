@@ -34,9 +34,13 @@ CREATE TABLE IF NOT EXISTS documents (
     title TEXT,
     subject TEXT[], -- Array of subjects, e.g., ['Math', 'Physics']
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    chunk_count INTEGER DEFAULT 0
+    chunk_count INTEGER DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 1 -- bumped on every change; scopes the semantic answer cache
 );
 
+-- Existing databases: add the version counter
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
 -- Table: sessions
 CREATE TABLE IF NOT EXISTS sessions (
     id SERIAL PRIMARY KEY,
@@ -79,6 +83,41 @@ CREATE TABLE IF NOT EXISTS document_chunks (
     chunk_metadata JSONB -- For storing page numbers, headings, etc.
 );
 
+-- Table: ingestion_jobs
+-- Background upload ingestion; persisted so queued/running jobs survive a restart
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    folder_id INTEGER REFERENCES folders(id) ON DELETE SET NULL,
+    document_id INTEGER REFERENCES documents(id) ON DELETE SET NULL,
+    filename VARCHAR(255) NOT NULL,
+    file_path VARCHAR(500) NOT NULL,
+    subject VARCHAR(255),
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- 'queued' | 'running' | 'completed' | 'failed'
+    stage VARCHAR(20), -- 'load' | 'chunk' | 'embed' | 'store'
+    progress JSONB NOT NULL DEFAULT '{}'::jsonb,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Table: embedding_cache
+-- Content-addressed embeddings keyed by (model, sha256 of normalized text)
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model_name VARCHAR(255) NOT NULL,
+    text_hash VARCHAR(64) NOT NULL,
+    embedding VECTOR(384) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- refreshed on hits; rows unused for EMBEDDING_CACHE_TTL_DAYS are pruned
+    PRIMARY KEY (model_name, text_hash)
+);
+
+-- Existing databases: add the retention timestamp
+ALTER TABLE embedding_cache ADD COLUMN IF NOT EXISTS last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
 -- Function: update_updated_at_column
 -- Purpose: Automatically updates the 'updated_at' column to the current timestamp on row updates
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -103,6 +142,13 @@ BEFORE UPDATE ON session_memory
 FOR EACH ROW
 EXECUTE FUNCTION update_updated_at_column();
 
+-- Trigger: update_ingestion_jobs_updated_at
+-- Purpose: updated_at is the worker heartbeat used to requeue jobs from dead workers
+CREATE TRIGGER update_ingestion_jobs_updated_at
+BEFORE UPDATE ON ingestion_jobs
+FOR EACH ROW
+EXECUTE FUNCTION update_updated_at_column();
+
 -- Index: idx_document_chunks_embedding
 -- Purpose: Accelerates vector similarity searches using cosine distance
 -- Note: This index uses the HNSW algorithm which is efficient for approximate nearest neighbor searches
@@ -128,4 +174,13 @@ CREATE INDEX idx_sessions_user_id ON sessions (user_id);
 -- Index for faster session memory lookup
 CREATE INDEX idx_session_memory_session_id ON session_memory (session_id);
 
+-- Index for workers claiming the oldest queued job
+CREATE INDEX idx_ingestion_jobs_status_created ON ingestion_jobs (status, created_at);
+
+-- Index for faster job lookup by user
+CREATE INDEX idx_ingestion_jobs_user_id ON ingestion_jobs (user_id);
+
+-- Index for pruning the least recently used cached embeddings
+CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache (last_used_at);
+
 COMMIT;
\ No newline at end of file
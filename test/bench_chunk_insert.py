@@ -0,0 +1,87 @@
+"""
+Chunk insertion benchmark: ORM objects vs batched INSERT vs COPY
+
+Inserts N synthetic document_chunks rows (384-dim vector + JSONB metadata) for a
+throwaway document with each write method, inside a transaction that is rolled
+back afterwards, so the database is left unchanged.
+
+Usage (database from .env / docker-compose must be reachable):
+    python test/bench_chunk_insert.py                 # 1k, 10k, 100k
+    BENCH_SIZES=1000,5000 python test/bench_chunk_insert.py
+    BENCH_METHODS=copy,insert python test/bench_chunk_insert.py
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.backend.config import Config
+from app.backend.models import Document
+from app.backend.services.chunk_writer import bulk_insert_chunks
+
+SIZES = [int(x) for x in os.getenv("BENCH_SIZES", "1000,10000,100000").split(",") if x.strip()]
+METHODS = [m.strip() for m in os.getenv("BENCH_METHODS", "orm,insert,copy").split(",") if m.strip()]
+DIM = Config.EMBEDDING_DIMENSION
+
+
+def make_rows(document_id: int, n: int):
+    rng = random.Random(42)
+    text = "Gradient descent updates parameters in the direction of the negative gradient. " * 12
+    for i in range(n):
+        yield {
+            "document_id": document_id,
+            "chunk_order": i,
+            "content": f"[{i}] {text}",
+            "embedding": [rng.uniform(-1.0, 1.0) for _ in range(DIM)],
+            "chunk_metadata": {
+                "chunk_index": i,
+                "total_chunks": n,
+                "chunking_method": "semantic_embedding",
+                "source": {"source": "bench.pdf", "page": i // 4 + 1},
+                "content_len": len(text),
+                "subjects": [{"name": "Artificial Intelligence", "confidence": 0.71, "topics": []}],
+                "dominant_subject": "Artificial Intelligence",
+                "dominant_topic": "Machine Learning/Neural Networks",
+            },
+        }
+
+
+def bench(session_factory, method: str, n: int) -> float:
+    db = session_factory()
+    try:
+        doc = Document(filename="bench.pdf", file_path="/tmp/bench.pdf", file_type="pdf", title="bench")
+        db.add(doc)
+        db.flush()
+        rows = list(make_rows(doc.id, n))  # exclude row generation from the timing
+        t0 = time.perf_counter()
+        bulk_insert_chunks(db, rows, method=method)
+        db.flush()
+        return time.perf_counter() - t0
+    finally:
+        db.rollback()
+        db.close()
+
+
+def main():
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, echo=False)
+    session_factory = sessionmaker(bind=engine)
+
+    print(f"{'rows':>8}  " + "  ".join(f"{m:>16}" for m in METHODS))
+    for n in SIZES:
+        cells = []
+        for method in METHODS:
+            secs = bench(session_factory, method, n)
+            cells.append(f"{secs:7.2f}s {n / secs:6.0f}/s")
+        print(f"{n:>8}  " + "  ".join(f"{c:>16}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Chunk topic classification benchmark: per-chunk/per-topic loop vs batched matrix product
+
+"before" is the previous algorithm (classify_chunk_topics called once per chunk,
+cosine_similarity once per topic); "after" is classify_chunks_topics on the
+whole document. Chunk vectors are noisy copies of topic vectors, so most chunks
+clear the threshold like real course material does. Both paths are checked
+to pick the same topics.
+
+Usage (loads the embedding model once for the topic prompts, no database needed):
+    python test/bench_classification.py
+    BENCH_CHUNKS=500,5000 BENCH_SUBJECTS=3 python test/bench_classification.py
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+os.environ.setdefault("EMBEDDING_CACHE_PERSIST", "0")
+
+from app.backend.config import Config
+from app.backend.services import classification
+from app.backend.services.injestion import get_embeddings
+
+CHUNK_COUNTS = [int(x) for x in os.getenv("BENCH_CHUNKS", "100,1000,5000").split(",") if x.strip()]
+NUM_SUBJECTS = int(os.getenv("BENCH_SUBJECTS", "2"))
+
+
+def legacy_classify(chunk_embedding, document_subjects, threshold):
+    """Previous per-chunk implementation, kept here as the baseline."""
+    results = []
+    for subject in document_subjects:
+        sl = classification._topic_slices.get(subject)
+        if sl is None:
+            continue
+        topic_scores = []
+        for path, topic_emb in zip(classification._topic_paths[sl], classification._topic_matrix[sl]):
+            similarity = classification.cosine_similarity(chunk_embedding, topic_emb.tolist())
+            if similarity >= threshold:
+                parts = path.split('/')
+                topic_scores.append({
+                    "name": parts[0],
+                    "subtopic": parts[1] if len(parts) > 1 else None,
+                    "confidence": float(similarity),
+                })
+        if topic_scores:
+            topic_scores.sort(key=lambda x: x['confidence'], reverse=True)
+            avg = sum(t['confidence'] for t in topic_scores[:3]) / min(len(topic_scores), 3)
+            results.append({"name": subject, "confidence": float(avg), "topics": topic_scores[:3]})
+    return results
+
+
+def make_chunk_vectors(n: int, subjects, rng) -> np.ndarray:
+    rows = np.concatenate([
+        np.arange(classification._topic_slices[s].start, classification._topic_slices[s].stop)
+        for s in subjects
+    ])
+    base = classification._topic_matrix[rng.choice(rows, size=n)]
+    noisy = base + rng.normal(scale=0.04, size=base.shape).astype(np.float32)
+    return classification.normalize_rows(noisy)
+
+
+def topic_keys(result):
+    return [(r["name"], [(t["name"], t["subtopic"]) for t in r["topics"]]) for r in result]
+
+
+def main():
+    t0 = time.perf_counter()
+    classification.initialize_classification_embeddings(get_embeddings())
+    print(f"Topic index: {len(classification._topic_paths)} topics, built in {time.perf_counter() - t0:.2f}s")
+
+    subjects = [s for s in Config.SUBJECT_TREE if classification._topic_slices[s].stop > classification._topic_slices[s].start]
+    subjects = subjects[:NUM_SUBJECTS]
+    threshold = Config.TOPIC_SIMILARITY_THRESHOLD
+    rng = np.random.default_rng(7)
+
+    print(f"Subjects: {', '.join(subjects)}")
+    print(f"{'chunks':>7}  {'before/s':>10}  {'after/s':>10}  {'speedup':>8}  {'same':>6}")
+    for n in CHUNK_COUNTS:
+        vectors = make_chunk_vectors(n, subjects, rng)
+        as_lists = vectors.tolist()
+
+        t0 = time.perf_counter()
+        before = [legacy_classify(v, subjects, threshold) for v in as_lists]
+        before_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        after = classification.classify_chunks_topics(vectors, subjects, threshold=threshold)
+        after_s = time.perf_counter() - t0
+
+        same = sum(topic_keys(a) == topic_keys(b) for a, b in zip(after, before)) / n
+        print(
+            f"{n:>7}  {n / before_s:>10.0f}  {n / after_s:>10.0f}  "
+            f"{before_s / after_s:>7.1f}x  {same:>6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
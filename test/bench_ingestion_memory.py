@@ -0,0 +1,136 @@
+"""
+Ingestion memory benchmark: whole-document vs streaming (page-batch) PDF ingestion
+
+Generates synthetic text PDFs with PyMuPDF, ingests each one in a fresh
+subprocess with INGESTION_STREAMING_MODE=never and =always, and reports:
+- py_peak : peak Python heap during ingestion (tracemalloc)
+- rss_peak: peak RSS above the post-warm-up baseline (sampled from /proc)
+- seconds : wall time of run_ingestion_pipeline
+
+The ingested document is deleted afterwards, so the database is left unchanged.
+Streaming peaks should stay roughly flat as the page count grows.
+
+Usage (database from .env / docker-compose must be reachable):
+    python test/bench_ingestion_memory.py                 # 100, 500, 2000 pages
+    BENCH_PAGES=200,1000 python test/bench_ingestion_memory.py
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+PAGES = [int(x) for x in os.getenv("BENCH_PAGES", "100,500,2000").split(",") if x.strip()]
+MODES = [m.strip() for m in os.getenv("BENCH_MODES", "never,always").split(",") if m.strip()]
+
+PARAGRAPHS = [
+    "Gradient descent updates the parameters in the direction of the negative gradient of the loss. "
+    "The learning rate controls the step size and too large a value makes training diverge.",
+    "A relational database stores data in tables. Normalization removes redundancy, and indexes "
+    "trade write cost for faster lookups on frequently filtered columns.",
+    "In supply and demand analysis, the equilibrium price is where the quantity supplied equals the "
+    "quantity demanded. Price ceilings below equilibrium create shortages.",
+    "Photosynthesis converts light energy into chemical energy. The light-dependent reactions take "
+    "place in the thylakoid membranes and produce ATP and NADPH.",
+]
+
+
+def make_pdf(path: str, pages: int) -> None:
+    import fitz
+
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        body = "\n\n".join(PARAGRAPHS[(i + k) % len(PARAGRAPHS)] for k in range(6))
+        page.insert_textbox(fitz.Rect(50, 50, 545, 790), f"Section {i + 1}\n\n{body}", fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_child(pdf_path: str) -> None:
+    """Runs inside the subprocess: ingest once and print a JSON result line."""
+    import tracemalloc
+
+    from app.backend.database import get_db_session
+    from app.backend.models import Document
+    from app.backend.services.injestion import get_embeddings, run_ingestion_pipeline
+
+    get_embeddings().embed_documents(["warm-up"])  # load the model before measuring
+    baseline = _rss_bytes()
+    peak = {"rss": baseline}
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak["rss"] = max(peak["rss"], _rss_bytes())
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    with get_db_session() as db:
+        doc = run_ingestion_pipeline(db_session=db, file_path=pdf_path)
+        doc_id, chunks = doc.id, doc.chunk_count
+    seconds = time.perf_counter() - t0
+    _, py_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stop.set()
+    sampler.join()
+
+    with get_db_session() as db:
+        db.query(Document).filter_by(id=doc_id).delete()
+
+    print(json.dumps({
+        "py_peak": py_peak,
+        "rss_peak": peak["rss"] - baseline,
+        "seconds": seconds,
+        "chunks": chunks,
+    }))
+
+
+def main():
+    print(f"{'pages':>6}  {'mode':>7}  {'chunks':>7}  {'py_peak':>9}  {'rss_peak':>9}  {'seconds':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in PAGES:
+            pdf_path = os.path.join(tmp, f"bench_{pages}.pdf")
+            make_pdf(pdf_path, pages)
+            for mode in MODES:
+                env = dict(os.environ, INGESTION_STREAMING_MODE=mode, PYTHONPATH=str(ROOT))
+                out = subprocess.run(
+                    [sys.executable, __file__, "--child", pdf_path],
+                    env=env, capture_output=True, text=True, check=True,
+                ).stdout
+                result = json.loads(out.strip().splitlines()[-1])
+                label = "stream" if mode == "always" else "full"
+                print(
+                    f"{pages:>6}  {label:>7}  {result['chunks']:>7}  "
+                    f"{result['py_peak'] / 2**20:>7.1f}MB  {result['rss_peak'] / 2**20:>7.1f}MB  "
+                    f"{result['seconds']:>7.1f}s"
+                )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        run_child(sys.argv[2])
+    else:
+        main()
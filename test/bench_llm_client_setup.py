@@ -0,0 +1,85 @@
+"""
+Per-call LLM client setup cost: a fresh GenerativeModel per request vs the cached handles
+
+Before the model registry, every LLM call ran genai.configure (tool detection) and
+built a new genai.GenerativeModel; GeminiClient now configures once and keeps one
+handle per (model, generation_config). No request is sent: only the setup work
+done before generate_content is timed, so the difference is pure overhead per call.
+
+- fresh     : genai.configure + GenerativeModel(...) on every call (old behaviour)
+- per-call  : GenerativeModel(...) on every call, configured once
+- cached    : GeminiClient._model(...) (LRU lookup after the first call)
+
+The call mix cycles through the generation configs the app actually uses (answer,
+quiz, rewrite strategies, tool detection), so the cache holds several entries.
+
+Usage (google-generativeai installed; no API key or network needed):
+    python test/bench_llm_client_setup.py
+    BENCH_CALLS=20000 python test/bench_llm_client_setup.py
+"""
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("GEMINI_API_KEY", "bench-key-not-used")
+
+CALLS = int(os.getenv("BENCH_CALLS", "5000"))
+
+CONFIGS = [
+    {"temperature": 0.7, "max_output_tokens": 2048},    # answer
+    {"temperature": 0.4, "max_output_tokens": 8192},    # quiz
+    {"temperature": 0.3, "max_output_tokens": 200},     # rewrite.fusion
+    {"temperature": 0.7, "max_output_tokens": 300},     # rewrite.expansion
+    {"temperature": 0.5, "max_output_tokens": 400},     # rewrite.decomposition
+    {"temperature": 0.5, "max_output_tokens": 200},     # rewrite.hyde
+    {"temperature": 0.1, "max_output_tokens": 2048},    # tool.*
+]
+
+
+def time_calls(setup) -> float:
+    """Mean microseconds per call of setup(model_name, generation_config)."""
+    t0 = time.perf_counter()
+    for i in range(CALLS):
+        setup("gemini-2.5-flash", CONFIGS[i % len(CONFIGS)])
+    return (time.perf_counter() - t0) / CALLS * 1e6
+
+
+def main():
+    import google.generativeai as genai
+    from app.backend.config import Config
+    from app.backend.services.llm_client import GeminiClient
+
+    def fresh(model, config):
+        genai.configure(api_key=Config.GEMINI_API_KEY)
+        return genai.GenerativeModel(model_name=model, generation_config=config)
+
+    genai.configure(api_key=Config.GEMINI_API_KEY)
+
+    def per_call(model, config):
+        return genai.GenerativeModel(model_name=model, generation_config=config)
+
+    client = GeminiClient()
+
+    results = {}
+    for name, setup in (("fresh", fresh), ("per-call", per_call), ("cached", client._model)):
+        setup("gemini-2.5-flash", CONFIGS[0])  # imports and first-use work are not per call
+        results[name] = time_calls(setup)
+
+    print(f"{CALLS} calls over {len(CONFIGS)} generation configs")
+    print(f"{'mode':>9}  {'us/call':>9}  {'vs fresh':>8}")
+    for name, us in results.items():
+        print(f"{name:>9}  {us:>9.1f}  {results['fresh'] / us:>7.1f}x")
+    print(f"model handles built by the cached client: {client.models_built}")
+    if os.getenv("BENCH_JSON"):
+        with open(os.environ["BENCH_JSON"], "w") as f:
+            json.dump({"calls": CALLS, "us_per_call": results, "models_built": client.models_built}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
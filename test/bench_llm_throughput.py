@@ -0,0 +1,154 @@
+"""
+End-to-end throughput of /api/query and /api/quiz/generate without network access
+
+The LLM is replaced by the deterministic fake backend (LLM_BACKEND=fake), with
+its latency and token rate taken from LLM_FAKE_LATENCY_MS / LLM_FAKE_TOKENS_PER_S,
+so everything else (embedding, retrieval, reranking, routing, persistence)
+runs for real. Web search stays off and Hugging Face models load from the
+local cache only. The LLM scheduler's limits apply as configured
+(LLM_RATE_LIMIT_RPM, LLM_MAX_CONCURRENT; LLM_SCHEDULER_ENABLED=0 turns it off),
+so shed rewrite / tool calls show up in /api/inference/stats.
+
+For each endpoint and concurrency level it reports requests/s, p50 / p95
+latency and the error count. By default the app runs in-process (Flask test
+client); BENCH_URL sends real HTTP requests to a running server instead, which
+must itself run with LLM_BACKEND=fake.
+
+Usage (database from .env / docker-compose with at least one ingested document
+owned by BENCH_USER_ID; models already downloaded):
+    python test/bench_llm_throughput.py
+    BENCH_CONCURRENCY=1,8 BENCH_REQUESTS=64 LLM_FAKE_LATENCY_MS=800 python test/bench_llm_throughput.py
+    BENCH_URL=http://127.0.0.1:5000 BENCH_TOKEN=<jwt> python test/bench_llm_throughput.py
+"""
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ["LLM_BACKEND"] = "fake"
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+os.environ.setdefault("WARMUP_BLOCKING", "1")
+os.environ.setdefault("INGESTION_WORKERS_ENABLED", "0")
+# Repeated benchmark questions would otherwise be answered from the cache
+os.environ.setdefault("ANSWER_CACHE_ENABLED", "0")
+
+ENDPOINTS = [e.strip() for e in os.getenv("BENCH_ENDPOINTS", "query,quiz").split(",") if e.strip()]
+CONCURRENCY = [int(x) for x in os.getenv("BENCH_CONCURRENCY", "1,4,16").split(",") if x.strip()]
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "32"))
+USER_ID = int(os.getenv("BENCH_USER_ID", "1"))
+BASE_URL = os.getenv("BENCH_URL", "").rstrip("/")
+
+QUESTIONS = [
+    "What is supervised learning?",
+    "Explain the difference between a process and a thread.",
+    "How does gradient descent find a minimum?",
+    "What are the main causes of inflation?",
+    "Summarise the key ideas of the second chapter.",
+    "Why does the cross-entropy loss work for classification?",
+    "What is the role of the mitochondria in a cell?",
+    "Give an example of a recursive algorithm and explain it.",
+]
+
+
+def payload(endpoint: str, i: int) -> dict:
+    if endpoint == "query":
+        return {"question": QUESTIONS[i % len(QUESTIONS)], "web_search": False, "diagram": False}
+    return {"num_questions": 5, "difficulty": "medium", "question_type": "mcq"}
+
+
+PATHS = {"query": "/api/query", "quiz": "/api/quiz/generate"}
+
+
+def make_sender():
+    """Returns send(path, body, token) -> status code."""
+    if BASE_URL:
+        def send(path, body, token):
+            req = urllib.request.Request(
+                BASE_URL + path,
+                data=json.dumps(body).encode("utf-8"),
+                headers={"Content-Type": "application/json", "Authorization": f"Bearer {token}"},
+                method="POST",
+            )
+            try:
+                with urllib.request.urlopen(req, timeout=300) as resp:
+                    resp.read()
+                    return resp.status
+            except urllib.error.HTTPError as e:
+                return e.code
+        return send, os.environ.get("BENCH_TOKEN", "")
+
+    from flask_jwt_extended import create_access_token
+    from app.backend.app import app
+
+    with app.app_context():
+        token = create_access_token(identity=str(USER_ID))
+
+    def send(path, body, token):
+        # One test client per call: clients keep per-instance state
+        resp = app.test_client().post(path, json=body, headers={"Authorization": f"Bearer {token}"})
+        return resp.status_code
+
+    return send, token
+
+
+def run(send, token, endpoint: str, concurrency: int) -> dict:
+    path = PATHS[endpoint]
+
+    def one(i):
+        t0 = time.perf_counter()
+        status = send(path, payload(endpoint, i), token)
+        return time.perf_counter() - t0, status
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(REQUESTS)))
+    wall = time.perf_counter() - t_start
+
+    latencies = sorted(lat for lat, _ in results)
+    errors = sum(1 for _, status in results if status != 200)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": REQUESTS,
+        "errors": errors,
+        "rps": REQUESTS / wall,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+    }
+
+
+def main():
+    from app.backend.config import Config
+
+    send, token = make_sender()
+    print(
+        f"fake LLM: {Config.LLM_FAKE_LATENCY_MS:.0f} ms to first token, "
+        f"{Config.LLM_FAKE_TOKENS_PER_S:.0f} tokens/s, {Config.LLM_FAKE_ANSWER_TOKENS} answer tokens"
+    )
+    print(f"{'endpoint':>8}  {'conc':>4}  {'req/s':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'errors':>6}")
+    results = []
+    for endpoint in ENDPOINTS:
+        send(PATHS[endpoint], payload(endpoint, 0), token)  # first request pays lazy init
+        for concurrency in CONCURRENCY:
+            r = run(send, token, endpoint, concurrency)
+            results.append(r)
+            print(
+                f"{endpoint:>8}  {concurrency:>4}  {r['rps']:>7.2f}  {r['p50_ms']:>8.0f}  "
+                f"{r['p95_ms']:>8.0f}  {r['errors']:>6}"
+            )
+    if os.getenv("BENCH_JSON"):
+        with open(os.environ["BENCH_JSON"], "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
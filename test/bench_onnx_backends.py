@@ -0,0 +1,152 @@
+"""
+Inference backend benchmark: FP32 PyTorch vs dynamic INT8 ONNX Runtime on CPU
+
+For the embedder, the cross-encoder reranker and the intent classifier:
+- accuracy: INT8 outputs against the FP32 PyTorch outputs the app uses today
+  (embedding cosine, reranker Spearman / top-1 agreement, intent probability drift)
+- latency : single-request p50 / p95 (ms)
+- throughput: items/second on batches of BENCH_BATCH
+
+The ONNX models are exported on first run into Config.ONNX_MODEL_DIR (same
+files the app loads with INFERENCE_BACKEND=onnx). Exits non-zero when any
+model fails its accuracy threshold.
+
+Usage (no database needed):
+    python test/bench_onnx_backends.py
+    BENCH_MODELS=reranker BENCH_RUNS=100 python test/bench_onnx_backends.py
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("EMBEDDING_CACHE_PERSIST", "0")
+os.environ["INFERENCE_BACKEND"] = "torch"            # reference side
+os.environ["ONNX_FALLBACK_ON_ACCURACY_FAIL"] = "0"   # always measure the INT8 model
+
+import numpy as np
+
+from app.backend.config import Config
+from app.backend.services import onnx_backend
+
+MODELS = [m.strip() for m in os.getenv("BENCH_MODELS", "embedding,reranker,intent").split(",") if m.strip()]
+RUNS = int(os.getenv("BENCH_RUNS", "50"))
+BATCH = int(os.getenv("BENCH_BATCH", "64"))
+
+EXTRA_TEXTS = [
+    "Can you summarize chapter three of my lecture notes?",
+    "What are the assumptions of linear regression?",
+    "Compare TCP and UDP with a table",
+    "請用中文解釋傅立葉變換",
+    "Find recent news about the central bank interest rate decision",
+    "Plot y = x^2 - 3x + 2 and mark the roots",
+    "Why does the Krebs cycle need oxygen indirectly?",
+    "什么是边际成本？举一个例子",
+]
+TEXTS = onnx_backend.ACCURACY_QUERIES + EXTRA_TEXTS
+PASSAGES = onnx_backend.ACCURACY_PASSAGES + EXTRA_TEXTS[:4]
+
+
+def timed(fn, items, runs):
+    """p50/p95 latency of fn on single items, and throughput on full batches."""
+    fn(items[:2])  # warm-up
+    latencies = []
+    for i in range(runs):
+        t0 = time.perf_counter()
+        fn([items[i % len(items)]])
+        latencies.append((time.perf_counter() - t0) * 1000)
+    batch = [items[i % len(items)] for i in range(BATCH)]
+    t0 = time.perf_counter()
+    rounds = max(1, runs // 10)
+    for _ in range(rounds):
+        fn(batch)
+    throughput = rounds * BATCH / (time.perf_counter() - t0)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95), throughput
+
+
+def bench_embedding():
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    from app.backend.services.injestion import embedding_batch_size
+
+    fp32 = HuggingFaceEmbeddings(
+        model_name=Config.EMBEDDING_MODEL,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"normalize_embeddings": True, "batch_size": embedding_batch_size()},
+    )
+    int8 = onnx_backend.OnnxEmbeddings(
+        onnx_backend.load_onnx_model(Config.EMBEDDING_MODEL, "embedding"),
+        Config.EMBEDDING_MODEL,
+        batch_size=embedding_batch_size(),
+    )
+    items = TEXTS + PASSAGES
+    accuracy = onnx_backend.compare_outputs(
+        "embedding", np.array(fp32.embed_documents(items)), np.array(int8.embed_documents(items))
+    )
+    return accuracy, fp32.embed_documents, int8.embed_documents, items
+
+
+def bench_reranker():
+    from sentence_transformers import CrossEncoder
+
+    fp32 = CrossEncoder(Config.RERANK_MODEL)
+    int8 = onnx_backend.OnnxCrossEncoder(
+        onnx_backend.load_onnx_model(Config.RERANK_MODEL, "cross-encoder"), Config.RERANK_MODEL
+    )
+    pairs = [(q, p) for q in TEXTS for p in PASSAGES]
+    ref = np.asarray(fp32.predict(pairs, show_progress_bar=False))
+    new = int8.predict(pairs)
+    accuracy = onnx_backend.compare_outputs("cross-encoder", ref, new)
+    # Does INT8 pick the same best passage per query?
+    n_p = len(PASSAGES)
+    top1 = [ref[i:i + n_p].argmax() == new[i:i + n_p].argmax() for i in range(0, len(pairs), n_p)]
+    accuracy["top1_agreement"] = round(float(np.mean(top1)), 3)
+
+    def run_fp32(batch):
+        return fp32.predict(batch, batch_size=max(len(batch), 1), show_progress_bar=False)
+
+    def run_int8(batch):
+        return int8.predict(batch, batch_size=max(len(batch), 1))
+
+    return accuracy, run_fp32, run_int8, pairs
+
+
+def bench_intent():
+    from app.backend.services import intent_classifier
+
+    intent_classifier._ensure_loaded()  # INTENT_BACKEND=torch: FP32 reference
+    labels = [intent_classifier._id2label[i] for i in sorted(intent_classifier._id2label)]
+    int8 = onnx_backend.load_onnx_model(Config.INTENT_MODEL_NAME, "classifier", tokenizer=intent_classifier._tokenizer)
+
+    def run_fp32(batch):
+        return [[row[label] for label in labels] for row in intent_classifier._infer_label_scores_batch(batch)]
+
+    accuracy = onnx_backend.compare_outputs("classifier", np.array(run_fp32(TEXTS)), int8.run(TEXTS))
+    return accuracy, run_fp32, int8.run, TEXTS
+
+
+BENCHES = {"embedding": bench_embedding, "reranker": bench_reranker, "intent": bench_intent}
+
+
+def main():
+    failed = []
+    print(f"{'model':>10}  {'backend':>8}  {'p50 ms':>8}  {'p95 ms':>8}  {'items/s':>9}")
+    for name in MODELS:
+        accuracy, run_fp32, run_int8, items = BENCHES[name]()
+        for backend, fn in (("fp32", run_fp32), ("int8", run_int8)):
+            p50, p95, throughput = timed(fn, items, RUNS)
+            print(f"{name:>10}  {backend:>8}  {p50:>8.1f}  {p95:>8.1f}  {throughput:>9.0f}")
+        print(f"{'':>10}  accuracy: {accuracy}")
+        if not accuracy["passed"]:
+            failed.append(name)
+    if failed:
+        print(f"Accuracy check FAILED for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
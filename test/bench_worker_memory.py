@@ -0,0 +1,147 @@
+"""
+Memory per gunicorn worker: per-worker model loading vs preloaded copy-on-write sharing
+
+Starts gunicorn (gunicorn.conf.py) with GUNICORN_PRELOAD=0 and =1, waits until
+/api/ready answers and every process' RSS has settled, then reads
+/proc/<pid>/smaps_rollup for the master and each worker:
+- rss     : resident pages, counting shared pages in full in every process
+- pss     : proportional set size, shared pages divided among their sharers;
+            summed over all processes this is the node memory actually used
+- private : pages only this process maps (its real marginal cost)
+
+The last column is the total PSS of master + workers. With preloading, per-worker
+private memory should drop to roughly the Python heap plus activations, and the
+total should grow far slower with the worker count.
+
+Usage (Linux only; database from .env / docker-compose must be reachable):
+    python test/bench_worker_memory.py                   # 1, 2, 4 workers
+    BENCH_WORKERS=2,8 python test/bench_worker_memory.py
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+WORKER_COUNTS = [int(x) for x in os.getenv("BENCH_WORKERS", "1,2,4").split(",") if x.strip()]
+PORT = int(os.getenv("BENCH_PORT", "5099"))
+READY_TIMEOUT_S = float(os.getenv("BENCH_READY_TIMEOUT_S", "900"))
+
+
+def smaps_rollup(pid: int) -> dict:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1]) * 1024
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def children_of(pid: int) -> list:
+    kids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            kids.append(int(entry))
+    return kids
+
+
+def wait_ready(master: int, workers: int) -> list:
+    deadline = time.time() + READY_TIMEOUT_S
+    url = f"http://127.0.0.1:{PORT}/api/ready"
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=3) as resp:
+                if resp.status == 200 and len(children_of(master)) == workers:
+                    break
+        except Exception:
+            pass
+        time.sleep(2)
+    else:
+        raise TimeoutError("server did not become ready")
+
+    # Without preloading every worker warms up on its own; wait until no RSS moves
+    previous = None
+    stable = 0
+    while time.time() < deadline and stable < 3:
+        pids = sorted(children_of(master))
+        current = [smaps_rollup(p)["rss"] for p in pids]
+        if previous is not None and len(current) == len(previous) and all(
+            abs(c - p) <= 0.01 * p for c, p in zip(current, previous)
+        ):
+            stable += 1
+        else:
+            stable = 0
+        previous = current
+        time.sleep(3)
+    return sorted(children_of(master))
+
+
+def measure(workers: int, preload: bool) -> dict:
+    env = dict(
+        os.environ,
+        GUNICORN_PRELOAD="1" if preload else "0",
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_BIND=f"127.0.0.1:{PORT}",
+        INGESTION_WORKERS_ENABLED="0",
+        PYTHONPATH=str(ROOT),
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", str(ROOT / "gunicorn.conf.py"), "app.backend.app:app"],
+        cwd=str(ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        worker_pids = wait_ready(proc.pid, workers)
+        master = smaps_rollup(proc.pid)
+        per_worker = [smaps_rollup(p) for p in worker_pids]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=60)
+    n = len(per_worker)
+    return {
+        "workers": n,
+        "preload": preload,
+        "master_rss": master["rss"],
+        "worker_rss": sum(w["rss"] for w in per_worker) / n,
+        "worker_pss": sum(w["pss"] for w in per_worker) / n,
+        "worker_private": sum(w["private"] for w in per_worker) / n,
+        "total_pss": master["pss"] + sum(w["pss"] for w in per_worker),
+    }
+
+
+def main():
+    mb = 2 ** 20
+    print(f"{'workers':>7}  {'mode':>8}  {'w_rss':>8}  {'w_pss':>8}  {'w_priv':>8}  {'total_pss':>10}")
+    results = []
+    for workers in WORKER_COUNTS:
+        for preload in (False, True):
+            r = measure(workers, preload)
+            results.append(r)
+            print(
+                f"{r['workers']:>7}  {'preload' if preload else 'per-wkr':>8}  "
+                f"{r['worker_rss'] / mb:>6.0f}MB  {r['worker_pss'] / mb:>6.0f}MB  "
+                f"{r['worker_private'] / mb:>6.0f}MB  {r['total_pss'] / mb:>8.0f}MB"
+            )
+    if os.getenv("BENCH_JSON"):
+        with open(os.environ["BENCH_JSON"], "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+IngestionEmbeddingCache: chunks packed from several units reuse the pooled unit
+vectors after cleaning has rewritten their text. Encoder throughput (used by
+plan_chunking) only counts texts the model actually encoded.
+
+    python -m pytest test/test_ingestion_embedding_cache.py
+"""
+import hashlib
+
+import numpy as np
+from langchain_core.documents import Document as LCDocument
+
+from app.backend.config import Config
+from app.backend.services import injestion
+from app.backend.services.embedding_cache import CachedEmbeddings
+
+UNITS = [
+    "Gradient descent updates the parameters in the direction of the negative gradient of the loss.",
+    "The learning rate controls the step size; too large a value makes the optimisation diverge.",
+]
+
+
+class _CountingEncoder:
+    """Deterministic unit vectors; records every batch sent to the encoder."""
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        out = []
+        for t in texts:
+            seed = int.from_bytes(hashlib.sha1(t.encode("utf-8")).digest()[:4], "little")
+            vec = np.random.default_rng(seed).standard_normal(Config.EMBEDDING_DIMENSION)
+            out.append((vec / np.linalg.norm(vec)).tolist())
+        return out
+
+
+def _packed_chunk(cache):
+    doc = LCDocument(page_content="\n\n".join(UNITS), metadata={"page": 1})
+    chunks = injestion._pack_units_into_chunks(
+        doc,
+        UNITS,
+        np.ones(len(UNITS) - 1, dtype=np.float32),  # no topic shift: one chunk
+        max_chunk_chars=1400,
+        min_chunk_chars=50,
+        similarity_threshold=0.5,
+        embedding_cache=cache,
+    )
+    assert len(chunks) == 1
+    return chunks
+
+
+def test_multi_unit_chunk_uses_pooled_vector_after_cleaning(monkeypatch):
+    encoder = _CountingEncoder()
+    monkeypatch.setattr(injestion, "get_embeddings", lambda: encoder)
+    cache = injestion.IngestionEmbeddingCache(pool_multi_unit_chunks=True)
+
+    cache.embed(UNITS)  # as semantic chunking does
+    chunks = _packed_chunk(cache)
+    raw_text = chunks[0].page_content
+
+    chunks = injestion.filter_clean_chunks(chunks, embedding_cache=cache)
+    assert chunks[0].page_content != raw_text  # cleaning drops the blank line between units
+
+    encoder.batches.clear()
+    vectors = injestion.embed_texts([chunks[0].page_content], embedding_cache=cache)
+
+    assert cache.pooled == 1
+    assert encoder.batches == []
+    assert abs(float(np.linalg.norm(vectors[0])) - 1.0) < 1e-5
+
+
+def test_multi_unit_chunk_is_encoded_without_pooling(monkeypatch):
+    encoder = _CountingEncoder()
+    monkeypatch.setattr(injestion, "get_embeddings", lambda: encoder)
+    cache = injestion.IngestionEmbeddingCache(pool_multi_unit_chunks=False)
+
+    cache.embed(UNITS)
+    chunks = injestion.filter_clean_chunks(_packed_chunk(cache), embedding_cache=cache)
+    encoder.batches.clear()
+    injestion.embed_texts([chunks[0].page_content], embedding_cache=cache)
+
+    assert cache.pooled == 0
+    assert encoder.batches == [[chunks[0].page_content]]
+
+
+def test_throughput_ignores_cache_hits():
+    recorded = []
+    cached = CachedEmbeddings(
+        base=_CountingEncoder(), model_name="test", lru_size=256, persist=False,
+        on_encode=lambda n, seconds: recorded.append(n),
+    )
+    texts = [f"unit {i} about gradient descent" for i in range(32)]
+
+    cached.embed_documents(texts)
+    cached.embed_documents(texts)  # all LRU hits: no encoder call, nothing recorded
+    cached.embed_documents(texts[:8] + ["a new unit"])
+
+    assert recorded == [32, 1]